@@ -0,0 +1,66 @@
+/* Code that should be loaded in arduino in order to acquire data from a specific port (analogInputPort) and
+ send data from another one (digitalOutputPort), using PYDAQ binary protocol (protocol='binary').
+
+ Each reading is sent as a 5-byte frame:
+   sync byte (0xA5) | sequence counter (0-255) | sample (low byte) | sample (high byte) | checksum
+ where checksum = (sequence counter + low byte + high byte) modulo 256.
+
+ Author:    Samir Angelo Milani Martins
+             - https://www.samirmartins.com.br
+             - https://www.github.com/samirmartins/
+
+ */
+
+int analogInputPort = A0; // Port that will be used to acquire data
+const int digitallOutputPort = 13; // Port that will be used to send data
+
+const byte sync = 0xA5; // First byte of every frame
+
+int inputValue; // A variable to store data that will be sent to digitalOutputPort
+unsigned int analogValue; // A variable to store data from analogInputPort
+byte sequence = 0; // Frame counter, used to detect lost frames
+byte frame[5]; // Frame that will be sent
+
+void setup()
+{
+  // Initializing serial communication (must match baudrate defined in PYDAQ):
+  Serial.begin(115200);
+
+  // Setting up digitalOutputPort
+  pinMode(digitallOutputPort, OUTPUT);
+
+}
+
+void loop()
+{
+
+  // Reading data from serial and sending it to digital output
+  if (Serial.available() > 0) // Check if there is data from serial
+  {
+    // Read the oldest byte in the serial buffer:
+    inputValue = Serial.read();
+    // if it's a '1', send HIGH to the output
+    if (inputValue == '1')
+    {
+      digitalWrite(digitallOutputPort, HIGH);
+    }
+    // if it's an '0' turn off the output:
+    if (inputValue == '0')
+    {
+      digitalWrite(digitallOutputPort, LOW);
+    }
+  }
+
+  // Reading data from arduino and sending a frame on serial
+  analogValue = analogRead(analogInputPort); // Reading input
+
+  frame[0] = sync;
+  frame[1] = sequence;
+  frame[2] = lowByte(analogValue);
+  frame[3] = highByte(analogValue);
+  frame[4] = (byte)(frame[1] + frame[2] + frame[3]);
+
+  Serial.write(frame, 5); // Sending frame
+  sequence++;
+
+}
@@ -0,0 +1,234 @@
+/* Code that should be loaded in arduino in order to acquire data from a specific port (analogInputPort) at a
+ fixed rate, defined by a hardware timer interrupt (Timer1, AVR boards such as Arduino Uno/Nano/Mega), and
+ send data from another one (digitalOutputPort). Used by PYDAQ with protocol='timed'.
+
+ Commands (sent by PYDAQ):
+   'R<period in microseconds>\n': starts sampling with the given sample period. Example: "R1000\n" (1 kHz)
+   'S': stops sampling
+   'B<samples>,<ADC prescaler>\n': burst capture. Stops sampling, captures samples into SRAM at maximum
+                                   ADC rate (prescaler 2 to 128, 0: default) and uploads them at once
+   '1' / '0': digitalOutputPort HIGH / LOW
+
+ Each sample is sent as a 9-byte frame:
+   sync byte (0xA6) | sequence counter (0-255) | sample (2 bytes) | micros() timestamp (4 bytes) | checksum
+ multi-byte values are little-endian and checksum = sum of bytes 1 to 7, modulo 256.
+
+ A burst is sent as one block:
+   sync byte (0xA7) | number of samples (2 bytes) | duration in microseconds (4 bytes) | samples (2 bytes each) | checksum
+ where checksum = sum of all bytes but the first (sync) and the last one, modulo 256.
+
+ Author:    Samir Angelo Milani Martins
+             - https://www.samirmartins.com.br
+             - https://www.github.com/samirmartins/
+
+ */
+
+int analogInputPort = A0; // Port that will be used to acquire data
+const int digitallOutputPort = 13; // Port that will be used to send data
+
+const byte sync = 0xA6; // First byte of every frame
+
+// Samples taken by the interrupt, waiting to be sent (ring buffer)
+const byte bufferSize = 32;
+volatile unsigned int samples[bufferSize];
+volatile unsigned long timestamps[bufferSize];
+volatile byte sequences[bufferSize];
+volatile byte head = 0; // Next position written by the interrupt
+volatile byte tail = 0; // Next position sent by loop()
+
+volatile byte sequence = 0; // Sample counter, used to detect lost samples (e.g. full ring buffer)
+byte frame[9]; // Frame that will be sent
+// Samples captured in a burst (limited by SRAM: 2 kB in Arduino Uno)
+const unsigned int burstCapacity = 500;
+unsigned int burst[burstCapacity];
+
+String command = ""; // Command (with arguments) being received
+char receiving = 0; // Command being received ('R' or 'B'), or 0
+
+ISR(TIMER1_COMPA_vect)
+{
+  // Sampling at a fixed rate, with the board timestamp. Each sample is sent as a 9-byte frame (about
+  // 0.78 ms at 115200 baud), so shorter periods fill the ring buffer and samples are lost
+  timestamps[head] = micros();
+  samples[head] = analogRead(analogInputPort);
+  sequences[head] = sequence++;
+  byte next = (head + 1) % bufferSize;
+  if (next != tail) // If the ring buffer is full, the sample is lost (and detected by PYDAQ)
+  {
+    head = next;
+  }
+}
+
+void stopSampling()
+{
+  TIMSK1 &= ~_BV(OCIE1A);
+}
+
+void startSampling(unsigned long period)
+{
+  // Timer1 in CTC mode, with the smallest prescaler that fits period (16 MHz clock)
+  const unsigned int prescalers[] = {1, 8, 64, 256, 1024};
+  const byte bits[] = {_BV(CS10), _BV(CS11), _BV(CS11) | _BV(CS10), _BV(CS12), _BV(CS12) | _BV(CS10)};
+  byte k = 0;
+  while (k < 4 && (period * (F_CPU / 1000000UL)) / prescalers[k] > 65536UL)
+  {
+    k++;
+  }
+
+  // Periods longer than 65536 * 1024 clock cycles (about 4.19 s) do not fit Timer1: sampling is not started
+  // (PYDAQ checks the period before sending it)
+  if (period > 0xFFFFFFFFUL / (F_CPU / 1000000UL) || (period * (F_CPU / 1000000UL)) / prescalers[k] > 65536UL)
+  {
+    stopSampling();
+    return;
+  }
+
+  noInterrupts();
+  TCCR1A = 0;
+  TCCR1B = _BV(WGM12) | bits[k];
+  TCNT1 = 0;
+  OCR1A = (period * (F_CPU / 1000000UL)) / prescalers[k] - 1;
+  head = 0;
+  tail = 0;
+  sequence = 0;
+  TIMSK1 |= _BV(OCIE1A);
+  interrupts();
+}
+
+void captureBurst(unsigned int count, byte prescaler)
+{
+  stopSampling();
+  if (count > burstCapacity)
+  {
+    count = burstCapacity;
+  }
+
+  // Reducing ADC prescaler (ADCSRA bits ADPS2:0 = log2(prescaler)), for faster conversions
+  byte defaultPrescaler = ADCSRA & 0x07;
+  if (prescaler >= 2)
+  {
+    byte bits = 0;
+    while ((1 << bits) < prescaler && bits < 7)
+    {
+      bits++;
+    }
+    ADCSRA = (ADCSRA & ~0x07) | bits;
+  }
+
+  // Capturing samples as fast as possible
+  unsigned long start = micros();
+  for (unsigned int k = 0; k < count; k++)
+  {
+    burst[k] = analogRead(analogInputPort);
+  }
+  unsigned long duration = micros() - start;
+  ADCSRA = (ADCSRA & ~0x07) | defaultPrescaler;
+
+  // Duration from first to last sample (count samples take count conversions)
+  if (count > 1)
+  {
+    duration = duration - duration / count;
+  }
+
+  // Uploading header, samples and checksum
+  byte header[7] = {0xA7, lowByte(count), highByte(count),
+                    (byte)(duration & 0xFF), (byte)((duration >> 8) & 0xFF),
+                    (byte)((duration >> 16) & 0xFF), (byte)((duration >> 24) & 0xFF)};
+  byte checksum = 0;
+  for (byte k = 1; k < 7; k++)
+  {
+    checksum += header[k];
+  }
+  Serial.write(header, 7);
+  for (unsigned int k = 0; k < count; k++)
+  {
+    checksum += lowByte(burst[k]) + highByte(burst[k]);
+  }
+  Serial.write((byte *)burst, 2 * count); // AVR is little-endian
+  Serial.write(checksum);
+}
+
+void setup()
+{
+  // Initializing serial communication (must match baudrate defined in PYDAQ):
+  Serial.begin(115200);
+
+  // Setting up digitalOutputPort
+  pinMode(digitallOutputPort, OUTPUT);
+
+}
+
+void loop()
+{
+
+  // Reading commands from serial
+  while (Serial.available() > 0) // Check if there is data from serial
+  {
+    // Read the oldest byte in the serial buffer:
+    char inputValue = Serial.read();
+
+    if (receiving != 0)
+    {
+      if (inputValue == '\n')
+      {
+        if (receiving == 'R')
+        {
+          startSampling(command.toInt());
+        }
+        else
+        {
+          int comma = command.indexOf(',');
+          captureBurst(command.substring(0, comma).toInt(), command.substring(comma + 1).toInt());
+        }
+        receiving = 0;
+      }
+      else
+      {
+        command += inputValue;
+      }
+    }
+    else if (inputValue == 'R' || inputValue == 'B')
+    {
+      receiving = inputValue;
+      command = "";
+    }
+    else if (inputValue == 'S')
+    {
+      stopSampling();
+    }
+    // if it's a '1', send HIGH to the output
+    else if (inputValue == '1')
+    {
+      digitalWrite(digitallOutputPort, HIGH);
+    }
+    // if it's an '0' turn off the output:
+    else if (inputValue == '0')
+    {
+      digitalWrite(digitallOutputPort, LOW);
+    }
+  }
+
+  // Sending samples taken by the interrupt
+  while (tail != head)
+  {
+    noInterrupts();
+    unsigned int analogValue = samples[tail];
+    unsigned long timestamp = timestamps[tail];
+    byte counter = sequences[tail];
+    interrupts();
+
+    frame[0] = sync;
+    frame[1] = counter;
+    frame[2] = lowByte(analogValue);
+    frame[3] = highByte(analogValue);
+    frame[4] = timestamp & 0xFF;
+    frame[5] = (timestamp >> 8) & 0xFF;
+    frame[6] = (timestamp >> 16) & 0xFF;
+    frame[7] = (timestamp >> 24) & 0xFF;
+    frame[8] = (byte)(frame[1] + frame[2] + frame[3] + frame[4] + frame[5] + frame[6] + frame[7]);
+
+    Serial.write(frame, 9); // Sending frame
+    tail = (tail + 1) % bufferSize;
+  }
+
+}
@@ -0,0 +1,198 @@
+# Performance benchmarks of PYDAQ, run against simulated devices (pydaq/utils/simulation.py), so no hardware
+# is needed. They require pytest-benchmark (pip install pydaq[benchmark]) and are not collected with the tests:
+#
+#   python -m pytest pydaq/benchmarks/benchmarks_pydaq.py --benchmark-json=results.json
+#
+# Besides timings, each benchmark records its figure of merit (e.g. max_sample_rate, samples_per_second) in
+# extra_info, saved in the JSON results (see docs/benchmarks.md).
+
+from pydaq.send_data import Send_data
+from pydaq.get_data import Get_data
+from pydaq.step_response import Step_response
+from pydaq.utils.base import Base
+from pydaq.utils.simulation import Simulated_nidaq, Virtual_arduino
+from pydaq.utils.writer import new_writer
+from pydaq.utils.serial_protocol import encode_frames, encode_timed_frames, Frame_decoder, Timed_frame_decoder, \
+    Line_decoder
+import pytest
+import matplotlib
+import matplotlib.pyplot as plt
+import os
+import sys
+import subprocess
+import numpy as np
+
+pytest.importorskip('pytest_benchmark')
+
+pytestmark = pytest.mark.filterwarnings('ignore')
+
+# Sample period below the loop overhead: loops run as fast as they can (deadlines are missed on purpose)
+TS = 1e-6
+
+# Iterations of each acquisition/sending loop
+CYCLES = 1000
+CYCLES_ARDUINO = 200
+
+arduino = pytest.mark.skipif(os.name == 'nt', reason='Virtual Arduino requires pseudo-terminals')
+
+
+def max_sample_rate(obj):
+    """ Maximum sustainable sample rate (iterations per second) of the last loop run by obj """
+
+    time_measured = np.asarray(obj.time_measured)
+
+    return (len(time_measured) - 1) / (time_measured[-1] - time_measured[0])
+
+
+def record_rate(benchmark, name, count):
+    """ Recording count per second (count / mean time) in extra_info. Timings are not available with
+        --benchmark-disable, so nothing is recorded """
+
+    if benchmark.stats:
+        benchmark.extra_info[name] = count / benchmark.stats.stats.mean
+
+
+def run_loop(benchmark, obj, method, rounds=3):
+    """ Benchmarking method (a loop of obj) and recording its maximum sustainable sample rate """
+
+    obj.plot, obj.save = False, False
+    benchmark.pedantic(method, rounds=rounds, iterations=1)
+    benchmark.extra_info['max_sample_rate'] = max_sample_rate(obj)
+
+
+# Maximum sustainable sample rate of acquisition/sending loops
+def test_get_data_nidaq(benchmark):
+
+    g = Get_data(channel='ai0', ts=TS, session_duration=(CYCLES - 1) * TS)
+    g.nidaq_backend = Simulated_nidaq()
+    run_loop(benchmark, g, g.get_data_nidaq)
+
+def test_get_data_nidaq_channels(benchmark):
+
+    g = Get_data(channel='ai0:7', ts=TS, session_duration=(CYCLES - 1) * TS)
+    g.nidaq_backend = Simulated_nidaq()
+    run_loop(benchmark, g, g.get_data_nidaq)
+
+def test_send_data_nidaq(benchmark):
+
+    s = Send_data(data=np.linspace(0, 5, CYCLES), ts=TS)
+    s.nidaq_backend = Simulated_nidaq()
+    run_loop(benchmark, s, s.send_data_nidaq)
+
+def test_step_response_nidaq(benchmark):
+
+    st = Step_response(ts=TS, session_duration=(CYCLES - 1) * TS, step_time=CYCLES * TS / 2)
+    st.nidaq_backend = Simulated_nidaq()
+    run_loop(benchmark, st, st.step_response_nidaq)
+
+@arduino
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_get_data_arduino(benchmark, protocol):
+
+    with Virtual_arduino(protocol, rate=100000.0) as board:
+        g = Get_data(com=board.port, ts=TS, session_duration=(CYCLES_ARDUINO - 1) * TS, protocol=protocol)
+        run_loop(benchmark, g, g.get_data_arduino, rounds=1)
+
+@arduino
+def test_send_data_arduino(benchmark):
+
+    with Virtual_arduino('ascii') as board:
+        s = Send_data(data=np.arange(CYCLES_ARDUINO) % 2, com=board.port, ts=TS, ao_max=1)
+        run_loop(benchmark, s, s.send_data_arduino, rounds=1)
+
+@arduino
+def test_step_response_arduino(benchmark):
+
+    with Virtual_arduino('ascii', rate=100000.0, loopback=True) as board:
+        st = Step_response(com=board.port, ts=TS, session_duration=(CYCLES_ARDUINO - 1) * TS,
+                           step_time=CYCLES_ARDUINO * TS / 2)
+        run_loop(benchmark, st, st.step_response_arduino, rounds=1)
+
+
+# Cost of one plot update versus history length
+@pytest.mark.parametrize('history', [1000, 10000, 100000, 1000000])
+def test_update_plot(benchmark, history):
+
+    matplotlib.use('Agg')
+    base = Base()
+    base.fig, base.ax = plt.subplots()
+    base.line, base.lines, base.legend, base._background = base.ax.plot([], []), [], [], None
+    base.fig.canvas.mpl_connect('draw_event', base._on_draw)
+
+    x = np.arange(history) * 0.001
+    y = np.sin(x)
+    base._update_plot(x, y)  # First (full) redraw
+
+    benchmark(base._update_plot, x, y)
+    benchmark.extra_info['history'] = history
+    plt.close(base.fig)
+
+
+# Persistence throughput of session writers (data streamed to disk in blocks, as by hardware-timed loops)
+@pytest.mark.parametrize('channels', [1, 8])
+@pytest.mark.parametrize('save_format', ['dat', 'raw', 'npy', 'hdf5'])
+def test_writer(benchmark, tmp_path, save_format, channels):
+
+    if save_format == 'hdf5':
+        pytest.importorskip('h5py')
+
+    data = np.random.default_rng(0).normal(size=(channels, 100000))
+    data = data[0] if channels == 1 else data
+    time_var = np.arange(100000) * 0.001
+
+    def write():
+        writer = new_writer(save_format, str(tmp_path), metadata={'ts': 0.001}).open()
+        for k in range(0, 100000, 1000):
+            writer.write_block('time', time_var[k:k + 1000])
+            writer.write_block('data', data[..., k:k + 1000])
+        writer.close()
+
+    benchmark.pedantic(write, rounds=3, iterations=1)
+    record_rate(benchmark, 'samples_per_second', data.size)
+    record_rate(benchmark, 'megabytes_per_second', (data.nbytes + time_var.nbytes) / 1e6)
+
+# Legacy whole-array text saving (Base._save_data)
+@pytest.mark.parametrize('channels', [1, 8])
+def test_save_data(benchmark, tmp_path, channels):
+
+    base = Base()
+    base.path = str(tmp_path)
+    data = np.random.default_rng(0).normal(size=(channels, 100000))
+    data = data[0] if channels == 1 else data
+
+    benchmark(base._save_data, data, 'data.dat')
+    record_rate(benchmark, 'samples_per_second', data.size)
+    record_rate(benchmark, 'megabytes_per_second', os.path.getsize(tmp_path / 'data.dat') / 1e6)
+
+
+# Serial parse throughput (one second of data at 115200 baud, decoded in 64-byte reads)
+@pytest.mark.parametrize('protocol', ['ascii', 'binary', 'timed'])
+def test_serial_parse(benchmark, protocol):
+
+    samples = np.random.default_rng(0).integers(0, 1024, 11520 // 5)
+    if protocol == 'ascii':
+        data, new_decoder = b''.join(b'%d\r\n' % s for s in samples), Line_decoder
+    elif protocol == 'binary':
+        data, new_decoder = encode_frames(samples), Frame_decoder
+    else:
+        data, new_decoder = encode_timed_frames(samples, np.arange(len(samples)) * 100), Timed_frame_decoder
+    reads = [data[k:k + 64] for k in range(0, len(data), 64)]
+
+    def parse():
+        decoder = new_decoder()
+        return sum(len(decoder.decode(read)) for read in reads)
+
+    assert benchmark(parse) == len(samples)
+    record_rate(benchmark, 'samples_per_second', len(samples))
+
+
+# Import time (fresh interpreter)
+def test_import_time(benchmark):
+
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = 'import pydaq.get_data, pydaq.send_data, pydaq.step_response'
+
+    def run():
+        subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
+
+    benchmark.pedantic(run, rounds=5, iterations=1)
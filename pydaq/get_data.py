@@ -1,15 +1,18 @@
 import os
-import sys
+import asyncio
+import threading
 import time
-import warnings
-import PySimpleGUI as sg
-import matplotlib.pyplot as plt
-import nidaqmx
-from nidaqmx.constants import TerminalConfiguration
 import numpy as np
-import serial
-import serial.tools.list_ports
 from pydaq.utils.base import Base
+from pydaq.utils.buffer import Data_buffer, Block_rebuffer
+from pydaq.utils.scheduler import Scheduler, jitter_summary
+from pydaq.utils.async_serial import Async_serial
+from pydaq.utils.lazy import lazy_import
+
+# GUI, plotting and hardware back ends are imported on first use
+sg = lazy_import('PySimpleGUI')
+nidaqmx = lazy_import('nidaqmx')
+constants = lazy_import('nidaqmx.constants')
 
 
 
@@ -23,7 +26,7 @@ class Get_data(Base):
 
         :param:
             device: nidaq device from where data will be colected. Example: "Dev1"
-            channel: channel from where data will be acquired. Example: ai0
+            channel: channel(s) from where data will be acquired. Example: "ai0", "ai0:7" (range), ["ai0", "ai3"] or "Dev1/ai0:7"
             terminal: 'Diff', 'RSE' or 'NRSE': terminal configuration (differential, referenced single ended or non-referenced single ended)
             com: arduino COM port. Example: 'COM1'
             ts: sample period, in seconds.
@@ -31,6 +34,13 @@ class Get_data(Base):
             save: if True, saves data in path defined by path.
             path: where data will be saved.
             plot: if True, plot data iteractively as they are acquired
+            save_format: 'dat' (text), 'raw' (binary float64 + JSON header), 'npy' or 'hdf5' (one file per session, requires h5py). Data are streamed to disk during acquisition
+            hardware_timed: if True, NIDAQ sampling is paced by the board sample clock and data are read in blocks
+            block_size: number of samples read per call when hardware_timed is True (default: ~0.1 s of data)
+            protocol: Arduino serial protocol. 'ascii' (pydaq/arduino_code sketch), 'binary' (framed samples,
+                      pydaq/arduino_binary sketch) or 'timed' (samples taken on a timer interrupt every ts, with
+                      board timestamps, pydaq/arduino_timed sketch)
+            baudrate: Arduino serial baud rate. If None, 9600 ('ascii') or 115200 ('binary' and 'timed')
 
     """
 
@@ -42,7 +52,12 @@ class Get_data(Base):
                  ts=0.5,
                  session_duration=10.0,
                  save=True,
-                 plot=True
+                 plot=True,
+                 save_format='dat',
+                 hardware_timed=False,
+                 block_size=None,
+                 protocol='ascii',
+                 baudrate=None
                  ):
 
         super().__init__()
@@ -52,23 +67,30 @@ class Get_data(Base):
         self.session_duration = session_duration
         self.save = save
         self.plot = plot
+        self.save_format = save_format
+        self.hardware_timed = hardware_timed
+        self.block_size = block_size
+        self.protocol = protocol
+        self.baudrate = baudrate
 
         # Terminal configuration
-        self.terminal = self.term_map[terminal]
+        self.terminal = terminal
 
         # Initializing variables
         self.data = []
         self.time_var = []
 
-        # Gathering nidaq info
-        self._nidaq_info()
+        # Measured time instants and timing (lateness) summary of the session
+        self.time_measured = []
+        self.jitter = None
+
+        # Number of channels read in each task call (defined when task is created)
+        self.number_of_channels = 1
 
         # Error flags
         self.error_path = False
 
-        # COM ports
-        self.com_ports = [
-            i.description for i in serial.tools.list_ports.comports()]
+        # COM ports (available ports are cached by the device registry, see com_ports)
         self.com_port = com  # Default COM port
 
         # Plot title
@@ -93,6 +115,19 @@ class Get_data(Base):
         self.ard_vpb = (self.ard_ai_max - self.ard_ai_min) / \
             (2**self.arduino_ai_bits)
 
+        # Streaming: callbacks (function, Block_rebuffer), thread started by start_stream and event used to stop it
+        self._callbacks = []
+        self._stream_thread = None
+        self._stream_error = None
+        self._stream_stop = threading.Event()
+
+        # Synchronized start (used by Orchestrator): digital start trigger of NIDAQ streams (e.g.
+        # '/Dev1/ai/StartTrigger'), object whose wait_start(self)/started(self) methods are called just
+        # before/after a stream starts, and host time (time.perf_counter) when it started
+        self.start_trigger = None
+        self.start_sync = None
+        self.start_time = None
+
     def get_data_nidaq(self):
         """
             This function can be used for data acquisition and step response experiments using Python + NIDAQ boards.
@@ -112,65 +147,255 @@ class Get_data(Base):
         self.cycles = int(np.floor(self.session_duration / self.ts)) + 1
 
         # Initializing device, with channel defined
-        task = nidaqmx.Task()
+        task = self._new_task()
         task.ai_channels.add_ai_voltage_chan(
-            self.device + '/' + self.channel,
+            self._physical_channels(),
             terminal_config=self.terminal)
 
+        # All channels are read together, in the same task call
+        self.number_of_channels = task.number_of_channels
+        if self.number_of_channels > 1:
+            self.legend = task.ai_channels.channel_names
+
         if self.plot:  # If plot, start updatable plot
-            self.title = f'PYDAQ - Data Acquisition. {self.device}, {self.channel}'
+            self.title = f'PYDAQ - Data Acquisition. {self._physical_channels()}'
             self._start_updatable_plot()
 
+        # Starting writer, that streams data to disk during the session (if saving)
+        self._start_writer()
+
         # Main loop, where data will be acquired
-        for k in range(self.cycles):
+        try:
+            if self.hardware_timed:  # Board sample clock paces the acquisition
+                self._run_loop(lambda: self._get_data_nidaq_buffered(task),
+                               lambda n: self._plot_channels(self.time_var[:n], self.data[:, :n]))
+
+                # Data are kept as channels x samples while plotted
+                if self.number_of_channels == 1:
+                    self.data = self.data[0]
+            else:
+                self._run_loop(lambda: self._get_data_nidaq_loop(task),
+                               lambda n: self._plot_channels(self.time_var[:n], np.asarray(self.data)[..., :n]))
+
+        finally:
+            # Closing task
+            task.close()
+
+            # Check if data will or not be saved, and finish saving accordingly
+            if self.save:
+                print('\nSaving data ...')
+                # Writing remaining data (data were streamed to disk during the session)
+                self._stop_writer()
+                print('\nData saved ...')
+
+        return
 
-            # Counting time to append data and update interface
-            st = time.time()
+    def _get_data_nidaq_loop(self, task):
+        """ Software-timed acquisition loop. One sample (per channel) is read in each
+            iteration, paced by self.scheduler"""
+
+        # Preallocating buffers (channels x samples, if more than one channel) and
+        # measured time instants (seconds from the first deadline)
+        channels = self.number_of_channels if self.number_of_channels > 1 else None
+        self.data = Data_buffer(self.cycles, channels)
+        self.time_var = Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
+
+        # Main loop, where data will be acquired
+        for k in range(self.cycles):
 
             # Acquire data
             temp = task.read()
+            self.time_measured[k] = self.scheduler.timestamp()
+            self.stats.mark('io')
 
-            # Queue data in a list
+            # Queue data in buffers
             self.data.append(temp)
             self.time_var.append(k * self.ts)
+            self.stats.mark('buffer')
 
-            if self.plot:
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('data', temp)
+            self.stats.mark('save')
 
-                # Checking if there is still an open figure. If not, stop the
-                # for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except BaseException:
-                    break
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-                # Updating data values
-                self._update_plot(self.time_var, self.data)
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
+
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
+
+        self.stats.stop()
+
+        # Warning if any deadline was missed
+        self._check_deadlines()
+
+        # Exposing acquired data as NumPy arrays
+        self.data, self.time_var = self.data.view(), self.time_var.view()
+
+    def _physical_channels(self):
+        """ Physical channel string used by nidaqmx (e.g. "Dev1/ai0" or "Dev1/ai0,Dev1/ai3").
+            self.channel can be a single channel, a range ("ai0:7") or a list of channels,
+            with or without the device name"""
+
+        channels = [self.channel] if isinstance(self.channel, str) else self.channel
+
+        return ','.join(
+            channel if '/' in channel else self.device + '/' + channel
+            for channel in channels)
+
+    def _plot_channels(self, time_var, data):
+        """ Plot arguments (x_value, y_value, number_of_inputs) with data from every
+            channel (data is channels x samples)"""
+
+        if self.number_of_channels > 1:
+            return [time_var] * self.number_of_channels, data, self.number_of_channels
+
+        return time_var, np.reshape(data, -1), 1
+
+    def _get_data_nidaq_buffered(self, task):
+        """ Hardware-timed acquisition. The board sample clock defines the sample
+            instants and data are read in blocks into preallocated NumPy arrays,
+            so time_var is exact and ts is no longer limited by Python loop overhead"""
+
+        # Configuring board sample clock (finite acquisition, self.cycles samples)
+        task.timing.cfg_samp_clk_timing(rate=1 / self.ts,
+                                        sample_mode=constants.AcquisitionType.FINITE,
+                                        samps_per_chan=self.cycles)
+
+        # Samples read per call (default: about 0.1 s of data)
+        if self.block_size is None:
+            block_size = max(1, int(np.ceil(0.1 / self.ts)))
+        else:
+            block_size = int(self.block_size)
+
+        # Preallocating arrays (channels x samples). Sample instants are defined
+        # by the board clock
+        self.data = np.zeros((self.number_of_channels, self.cycles))
+        self.time_var = np.arange(self.cycles) * self.ts
+        block = np.zeros((self.number_of_channels, block_size))
+
+        reader = self._ai_reader(task)
+        task.start()
+        self.stats.start(np.ceil(self.cycles / block_size))
+
+        # Main loop, where blocks of data will be acquired (one iteration per block)
+        k = 0
+        while k < self.cycles:
+
+            # Acquire a block of data from all channels (blocks until samples are available)
+            n = min(block_size, self.cycles - k)
+            if n != block.shape[1]:  # Last block (reader needs a contiguous array)
+                block = np.zeros((self.number_of_channels, n))
+            reader.read_many_sample(block, number_of_samples_per_channel=n,
+                                    timeout=n * self.ts + 10.0)
+            self.stats.mark('io')
+
+            self.data[:, k:k + n] = block
+            self.stats.mark('buffer')
+
+            # Streaming block to disk (if saving)
+            if self.writer is not None:
+                self.writer.write_block('time', self.time_var[k:k + n])
+                self.writer.write_block('time_measured', self.time_var[k:k + n])
+                self.writer.write_block('data', block if self.number_of_channels > 1 else block[0])
+            k += n
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the while loop
+            self._plot_count = k
+            if self._stop_event.is_set():
+                break
 
-            print(f'Iteration: {k} of {self.cycles-1}')
-                
-            # Getting end time
-            et = time.time()
+            self._progress.update(k, self.cycles)
+            self.stats.mark('print')
+            self.stats.next()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except BaseException:
-                warnings.warn(
-                    "Time spent to append data and update interface was greater than ts. "
-                    "You CANNOT trust time.dat")
+        self.stats.stop()
+        task.stop()
 
-        # Closing task
-        task.close()
+        # Keeping only acquired samples (figure may have been closed)
+        self.data = self.data[:, :k]
+        self.time_var = self.time_var[:k]
 
-        # Check if data will or not be saved, and save accordingly
-        if self.save:
-            print('\nSaving data ...')
-            # Saving time_var and data
-            self._save_data(self.time_var, 'time.dat')
-            self._save_data(self.data, 'data.dat')
-            print('\nData saved ...')
+        # Sample instants are defined by the board clock
+        self.time_measured = self.time_var.copy()
+        self.jitter = jitter_summary(self.time_var, self.time_measured)
 
-        return
+    def stream_nidaq(self, block_size=None):
+        """
+            Generator of blocks of data continuously acquired from NIDAQ boards (hardware-timed, sample period ts).
+            Acquisition runs, with constant memory, until the generator is closed or stop_stream() is called.
+            Blocks are also passed to registered callbacks and streamed to disk (if save).
+
+        :params:
+            block_size: number of samples per block (default: ~0.1 s of data)
+
+        :return:
+            (time, data) blocks. data is channels x samples (or samples, if there is only one channel)
+
+        :example:
+            for time_block, data_block in stream_nidaq():
+                ...  # Processing data as they arrive
+        """
+
+        # Samples read per call (default: about 0.1 s of data)
+        if block_size is None:
+            block_size = max(1, int(np.ceil(0.1 / self.ts)))
+        block_size = int(block_size)
+
+        task = self._new_task()
+        try:
+            task.ai_channels.add_ai_voltage_chan(
+                self._physical_channels(),
+                terminal_config=self.terminal)
+            self.number_of_channels = task.number_of_channels
+
+            # Continuous acquisition: board clock fills the device buffer, which is read in blocks
+            task.timing.cfg_samp_clk_timing(rate=1 / self.ts,
+                                            sample_mode=constants.AcquisitionType.CONTINUOUS,
+                                            samps_per_chan=10 * block_size)
+            reader = self._ai_reader(task)
+
+            # Starting on a (shared) digital trigger, if defined
+            if self.start_trigger is not None:
+                task.triggers.start_trigger.cfg_dig_edge_start_trig(self.start_trigger)
+
+            # Starting writer, that streams data to disk (if saving)
+            self._start_writer()
+            self._start_stream(task.start)
+
+            k = 0
+            while not self._stream_stop.is_set():
+
+                # New arrays for every block, as blocks may be kept by the caller
+                block = np.zeros((self.number_of_channels, block_size))
+                reader.read_many_sample(block, number_of_samples_per_channel=block_size,
+                                        timeout=block_size * self.ts + 10.0)
+                time_block = (k + np.arange(block_size)) * self.ts
+                k += block_size
+
+                data_block = block if self.number_of_channels > 1 else block[0]
+                self._publish(time_block, data_block)
+                yield time_block, data_block
+
+        finally:
+            task.close()
+            self._stop_writer()
+            self._stream_stop.clear()
 
     def get_data_nidaq_gui(self):
         """
@@ -315,68 +540,449 @@ class Get_data(Base):
         # Number of self.cycles necessary
         self.cycles = int(np.floor(self.session_duration / self.ts)) + 1
 
+        if self.protocol == 'timed':
+            self._check_arduino_period(self.ts)
+
         # Oppening ports
-        self._open_serial()
+        self._open_serial(reader=True)
 
-        if self.plot:  # If plot, start updatable plot
-            self.title = f'PYDAQ - Data Acquisition. Arduino, Port: {self.com_port}'
-            self._start_updatable_plot()
+        try:
+            if self.plot:  # If plot, start updatable plot
+                self.title = f'PYDAQ - Data Acquisition. Arduino, Port: {self.com_port}'
+                self._start_updatable_plot()
+
+            time.sleep(2)  # Wait for Arduino and Serial to start up
+
+            # Starting writer, that streams data to disk during the session (if saving)
+            self._start_writer()
+
+            # Main loop, where data will be acquired
+            if self.protocol == 'timed':  # Arduino timer interrupt paces the acquisition
+                self._set_arduino_rate(self.ts)
+                self._run_loop(self._get_data_arduino_timed,
+                               lambda n: (self.time_var[:n], self.data[:n], 1))
+            else:
+                self._run_loop(self._get_data_arduino_loop,
+                               lambda n: (self.time_var[:n], self.data[:n], 1))
+
+        finally:
+            # Closing port
+            self._close_serial()
+
+            # Check if data will or not be saved, and finish saving accordingly
+            if self.save:
+                print('\nSaving data ...')
+                # Writing remaining data (data were streamed to disk during the session)
+                self._stop_writer()
+                print('\nData saved ...')
 
+        return
 
-        time.sleep(2)  # Wait for Arduino and Serial to start up
+    def _get_data_arduino_loop(self):
+        """ Acquisition loop for Arduino boards, paced by self.scheduler"""
+
+        # Preallocating buffers and measured time instants (seconds from the first deadline)
+        self.data = Data_buffer(self.cycles)
+        self.time_var = Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
 
         # Main loop, where data will be acquired
         for k in range(self.cycles):
 
-            # Counting time to append data and update interface
-            st = time.time()
-
             # Acquire data
-            self.ser.reset_input_buffer()  # Reseting serial input buffer
-            # Get the last complete value
-            temp = int(self.ser.read(14).split()
-                       [-2].decode('UTF-8')) * self.ard_vpb
+            value, received = self._read_arduino()
+            temp = value * self.ard_vpb
+            self.time_measured[k] = self.scheduler.timestamp(received)
+            self.stats.mark('io')
 
-            # Queue data in a list
+            # Queue data in buffers
             self.data.append(temp)
             self.time_var.append(k * self.ts)
+            self.stats.mark('buffer')
 
-            if self.plot:
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('data', temp)
+            self.stats.mark('save')
 
-                # Checking if there is still an open figure. If not, stop the
-                # for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except BaseException:
-                    break
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-                # Updating data values
-                self._update_plot(self.time_var, self.data)
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
 
-            print(f'Iteration: {k} of {self.cycles-1}')
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
 
-            # Getting end time
-            et = time.time()
+        self.stats.stop()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except BaseException:
-                warnings.warn(
-                    "Time spent to append data and update interface was greater than ts. "
-                    "You CANNOT trust time.dat")
+        # Warning if any deadline was missed
+        self._check_deadlines()
+
+        # Exposing acquired data as NumPy arrays
+        self.data, self.time_var = self.data.view(), self.time_var.view()
 
-        # Closing port
-        self.ser.close()
+    def get_data_arduino_burst(self, samples=500, adc_prescaler=None):
+        """
+            This function can be used to capture fast transients using Python + Arduino. A burst of samples
+            is captured into the Arduino memory at maximum ADC rate and uploaded at once.
+            Requires pydaq/arduino_timed sketch (protocol='timed').
 
-        # Check if data will or not be saved, and save accordingly
+        :params:
+            samples: number of samples (up to 500, limited by Arduino Uno SRAM)
+            adc_prescaler: Arduino ADC clock prescaler (2, 4, 8, 16, 32, 64 or 128). Smaller values are
+                           faster, but less accurate. If None, Arduino default (128, about 9k samples/s)
+
+        :example:
+            get_data_arduino_burst(samples=500, adc_prescaler=16)
+        """
+
+        if self.protocol != 'timed':
+            raise ValueError("Burst capture requires pydaq/arduino_timed sketch. Please, use protocol='timed'")
+
+        # Check if path was defined
+        self._check_path()
+
+        # Oppening ports
+        self._open_serial()
+        time.sleep(2)  # Wait for Arduino and Serial to start up
+
+        # Capturing and uploading burst
+        try:
+            adc_values, duration = self._burst_arduino(samples, adc_prescaler)
+        finally:
+            self._close_serial()
+
+        # Evenly spaced samples, from first to last one
+        self.data = adc_values * self.ard_vpb
+        self.time_var = np.linspace(0, duration, len(self.data))
+        self.time_measured = self.time_var.copy()
+        self.jitter = None
+        self.cycles = len(self.data)
+
+        print(f'{len(self.data)} samples captured in {duration * 1e3:.3f} ms')
+
+        if self.plot:
+            self.title = f'PYDAQ - Burst Capture. Arduino, Port: {self.com_port}'
+            self._start_updatable_plot()
+            self._update_plot(self.time_var, self.data)
+
+        # Check if data will or not be saved
         if self.save:
             print('\nSaving data ...')
-            # Saving time_var and data
-            self._save_data(self.time_var, 'time.dat')
-            self._save_data(self.data, 'data.dat')
+            self._start_writer()
+            self.writer.write_block('time', self.time_var)
+            self.writer.write_block('time_measured', self.time_measured)
+            self.writer.write_block('data', self.data)
+            self._stop_writer()
             print('\nData saved ...')
-        return
+
+    def _get_data_arduino_timed(self):
+        """ Acquisition loop for Arduino boards sampling on a timer interrupt (protocol='timed').
+            Every sample is kept and time_var holds the board (micros()) timestamps, so
+            sample spacing is defined by the microcontroller clock"""
+
+        # Preallocating buffers
+        self.data = Data_buffer(self.cycles)
+        self.time_var = Data_buffer(self.cycles)
+
+        # Main loop, where blocks of samples received by the serial reader are stored (one iteration per block).
+        # Block sizes depend on the serial reader, so stats capacity grows as needed
+        self.stats.start(0)
+        k = 0
+        while k < self.cycles:
+
+            timestamps, samples = self.serial_reader.read(timeout=5.0 + self.ts)
+            if len(samples) == 0:
+                self.serial_reader.stop()  # Raises reader errors, if any
+                raise TimeoutError(f'No data received from {self.com_port}')
+            self.stats.mark('io')
+
+            n = min(len(samples), self.cycles - k)
+            values = samples[:n] * self.ard_vpb
+            self.data.extend(values)
+            self.time_var.extend(timestamps[:n])
+            self.stats.mark('buffer')
+
+            # Streaming block to disk (if saving)
+            if self.writer is not None:
+                self.writer.write_block('time', timestamps[:n])
+                self.writer.write_block('time_measured', timestamps[:n])
+                self.writer.write_block('data', values)
+            k += n
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the while loop
+            self._plot_count = k
+            if self._stop_event.is_set():
+                break
+
+            self._progress.update(k, self.cycles)
+            self.stats.mark('print')
+            self.stats.next()
+
+        self.stats.stop()
+
+        # Exposing acquired data as NumPy arrays. Sample instants are measured by the board
+        self.data, self.time_var = self.data.view(), self.time_var.view()
+        self.time_measured = self.time_var.copy()
+        self.jitter = jitter_summary(np.arange(len(self.time_var)) * self.ts, self.time_measured)
+
+    def stream_arduino(self, block_size=None):
+        """
+            Generator of blocks of data continuously acquired from Arduino boards. Acquisition runs, with
+            constant memory, until the generator is closed or stop_stream() is called. Blocks are also passed
+            to registered callbacks and streamed to disk (if save).
+
+            Every sample sent by the board is kept. With protocol='timed', the board samples every ts and time
+            holds board timestamps. Otherwise, the board sends data as fast as it can and time holds host
+            timestamps (time when data were received).
+
+        :params:
+            block_size: number of samples per block. If None, blocks are yielded as they are received
+
+        :example:
+            for time_block, data_block in stream_arduino(block_size=100):
+                ...  # Processing data as they arrive
+        """
+
+        if self.protocol == 'timed':
+            self._check_arduino_period(self.ts)
+
+        self._open_serial(reader=True)
+        try:
+            time.sleep(2)  # Wait for Arduino and Serial to start up
+
+            # Starting writer, that streams data to disk (if saving)
+            self._start_writer()
+
+            if self.protocol == 'timed':
+                self._start_stream(lambda: self._set_arduino_rate(self.ts))
+            else:
+                # Data received before the start are discarded
+                self._start_stream(lambda: self.serial_reader.read(timeout=0))
+
+            rebuffer = Block_rebuffer(block_size)
+            while not self._stream_stop.is_set():
+
+                timestamps, samples = self.serial_reader.read(timeout=5.0 + self.ts)
+                if len(samples) == 0:
+                    self.serial_reader.stop()  # Raises reader errors, if any
+                    raise TimeoutError(f'No data received from {self.com_port}')
+
+                # Host timestamps are relative to the start
+                if self.protocol != 'timed':
+                    timestamps = timestamps - self.start_time
+
+                for time_block, data_block in rebuffer.push(timestamps, samples * self.ard_vpb):
+                    self._publish(time_block, data_block)
+                    yield time_block, data_block
+
+        finally:
+            self._close_serial()
+            self._stop_writer()
+            self._stream_stop.clear()
+
+    def _start_stream(self, start):
+        """ Method to start a stream calling start(), synchronized by self.start_sync (if any),
+            and to save the start time """
+
+        if self.start_sync is not None:
+            self.start_sync.wait_start(self)
+
+        start()
+        self.start_time = time.perf_counter()
+
+        if self.start_sync is not None:
+            self.start_sync.started(self)
+
+    def register_callback(self, function, block_size=None):
+        """
+            Method to call function(time, data) for every block of block_size samples acquired by
+            stream_nidaq, stream_arduino or start_stream (None: blocks as they are acquired)
+
+        :example:
+            register_callback(lambda time, data: print(data.mean()), block_size=1000)
+        """
+
+        self._callbacks.append((function, Block_rebuffer(block_size)))
+
+    def start_stream(self, board='nidaq', block_size=None):
+        """
+            Method to start continuous acquisition in a background thread. Data are passed to registered
+            callbacks (and saved, if save) until stop_stream() is called.
+
+        :params:
+            board: 'nidaq' or 'arduino'
+            block_size: number of samples per block read from the board (see stream_nidaq/stream_arduino)
+
+        :example:
+            register_callback(process, block_size=1000)
+            start_stream('nidaq')
+            ...
+            stop_stream()
+        """
+
+        if board == 'nidaq':
+            stream = self.stream_nidaq(block_size)
+        elif board == 'arduino':
+            stream = self.stream_arduino(block_size)
+        else:
+            raise ValueError(f"Unknown board: {board}. Use 'nidaq' or 'arduino'")
+
+        def target():
+            try:
+                for _ in stream:
+                    pass
+            except BaseException as e:
+                self._stream_error = e
+
+        self._stream_error = None
+        self._stream_thread = threading.Thread(target=target, daemon=True)
+        self._stream_thread.start()
+
+    def stop_stream(self):
+        """ Method to stop continuous acquisition (started by start_stream, or a running generator) """
+
+        self._stream_stop.set()
+        if self._stream_thread is not None:
+            self._stream_thread.join()
+            self._stream_thread = None
+
+        if self._stream_error is not None:
+            error, self._stream_error = self._stream_error, None
+            raise error
+
+    async def acquire_async(self, board='nidaq'):
+        """
+            Asynchronous version of get_data_nidaq/get_data_arduino: the session runs in an executor, so the
+            event loop (e.g. a web dashboard or other devices) is not blocked. If the awaiting task is cancelled,
+            acquisition stops and devices and files are closed. Data are not plotted.
+
+        :params:
+            board: 'nidaq' or 'arduino'
+
+        :return:
+            time_var and data
+
+        :example:
+            time_var, data = await acquire_async('nidaq')
+        """
+
+        if board == 'nidaq':
+            await self._run_async(self.get_data_nidaq)
+        elif board == 'arduino':
+            await self._run_async(self.get_data_arduino)
+        else:
+            raise ValueError(f"Unknown board: {board}. Use 'nidaq' or 'arduino'")
+
+        return self.time_var, self.data
+
+    async def stream_async(self, board='nidaq', block_size=None):
+        """
+            Asynchronous generator of blocks of data continuously acquired (see stream_nidaq and stream_arduino).
+            Arduino serial ports are read by the event loop itself, and NIDAQ reads run in an executor.
+            Acquisition stops when the generator is closed or the consuming task is cancelled.
+
+        :params:
+            board: 'nidaq' or 'arduino'
+            block_size: number of samples per block
+
+        :example:
+            async for time_block, data_block in stream_async('arduino', block_size=100):
+                ...
+        """
+
+        if board == 'nidaq':
+            blocks = self._stream_nidaq_async(block_size)
+        elif board == 'arduino':
+            blocks = self._stream_arduino_async(block_size)
+        else:
+            raise ValueError(f"Unknown board: {board}. Use 'nidaq' or 'arduino'")
+
+        try:
+            async for block in blocks:
+                yield block
+        finally:
+            await blocks.aclose()
+
+    async def _stream_nidaq_async(self, block_size):
+        """ Blocks of stream_nidaq, whose (blocking) reads run in an executor """
+
+        loop = asyncio.get_running_loop()
+        stream = self.stream_nidaq(block_size)
+        future = None
+        try:
+            while True:
+                future = loop.run_in_executor(None, next, stream, None)
+                block = await asyncio.shield(future)
+                if block is None:
+                    break
+                yield block
+        finally:
+            # A read may still be running (cancellation): stopping after it and closing the task
+            self._stream_stop.set()
+            if future is not None:
+                await asyncio.wait([future])
+            await loop.run_in_executor(None, stream.close)
+            self._stream_stop.clear()
+
+    async def _stream_arduino_async(self, block_size):
+        """ Blocks of data from Arduino boards, read by the event loop (see stream_arduino) """
+
+        self._open_serial()
+        reader = Async_serial(self.ser, self.protocol).start()
+        try:
+            await asyncio.sleep(2)  # Wait for Arduino and Serial to start up
+            if self.protocol == 'timed':
+                self._set_arduino_rate(self.ts)
+
+            # Starting writer, that streams data to disk (if saving)
+            self._start_writer()
+
+            rebuffer = Block_rebuffer(block_size)
+            start = None
+            while True:
+
+                try:
+                    timestamps, samples = await asyncio.wait_for(reader.read(), 5.0 + self.ts)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f'No data received from {self.com_port}')
+
+                # Host timestamps are relative to the first sample
+                if self.protocol != 'timed':
+                    start = timestamps[0] if start is None else start
+                    timestamps = timestamps - start
+
+                for time_block, data_block in rebuffer.push(timestamps, samples * self.ard_vpb):
+                    self._publish(time_block, data_block)
+                    yield time_block, data_block
+
+        finally:
+            reader.close()
+            self._close_serial()
+            self._stop_writer()
+
+    def _publish(self, time_block, data_block):
+        """ Method to stream a block to disk (if saving) and to pass it to registered callbacks """
+
+        if self.writer is not None:
+            self.writer.write_block('time', time_block)
+            self.writer.write_block('data', data_block)
+
+        for function, rebuffer in self._callbacks:
+            for time_part, data_part in rebuffer.push(time_block, data_block):
+                function(time_part, data_part)
 
     def get_data_arduino_gui(self):
         """
@@ -449,8 +1055,7 @@ class Get_data(Base):
                     # Separating variables
                     self.ts = float(values['-TS-'])
                     self.session_duration = float(values['-SD-'])
-                    self.com_port = serial.tools.list_ports.comports(
-                    )[self.com_ports.index(values['-COM-'])].name
+                    self.com_port = self._com_port_name(values['-COM-'])
                     self.save = values['-Save-']
                     self.path = values['-Path-']
                     self.plot = values['-Plot-']
@@ -470,8 +1075,6 @@ class Get_data(Base):
 
             if event == '-COM-':  # Updating com ports
 
-                self.com_ports = [
-                    i.description for i in serial.tools.list_ports.comports()]
                 port = values['-COM-']
                 window['-COM-'].update(port, self.com_ports)
 
@@ -0,0 +1,327 @@
+import threading
+import warnings
+import numpy as np
+from pydaq.get_data import Get_data
+from pydaq.utils.base import Base
+
+
+class Start_sync:
+    """
+        Synchronized start of several streams (one thread per device). Every stream waits for the others
+        (barrier) just before starting, so all devices start together on a common host time base.
+
+        With a shared hardware trigger, NIDAQ streams of slave devices are started first (armed, waiting
+        for the trigger) and the master device is started after all of them, so every NIDAQ device starts
+        on the same trigger edge.
+
+        :params:
+            sources: number of streams
+            master: Get_data instance of the master device (shared trigger), or None
+            slaves: number of slave devices (shared trigger)
+    """
+
+    def __init__(self, sources, master=None, slaves=0):
+
+        self.master = master
+        self.slaves = slaves
+        self._barrier = threading.Barrier(sources)
+        self._armed = threading.Event()
+        self._armed_count = 0
+        self._lock = threading.Lock()
+
+        if slaves == 0:
+            self._armed.set()
+
+    def wait_start(self, source):
+        """ Method called by source just before starting """
+
+        self._barrier.wait()
+        if source is self.master:
+            self._armed.wait()
+
+    def started(self, source):
+        """ Method called by source just after starting """
+
+        if source.start_trigger is not None and source is not self.master:
+            with self._lock:
+                self._armed_count += 1
+                if self._armed_count == self.slaves:
+                    self._armed.set()
+
+    def abort(self):
+        """ Method to release waiting streams (e.g. if a device fails) """
+
+        self._barrier.abort()
+        self._armed.set()
+
+
+class Orchestrator(Base):
+    """
+        Class able to acquire data from several NIDAQ boards and Arduinos at once, merging them into one
+        aligned session.
+
+        Each device is read by its own thread (acquisition is I/O bound, so threads run in parallel),
+        using the streaming API of Get_data. All devices start together (synchronized start) and their
+        data are aligned on a common time base: time_var, with sample period ts, starting when every
+        device has delivered its first sample (data are never extrapolated). With shared_trigger=True, NIDAQ devices also share a hardware start trigger
+        (the first NIDAQ device is the master), so they start on the same clock edge (requires devices
+        connected by a trigger bus, e.g. RTSI or a PXI/cDAQ chassis).
+
+        :params:
+            ts: sample period of the merged session, in seconds (NIDAQ devices and timed Arduinos are sampled
+                with it)
+            session_duration: session duration, in seconds
+            save: if True, saves merged data in path (time and one file per device)
+            plot: if True, plots merged data at the end of the session
+            shared_trigger: if True, NIDAQ devices start on the start trigger of the first NIDAQ device
+            save_format: 'dat' (text), 'raw' (binary float64 + JSON header), 'npy' or 'hdf5'
+
+        :example:
+            o = Orchestrator(ts=0.01, session_duration=10.0)
+            o.add_nidaq(device='Dev1', channel='ai0:3')
+            o.add_arduino(com='COM3', protocol='timed')
+            o.get_data()
+            o.time_var, o.data['Dev1']
+    """
+
+    def __init__(self,
+                 ts=0.01,
+                 session_duration=10.0,
+                 save=False,
+                 plot=True,
+                 shared_trigger=False,
+                 save_format='dat'):
+
+        super().__init__()
+        self.ts = ts
+        self.session_duration = session_duration
+        self.save = save
+        self.plot = plot
+        self.shared_trigger = shared_trigger
+        self.save_format = save_format
+
+        # Devices: name -> (board, Get_data instance, block_size)
+        self.sources = {}
+
+        # Merged session: common time base and aligned data (name -> samples, or channels x samples),
+        # and data as acquired (name -> (time, data), with time on the common time base)
+        self.time_var = []
+        self.data = {}
+        self.raw = {}
+
+        # Start time of each device, relative to the first one (seconds)
+        self.offsets = {}
+
+        self.title = 'PYDAQ - Multi-device Acquisition'
+        self.legend = []
+        self.path = None
+
+    def add_nidaq(self, device='Dev1', channel='ai0', terminal='Diff', name=None, block_size=None):
+        """
+            Method to add a NIDAQ device to the session
+
+        :params:
+            device, channel, terminal: see Get_data
+            name: name of the device in the session (default: device)
+            block_size: number of samples read per call (default: ~0.1 s of data)
+        """
+
+        source = Get_data(device=device, channel=channel, terminal=terminal, ts=self.ts,
+                          session_duration=self.session_duration, save=False, plot=False)
+        source.nidaq_backend = self.nidaq_backend
+
+        return self._add_source(name or device, 'nidaq', source, block_size)
+
+    def add_arduino(self, com='COM1', protocol='ascii', baudrate=None, name=None):
+        """
+            Method to add an Arduino to the session. With protocol='timed', the board samples every ts.
+            Otherwise, it sends data as fast as it can (they are resampled to the common time base)
+
+        :params:
+            com, protocol, baudrate: see Get_data
+            name: name of the device in the session (default: com)
+        """
+
+        source = Get_data(com=com, ts=self.ts, session_duration=self.session_duration, save=False,
+                          plot=False, protocol=protocol, baudrate=baudrate)
+
+        return self._add_source(name or com, 'arduino', source, None)
+
+    def _add_source(self, name, board, source, block_size):
+
+        if name in self.sources:
+            raise ValueError(f'There is already a device named {name} in the session')
+
+        self.sources[name] = (board, source, block_size)
+
+        return source
+
+    def get_data(self):
+        """
+            This function acquires data from all devices at once and merges them into one session
+
+        :example:
+            get_data()
+        """
+
+        if not self.sources:
+            raise ValueError('There are no devices in the session. Use add_nidaq/add_arduino')
+
+        # Number of samples of the merged session
+        self.cycles = int(np.floor(self.session_duration / self.ts)) + 1
+
+        # Synchronized start (and hardware trigger shared by NIDAQ devices)
+        nidaqs = [source for board, source, _ in self.sources.values() if board == 'nidaq']
+        master = nidaqs[0] if self.shared_trigger and nidaqs else None
+        for source in nidaqs:
+            source.start_trigger = None
+            if master is not None and source is not master:
+                source.start_trigger = f'/{master.device}/ai/StartTrigger'
+        start_sync = Start_sync(len(self.sources), master, len(nidaqs) - 1 if master is not None else 0)
+
+        # One thread per device. Host time of the first sample of each device
+        blocks = {name: [] for name in self.sources}
+        first = {}
+        errors = {}
+        for _, source, _ in self.sources.values():
+            source.start_time = None
+        threads = [threading.Thread(target=self._acquire, args=(name, blocks[name], start_sync, master, first, errors),
+                                    daemon=True) for name in self.sources]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Stop requests left by a failed device (streams that did not start)
+        for _, source, _ in self.sources.values():
+            if hasattr(source, '_stream_stop'):
+                source._stream_stop.clear()
+
+        if errors:
+            # Device that failed first (other devices were stopped by it)
+            failed = [name for name, e in errors.items() if not isinstance(e, threading.BrokenBarrierError)]
+            name = (failed or list(errors))[0]
+            error = errors[name]
+            raise RuntimeError(f'Acquisition failed on device {name}: {error!r}') from error
+
+        self._merge(blocks, master)
+
+        if self.save:
+            self._check_path()
+            self._save_session()
+
+        if self.plot:
+            self._plot_session()
+
+    def _acquire(self, name, blocks, start_sync, master, first, errors):
+        """ Acquisition thread of device name: stores blocks until session_duration after the first
+            sample of the last device to deliver one (so every device covers the common time base).
+            If any device fails, every stream is stopped """
+
+        board, source, block_size = self.sources[name]
+        source.start_sync = start_sync
+
+        try:
+            stream = source.stream_nidaq(block_size) if board == 'nidaq' else source.stream_arduino()
+            try:
+                for time_block, data_block in stream:
+                    blocks.append((time_block, data_block))
+                    if errors:  # Another device failed
+                        break
+
+                    # Host times of the first and last samples
+                    start = self._start_time(name, master)
+                    first.setdefault(name, start + time_block[0])
+                    if len(first) == len(self.sources) and \
+                            start + time_block[-1] >= max(first.values()) + self.session_duration:
+                        break
+            finally:
+                stream.close()
+        except BaseException as e:
+            errors[name] = e
+            start_sync.abort()
+
+            # Stopping streams of the other devices
+            for _, other, _ in self.sources.values():
+                if hasattr(other, '_stream_stop'):
+                    other._stream_stop.set()
+        finally:
+            source.start_sync = None
+
+    def _start_time(self, name, master):
+        """ Host start time of device name (devices sharing a hardware trigger start with the master) """
+
+        board, source, _ = self.sources[name]
+        if master is not None and board == 'nidaq':
+            return master.start_time
+
+        return source.start_time
+
+    def _merge(self, blocks, master):
+        """ Method to align data of all devices on the common time base """
+
+        # Start time of each device relative to the first one
+        start_times = {name: self._start_time(name, master) for name in self.sources}
+        first = min(start_times.values())
+        self.offsets = {name: start - first for name, start in start_times.items()}
+
+        times = {name: np.concatenate([block[0] for block in device_blocks]) + self.offsets[name]
+                 for name, device_blocks in blocks.items()}
+
+        # Common time base, over the time span covered by every device (data are not extrapolated)
+        start = max(time_device[0] for time_device in times.values())
+        end = min(time_device[-1] for time_device in times.values())
+        cycles = min(self.cycles, max(0, int(np.floor((end - start) / self.ts + 1e-9)) + 1))
+        if cycles < self.cycles:
+            warnings.warn(f'Devices acquired together for {max(0.0, end - start):.4f} s only: merged session '
+                          f'has {cycles} of {self.cycles} samples')
+        self.time_var = start + np.arange(cycles) * self.ts
+
+        self.data, self.raw, self.legend = {}, {}, []
+        for name, device_blocks in blocks.items():
+            time_device = times[name]
+            data_device = np.concatenate([block[1] for block in device_blocks], axis=-1)
+            self.raw[name] = (time_device - start, data_device)
+
+            # Resampling (linear interpolation) on the common time base
+            channels = np.atleast_2d(data_device)
+            aligned = np.array([np.interp(self.time_var, time_device, channel) for channel in channels])
+            self.data[name] = aligned if data_device.ndim > 1 else aligned[0]
+
+            if channels.shape[0] > 1:
+                self.legend += [f'{name}/{k}' for k in range(channels.shape[0])]
+            else:
+                self.legend.append(name)
+
+        # Time base starting at 0
+        self.time_var = self.time_var - start
+
+    def _save_session(self):
+        """ Method to save merged session (time and one stream per device) """
+
+        self._start_writer()
+        try:
+            self.writer.write_block('time', self.time_var)
+            for name, data in self.data.items():
+                self.writer.write_block(name.replace('/', '_'), data)
+        finally:
+            self._stop_writer()
+
+    def _session_metadata(self):
+        """ Session information saved with data (devices, offsets, ts and start time)"""
+
+        metadata = super()._session_metadata()
+        metadata['devices'] = str({name: board for name, (board, _, _) in self.sources.items()})
+        metadata['offsets'] = str(self.offsets)
+
+        return metadata
+
+    def _plot_session(self):
+        """ Method to plot merged data """
+
+        self._start_updatable_plot()
+        lines = list(np.concatenate([np.atleast_2d(data) for data in self.data.values()]))
+        if len(lines) == 1:
+            self._update_plot(self.time_var, lines[0])
+        else:
+            self._update_plot([self.time_var] * len(lines), lines, len(lines))
@@ -1,13 +1,18 @@
 import os
 import time
 import warnings
-import PySimpleGUI as sg
-import matplotlib.pyplot as plt
-import nidaqmx
 import numpy as np
-import serial
-import serial.tools.list_ports
 from pydaq.utils.base import Base
+from pydaq.utils.buffer import Data_buffer
+from pydaq.utils.data_source import open_data_source, data_range
+from pydaq.utils.scheduler import Scheduler, jitter_summary
+from pydaq.utils.lazy import lazy_import
+
+# GUI, plotting and hardware back ends are imported on first use
+sg = lazy_import('PySimpleGUI')
+nidaqmx = lazy_import('nidaqmx')
+constants = lazy_import('nidaqmx.constants')
+errors = lazy_import('nidaqmx.errors')
 
 
 class Send_data(Base):
@@ -19,7 +24,8 @@ class Send_data(Base):
              - https://www.github.com/samirmartins/
 
         :params:
-            data: data array (list or np.array) that will be sent to the board
+            data: data array (list or np.array) that will be sent to the board, or path of a data file (.dat/.txt text file,
+                  .npy or raw float64 .bin file). Files are read as they are sent, without loading them into memory
             device: nidaq device from where data will be colected. Example: "Dev1"
             channel: channel from where data will be acquired. Example: ao0
             com: arduino COM port. Example: 'COM1'
@@ -27,8 +33,22 @@ class Send_data(Base):
             ao_min: minimum allowed analog output value
             ao_max: maximum allowed analog output value
             plot: if True, plot data iteractively as they are acquired
+            save: if True, saves sent data and time in the folder of path (sent, time and time_measured files)
+            save_format: 'dat' (text), 'raw' (binary float64 + JSON header), 'npy' or 'hdf5' (one file per session, requires h5py)
+            hardware_timed: if True, NIDAQ output is paced by the board sample clock and data are written to the device
+                            buffer in blocks
+            block_size: number of samples written per call when hardware_timed is True (default: ~0.5 s of data)
+            regenerate: if True (and hardware_timed), data are one period of a periodic signal, written once and
+                        regenerated by the board repetitions times
+            repetitions: number of periods sent when regenerate is True
+            protocol: Arduino sketch. 'ascii' (pydaq/arduino_code) or 'binary' (pydaq/arduino_binary), used to define
+                      the default baud rate
+            baudrate: Arduino serial baud rate. If None, 9600 ('ascii') or 115200 ('binary')
     """
 
+    # DAQmx errors raised when the output buffer runs out of new samples (underflow)
+    underflow_errors = (-200290, -200621, -200018, -200016)
+
     def __init__(self,
                  data=None,
                  device="Dev1",
@@ -37,7 +57,15 @@ class Send_data(Base):
                  ts=0.5,
                  ao_min=0,
                  ao_max=5,
-                 plot=True):
+                 plot=True,
+                 save=False,
+                 save_format='dat',
+                 hardware_timed=False,
+                 block_size=None,
+                 regenerate=False,
+                 repetitions=1,
+                 protocol='ascii',
+                 baudrate=None):
 
         super().__init__()
         self.device = device
@@ -46,17 +74,33 @@ class Send_data(Base):
         self.plot = plot
         self.ao_min = ao_min
         self.ao_max = ao_max
+        self.save = save
+        self.save_format = save_format
+        self.hardware_timed = hardware_timed
+        self.block_size = block_size
+        self.regenerate = regenerate
+        self.repetitions = repetitions
+        self.protocol = protocol
+        self.baudrate = baudrate
+
+        # Output buffer underflows and minimum number of samples waiting in the device buffer (hardware_timed)
+        self.underflows = 0
+        self.min_buffer_level = None
 
         if type(data) == list:
             self.data = np.array(data)
+        elif isinstance(data, str):
+            self.data = open_data_source(data)
         else:
             self.data = data
 
-        # Gathering nidaq info
-        self._nidaq_info()
-
-        # Time variable
+        # Time variable and values sent to the board (plotted and saved)
         self.time_var = []
+        self.sent = []
+
+        # Measured time instants and timing (lateness) summary of the session
+        self.time_measured = []
+        self.jitter = None
 
         # Defining default path
         self.path = os.path.join(os.path.join(os.path.expanduser('~')), 'Desktop', 'data.dat')
@@ -64,8 +108,7 @@ class Send_data(Base):
         # Error flags
         self.error_max, self.error_path = False, False
 
-        # COM ports
-        self.com_ports = [i.description for i in serial.tools.list_ports.comports()]
+        # COM ports (available ports are cached by the device registry, see com_ports)
         self.com_port = com  # Default COM port
 
         # Number of necessary cycles
@@ -93,7 +136,7 @@ class Send_data(Base):
         self.cycles = len(self.data)
 
         # Initializing device, with channel defined
-        task = nidaqmx.Task()
+        task = self._new_task()
         task.ao_channels.add_ao_voltage_chan(self.device + '/' + self.channel, min_val=float(self.ao_min),
                                              max_val=float(self.ao_max))
 
@@ -101,45 +144,200 @@ class Send_data(Base):
             self.title = f'PYDAQ - Sending Data. {self.device}, {self.channel}'
             self._start_updatable_plot()
 
+        # Starting writer, that streams data to disk during the session (if saving)
+        self._start_writer()
+
         # Main loop, where data will be sent
-        for k in range(self.cycles):
+        try:
+            if self.hardware_timed:  # Board sample clock paces the output
+                self._run_loop(lambda: self._send_data_nidaq_buffered(task),
+                               lambda n: (self.time_var[:n], self.sent[:n], 1))
+            else:
+                self._run_loop(lambda: self._send_data_nidaq_loop(task),
+                               lambda n: (self.time_var[:n], self.sent[:n], 1))
 
-            # Counting time to append data and update interface
-            st = time.time()
+        finally:
+            # Closing task
+            task.close()
+
+            # Writing remaining data (if saving)
+            self._stop_writer()
+
+        return
+
+    def _send_data_nidaq_loop(self, task):
+        """ Sending loop for NIDAQ boards, paced by self.scheduler"""
+
+        # Preallocating time and sent data buffers and measured time instants (seconds from the first deadline).
+        # Sent data are plotted from their buffer, so data sources (e.g. files) are only read once
+        self.time_var = Data_buffer(self.cycles)
+        self.sent = Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
+
+        # Main loop, where data will be sent
+        for k in range(self.cycles):
 
             # Sending data
-            task.write(self.data[k])
+            value = self.data[k]
+            task.write(value)
+            self.time_measured[k] = self.scheduler.timestamp()
+            self.stats.mark('io')
 
-            # Queue data in a list
+            # Queue time and sent data in buffers
             self.time_var.append(k * self.ts)
+            self.sent.append(value)
+            self.stats.mark('buffer')
+
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('sent', value)
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-            if self.plot:
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
 
-                # Checking if there is still an open figure. If not, stop the for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except:
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
+
+        self.stats.stop()
+
+        # Warning if any deadline was missed
+        self._check_deadlines()
+
+        # Exposing time and sent data as NumPy arrays
+        self.time_var, self.sent = self.time_var.view(), self.sent.view()
+
+    def _sent_samples(self, start, stop):
+        """ Samples start:stop sent to the board (data are repeated when regenerated) """
+
+        if not self.regenerate:
+            return np.asarray(self.data[start:stop])
+
+        return np.asarray(self.data)[np.arange(start, stop) % len(self.data)]
+
+    def _send_data_nidaq_buffered(self, task):
+        """ Hardware-timed output. The board sample clock defines the output instants
+            and data are written to the device buffer in blocks (or once, if regenerated),
+            so timing does not depend on the Python interpreter"""
+
+        # Samples per call (default: about 0.5 s of data)
+        if self.block_size is None:
+            block_size = max(1, int(np.ceil(0.5 / self.ts)))
+        else:
+            block_size = int(self.block_size)
+
+        # Periodic signals are written once and regenerated by the board
+        if self.regenerate:
+            self.data = np.asarray(self.data, dtype=np.float64)
+            self.cycles = len(self.data) * int(self.repetitions)
+
+        # Configuring board sample clock (finite generation, self.cycles samples)
+        task.timing.cfg_samp_clk_timing(rate=1 / self.ts,
+                                        sample_mode=constants.AcquisitionType.FINITE,
+                                        samps_per_chan=self.cycles)
+
+        if self.regenerate:
+            task.out_stream.regen_mode = constants.RegenerationMode.ALLOW_REGENERATION
+            first = self.data
+        else:
+            # Device buffer holds two blocks: one being generated, one being written
+            task.out_stream.regen_mode = constants.RegenerationMode.DONT_ALLOW_REGENERATION
+            task.out_stream.output_buf_size = min(self.cycles, 2 * block_size)
+            first = self._sent_samples(0, min(self.cycles, 2 * block_size))
+
+        # Output instants are defined by the board clock. Generated samples are kept in self.sent
+        self.time_var = np.arange(self.cycles) * self.ts
+        self.sent = Data_buffer(self.cycles)
+        self.underflows = 0
+        self.min_buffer_level = None
+
+        writer = self._ao_writer(task)
+        writer.write_many_sample(np.ascontiguousarray(first, dtype=np.float64))
+        written = len(first)
+        task.start()
+        self.stats.start(np.ceil(self.cycles / block_size))
+
+        # Regenerated periods are written once: only generation is followed
+        if self.regenerate:
+            written = self.cycles
+
+        # Main loop, where blocks of data will be written as buffer space is released (one iteration per block)
+        generated = 0
+        try:
+            while generated < self.cycles:
+
+                if written < self.cycles:
+                    # Samples still waiting in the device buffer (0 means the board is about to underflow)
+                    level = written - task.out_stream.total_samp_per_chan_generated
+                    self.min_buffer_level = level if self.min_buffer_level is None else min(self.min_buffer_level, level)
+
+                    # Write next block (blocks until there is space in the device buffer)
+                    block = self._sent_samples(written, min(self.cycles, written + block_size))
+                    writer.write_many_sample(np.ascontiguousarray(block, dtype=np.float64),
+                                             timeout=len(block) * self.ts + 10.0)
+                    written += len(block)
+                    self.stats.mark('io')
+                else:
+                    time.sleep(min(0.1, block_size * self.ts))
+                    self.stats.mark('sleep')
+
+                # Queue generated samples and stream them to disk (if saving)
+                new = min(task.out_stream.total_samp_per_chan_generated, self.cycles)
+                if new > generated:
+                    self.sent.extend(self._sent_samples(generated, new))
+                    self.stats.mark('buffer')
+                    if self.writer is not None:
+                        self.writer.write_block('time', self.time_var[generated:new])
+                        self.writer.write_block('time_measured', self.time_var[generated:new])
+                        self.writer.write_block('sent', self.sent[generated:new])
+                generated = new
+                self.stats.mark('save')
+
+                # Publishing new data to the plot. If it was closed, stop the while loop
+                self._plot_count = generated
+                if self._stop_event.is_set():
                     break
 
-                # Updating data values
-                self._update_plot(self.time_var, self.data[0:k + 1])
+                self._progress.update(generated, self.cycles)
+                self.stats.mark('print')
+                self.stats.next()
 
-            print(f'Iteration: {k} of {self.cycles-1}')
+        except errors.DaqError as e:
+            if e.error_code not in self.underflow_errors:
+                raise
+            # Board ran out of samples: output stops and the underflow is reported
+            self.underflows += 1
+            warnings.warn(f'Output buffer underflow after {generated} samples ({e.error_code}). '
+                          f'Increase block_size or use regenerate=True for periodic signals')
 
-            # Getting end time
-            et = time.time()
+        self.stats.stop()
+        task.stop()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except:
-                warnings.warn("Time spent to append data and update interface was greater than ts. "
-                              "You CANNOT trust time.dat")
+        # Keeping only generated samples (figure may have been closed)
+        self.time_var = self.time_var[:generated]
+        self.sent = self.sent.view()
 
-        # Closing task
-        task.close()
+        # Output instants are defined by the board clock
+        self.time_measured = self.time_var.copy()
+        self.jitter = jitter_summary(self.time_var, self.time_measured)
 
-        return
+    def _writer_path(self):
+        """ Data are saved in the folder of self.path (path of data to be sent)"""
+
+        return os.path.dirname(self.path)
 
     def send_data_nidaq_gui(self):
         """
@@ -217,10 +415,11 @@ class Send_data(Base):
 
                 # Reading data from defined path
                 self.path = values['-Path-']
-                self.data = np.loadtxt(self.path)
+                self.data = open_data_source(self.path)
 
                 # Check if max(data) < self.ao_max
-                if (max(self.data) > float(self.ao_max)) or (min(self.data) < float(self.ao_min)):
+                data_min, data_max = data_range(self.data)
+                if (data_max > float(self.ao_max)) or (data_min < float(self.ao_min)):
                     self._range_error()
                     self.error_max = True
                 else:
@@ -281,59 +480,88 @@ class Send_data(Base):
         # Opening ports and serial communication
         self._open_serial()
 
-        # Rearranjing data to be send and also loaded data
-        self.data_send = list(self.data).copy()
-        self.data_send = [b'1' if i > 2.5 else b'0' for i in self.data]
-        self.data = np.array(self.data)
+        try:
+            if self.plot:  # If plot, start updatable plot
+                self.title = f'PYDAQ - Sending Data. Arduino, Port: {self.com_port}'
+                self._start_updatable_plot()
 
+            time.sleep(2)  # Wait for Arduino and Serial to start up
 
-        if self.plot:  # If plot, start updatable plot
-            self.title = f'PYDAQ - Sending Data. Arduino, Port: {self.com_port}'
-            self._start_updatable_plot()
+            # Starting writer, that streams data to disk during the session (if saving)
+            self._start_writer()
+
+            # Main loop, where data will be sent
+            self._run_loop(self._send_data_arduino_loop,
+                           lambda n: (self.time_var[:n], self.sent[:n], 1))
 
-        time.sleep(2)  # Wait for Arduino and Serial to start up
+        finally:
+            try:
+                # Turning off the output
+                self.ser.write(b'0')
+            finally:
+                # Closing port
+                self._close_serial()
+
+                # Writing remaining data (if saving)
+                self._stop_writer()
+
+        return
+
+    def _send_data_arduino_loop(self):
+        """ Sending loop for Arduino boards, paced by self.scheduler"""
+
+        # Preallocating time and sent data buffers and measured time instants (seconds from the first deadline).
+        # Sent data are plotted from their buffer, so data sources (e.g. files) are only read once
+        self.time_var = Data_buffer(self.cycles)
+        self.sent = Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
 
         # Main loop, where data will be sent
         for k in range(self.cycles):
 
-            # Counting time to append data and update interface
-            st = time.time()
-
             # Sending data
             self.ser.reset_input_buffer()  # Reseting serial input buffer
-            self.ser.write(self.data_send[k])
+            high = self.data[k] > 2.5  # "High" if greater than 2.5, else "Low"
+            self.ser.write(b'1' if high else b'0')
+            self.time_measured[k] = self.scheduler.timestamp()
+            self.stats.mark('io')
 
-            # Queue data in a list
+            # Queue time and sent data in buffers
             self.time_var.append(k * self.ts)
+            self.sent.append(5 if high else 0)
+            self.stats.mark('buffer')
+
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('sent', 5 if high else 0)
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-            if self.plot:
-
-                # Checking if there is still an open figure. If not, stop the for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except:
-                    break
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
 
-                # Updating data values
-                self._update_plot(self.time_var, self.data[0:k + 1])
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
 
-            print(f'Iteration: {k} of {self.cycles-1}')
+        self.stats.stop()
 
-            # Getting end time
-            et = time.time()
+        # Warning if any deadline was missed
+        self._check_deadlines()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except:
-                warnings.warn("Time spent to append data and update interface was greater than ts. "
-                              "You CANNOT trust time.dat")
-
-        # Turning off the output
-        self.ser.write(b'0')
-        # Closing port
-        self.ser.close()
-        return
+        # Exposing time and sent data as NumPy arrays
+        self.time_var, self.sent = self.time_var.view(), self.sent.view()
 
     def send_data_arduino_gui(self):
         """
@@ -397,16 +625,14 @@ class Send_data(Base):
                 # Restarting time and data
                 self.time_var, self.data = [], []
 
-                # Reading data from defined path and rearranjing it
+                # Reading data from defined path (values greater than 2.5 are sent as "High")
                 self.path = values['-Path-']
-                self.data = np.loadtxt(self.path)
-                self.data = list(self.data)
-                self.data = [5 if i > 2.5 else 0 for i in self.data]
+                self.data = open_data_source(self.path)
 
                 try:
                     # Separating variables
                     self.ts = float(values['-TS-'])
-                    self.com_port = serial.tools.list_ports.comports()[self.com_ports.index(values['-COM-'])].name
+                    self.com_port = self._com_port_name(values['-COM-'])
                     self.plot = values['-Plot-']
                     self.error_path = False
 
@@ -420,7 +646,6 @@ class Send_data(Base):
 
             if event == '-COM-':  # Updating com ports
 
-                self.com_ports = [i.description for i in serial.tools.list_ports.comports()]
                 port = values['-COM-']
                 window['-COM-'].update(port, self.com_ports)
 
@@ -428,3 +653,23 @@ class Send_data(Base):
         window.close()
 
         return
+
+    async def send_data_async(self, board='nidaq'):
+        """
+            Asynchronous version of send_data_nidaq/send_data_arduino: the session runs in an executor, so the
+            event loop (e.g. a web dashboard or other devices) is not blocked. If the awaiting task is cancelled,
+            sending stops and devices and files are closed. Data are not plotted.
+
+        :params:
+            board: 'nidaq' or 'arduino'
+
+        :example:
+            await send_data_async('nidaq')
+        """
+
+        if board == 'nidaq':
+            await self._run_async(self.send_data_nidaq)
+        elif board == 'arduino':
+            await self._run_async(self.send_data_arduino)
+        else:
+            raise ValueError(f"Unknown board: {board}. Use 'nidaq' or 'arduino'")
@@ -1,18 +1,13 @@
 import os
-import time
 import numpy as np
-import PySimpleGUI as sg
-import serial
-import serial.tools.list_ports
 from pydaq.utils.base import Base
-import os
-import serial
-import serial.tools.list_ports
-from pydaq.utils.base import Base
-import matplotlib.pyplot as plt
-import warnings
-import nidaqmx
-from nidaqmx.constants import TerminalConfiguration
+from pydaq.utils.buffer import Data_buffer
+from pydaq.utils.scheduler import Scheduler
+from pydaq.utils.lazy import lazy_import
+
+# GUI, plotting and hardware back ends are imported on first use
+sg = lazy_import('PySimpleGUI')
+nidaqmx = lazy_import('nidaqmx')
 
 
 class Step_response(Base):
@@ -35,6 +30,10 @@ class Step_response(Base):
             step_max: maximum step value
             terminal: 'Diff', 'RSE' or 'NRSE': terminal configuration (differential, referenced single ended or non-referenced single ended)
             plot: if True, plot data iteractively as they are sent/acquired
+            save_format: 'dat' (text), 'raw' (binary float64 + JSON header), 'npy' or 'hdf5' (one file per session, requires h5py). Data are streamed to disk during the experiment
+            protocol: Arduino serial protocol. 'ascii' (pydaq/arduino_code sketch) or 'binary' (framed samples,
+                      pydaq/arduino_binary sketch)
+            baudrate: Arduino serial baud rate. If None, 9600 ('ascii') or 115200 ('binary')
 
 
     """
@@ -50,7 +49,10 @@ class Step_response(Base):
                  step_max=5,
                  terminal='Diff',
                  com = 'COM1',
-                 plot=True
+                 plot=True,
+                 save_format='dat',
+                 protocol='ascii',
+                 baudrate=None
                  ):
 
         super().__init__()
@@ -63,24 +65,25 @@ class Step_response(Base):
         self.ao_channel = ao_channel
         self.step_min = step_min
         self.step_max = step_max
+        self.protocol = protocol
+        self.baudrate = baudrate
 
         # Terminal configuration
-        self.terminal = self.term_map[terminal]
+        self.terminal = terminal
 
-        # COM ports
-        self.com_ports = [
-            i.description for i in serial.tools.list_ports.comports()]
+        # COM ports (available ports are cached by the device registry, see com_ports)
         self.com_port = com  # Default COM port
 
         # Initializing variables
         self.time_var, self.input, self.output = [], [], []
 
+        # Measured time instants and timing (lateness) summary of the session
+        self.time_measured = []
+        self.jitter = None
+
         # Plot title
         self.title = None
 
-        # Gathering nidaq info
-        self._nidaq_info()
-
         # Defining default path
         self.path = os.path.join(
             os.path.join(
@@ -102,6 +105,7 @@ class Step_response(Base):
 
         # Saving data
         self.save = True
+        self.save_format = save_format
 
     def step_response_arduino_gui(self):
         """
@@ -178,8 +182,7 @@ class Step_response(Base):
                 # Separating variables
                 self.ts = float(values['-TS-'])
                 self.session_duration = float(values['-SD-'])
-                self.com_port = serial.tools.list_ports.comports(
-                )[self.com_ports.index(values['-COM-'])].name
+                self.com_port = self._com_port_name(values['-COM-'])
                 self.save = values['-Save-']
                 self.path = values['-Path-']
                 self.step_time = values['-Step-']
@@ -195,8 +198,6 @@ class Step_response(Base):
 
             if event == '-COM-':  # Updating com ports
 
-                self.com_ports = [
-                    i.description for i in serial.tools.list_ports.comports()]
                 port = values['-COM-']
                 window['-COM-'].update(port, self.com_ports)
 
@@ -220,50 +221,86 @@ class Step_response(Base):
         self.cycles = int(np.floor(self.session_duration / self.ts)) + 1
 
         # Opening ports and serial communication
-        self._open_serial()
+        self._open_serial(reader=True)
+
+        try:
+            if self.plot:  # If plot, start updatable plot
+                self.title = f'PYDAQ - Step Response (Arduino), Port: {self.com_port}'
+                self._start_updatable_plot()
+
+            # Turning off the output before starting
+            self.ser.write(b'0')
+
+            # Starting writer, that streams data to disk during the session (if saving)
+            self._start_writer()
+
+            # Main loop, where data will be sent/acquired
+            self._run_loop(self._step_response_arduino_loop,
+                           lambda n: ([self.time_var[:n]] * 2, [self.output[:n], self.input[:n]], 2))
+
+        finally:
+            try:
+                # Turning off the output at the end
+                self.ser.write(b'0')
+            finally:
+                # Closing port
+                self._close_serial()
+
+                # Check if data will or not be saved, and finish saving accordingly
+                if self.save:
+                    print('\nSaving data ...')
+                    # Writing remaining data (data were streamed to disk during the session)
+                    self._stop_writer()
+                    print('\nData saved ...')
+
+        return
 
-        if self.plot:  # If plot, start updatable plot
-            self.title = f'PYDAQ - Step Response (Arduino), Port: {self.com_port}'
-            self._start_updatable_plot()
+    def _step_response_arduino_loop(self):
+        """ Step response loop for Arduino boards, paced by self.scheduler"""
 
         # Data to be sent
         sent_data = b'0'
 
-        # Turning off the output before starting
-        self.ser.write(b'0')
+        # Preallocating buffers and measured time instants (seconds from the first deadline)
+        self.time_var = Data_buffer(self.cycles)
+        self.input, self.output = Data_buffer(self.cycles), Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
 
         # Main loop, where data will be sent/acquired
         for k in range(self.cycles):
 
             # Sending and acquiring data
             self.ser.write(sent_data)
-            self.ser.reset_input_buffer()  # Reseting serial input buffer
-            # Get the last complete value
-            temp = int(self.ser.read(14).split()
-                       [-2].decode('UTF-8')) * self.ard_vpb
-
-            # Counting time to append data and update interface
-            st = time.time()
+            value, received = self._read_arduino()
+            temp = value * self.ard_vpb
+            self.time_measured[k] = self.scheduler.timestamp(received)
+            self.stats.mark('io')
 
-            # Queue data in a list
+            # Queue data in buffers
             self.output.append(temp)
             self.input.append(5 * float(sent_data))
             self.time_var.append(k * self.ts)
+            self.stats.mark('buffer')
+
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('input', 5 * float(sent_data))
+            self._stream('output', temp)
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-            if self.plot:
-
-                # Checking if there is still an open figure. If not, stop the
-                # for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except BaseException:
-                    break
-
-                # Updating data values
-                self._update_plot([self.time_var, self.time_var], [
-                                  self.output, self.input], 2)
-
-            print(f'Iteration: {k} of {self.cycles - 1}')
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
 
             # Updating sent_data
             if k * self.ts > float(self.step_time):
@@ -271,31 +308,19 @@ class Step_response(Base):
             else:
                 sent_data = b'0'
 
-            # Getting end time
-            et = time.time()
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except BaseException:
-                warnings.warn(
-                    "Time spent to append data and update interface was greater than ts. "
-                    "You CANNOT trust time.dat")
-
-        # Turning off the output at the end
-        self.ser.write(b'0')
-        # Closing port
-        self.ser.close()
-
-        # Check if data will or not be saved, and save accordingly
-        if self.save:
-            print('\nSaving data ...')
-            # Saving time_var and data
-            self._save_data(self.time_var, 'time.dat')
-            self._save_data(self.input, 'input.dat')
-            self._save_data(self.output, 'output.dat')
-            print('\nData saved ...')
-        return
+        self.stats.stop()
+
+        # Warning if any deadline was missed
+        self._check_deadlines()
+
+        # Exposing data as NumPy arrays
+        self.time_var = self.time_var.view()
+        self.input, self.output = self.input.view(), self.output.view()
 
     def step_response_nidaq_gui(self):
         """
@@ -465,27 +490,67 @@ class Step_response(Base):
         self.cycles = int(np.floor(self.session_duration / self.ts)) + 1
 
         # Initializing device, with channel defined
-        task_ao = nidaqmx.Task()
-        task_ai = nidaqmx.Task()
-        task_ao.ao_channels.add_ao_voltage_chan(
-            self.device + '/' + self.ao_channel,
-            min_val=float(
-                self.step_min),
-            max_val=float(
-                self.step_max))
-        task_ai.ai_channels.add_ai_voltage_chan(
-            self.device + '/' + self.ai_channel,
-            terminal_config=self.terminal)
-
-        if self.plot:  # If plot, start updatable plot
-            self.title = f'PYDAQ - Step Response (NIDAQ). {self.device}, {self.ai_channel}, {self.ao_channel}'
-            self._start_updatable_plot()
+        task_ao = self._new_task()
+        task_ai = self._new_task()
+
+        try:
+            task_ao.ao_channels.add_ao_voltage_chan(
+                self.device + '/' + self.ao_channel,
+                min_val=float(
+                    self.step_min),
+                max_val=float(
+                    self.step_max))
+            task_ai.ai_channels.add_ai_voltage_chan(
+                self.device + '/' + self.ai_channel,
+                terminal_config=self.terminal)
+
+            if self.plot:  # If plot, start updatable plot
+                self.title = f'PYDAQ - Step Response (NIDAQ). {self.device}, {self.ai_channel}, {self.ao_channel}'
+                self._start_updatable_plot()
+
+            # Turning off the output before starting
+            task_ao.write(self.step_min)
+
+            # Starting writer, that streams data to disk during the session (if saving)
+            self._start_writer()
+
+            # Main loop, where data will be sent/acquired
+            self._run_loop(lambda: self._step_response_nidaq_loop(task_ao, task_ai),
+                           lambda n: ([self.time_var[:n]] * 2, [self.output[:n], self.input[:n]], 2))
+
+        finally:
+            try:
+                # Turning off the output at the end
+                task_ao.write(0)
+            finally:
+                # Closing task
+                task_ao.close()
+                task_ai.close()
+
+                # Check if data will or not be saved, and finish saving accordingly
+                if self.save:
+                    print('\nSaving data ...')
+                    # Writing remaining data (data were streamed to disk during the session)
+                    self._stop_writer()
+                    print('\nData saved ...')
+
+        return
+
+    def _step_response_nidaq_loop(self, task_ao, task_ai):
+        """ Step response loop for NIDAQ boards, paced by self.scheduler"""
 
         # Data to be sent
         sent_data = self.step_min
 
-        # Turning off the output before starting
-        task_ao.write(sent_data)
+        # Preallocating buffers and measured time instants (seconds from the first deadline)
+        self.time_var = Data_buffer(self.cycles)
+        self.input, self.output = Data_buffer(self.cycles), Data_buffer(self.cycles)
+        self.time_measured = np.zeros(self.cycles)
+
+        # Starting scheduler (deadlines at k * ts)
+        self.scheduler = Scheduler(self.ts)
+        self.scheduler.start()
+        self.stats.start()
 
         # Main loop, where data will be sent/acquired
         for k in range(self.cycles):
@@ -493,29 +558,29 @@ class Step_response(Base):
             # Sending and acquiring data
             task_ao.write(sent_data)
             temp = task_ai.read()
+            self.time_measured[k] = self.scheduler.timestamp()
+            self.stats.mark('io')
 
-            # Counting time to append data and update interface
-            st = time.time()
-
-            # Queue data in a list
+            # Queue data in buffers
             self.output.append(temp)
             self.input.append(float(sent_data))
             self.time_var.append(k * self.ts)
+            self.stats.mark('buffer')
+
+            # Streaming data to disk (if saving)
+            self._stream('time', k * self.ts)
+            self._stream('time_measured', self.time_measured[k])
+            self._stream('input', float(sent_data))
+            self._stream('output', temp)
+            self.stats.mark('save')
+
+            # Publishing new data to the plot. If it was closed, stop the for loop
+            self._plot_count = k + 1
+            if self._stop_event.is_set():
+                break
 
-            if self.plot:
-
-                # Checking if there is still an open figure. If not, stop the
-                # for loop.
-                try:
-                    plt.get_figlabels().index('iter_plot')
-                except BaseException:
-                    break
-
-                # Updating data values
-                self._update_plot([self.time_var, self.time_var], [
-                                  self.output, self.input], 2)
-
-            print(f'Iteration: {k} of {self.cycles - 1}')
+            self._progress.update(k + 1, self.cycles)
+            self.stats.mark('print')
 
             # Updating sent_data
             if k * self.ts > float(self.step_time):
@@ -523,29 +588,41 @@ class Step_response(Base):
             else:
                 sent_data = self.step_min
 
-            # Getting end time
-            et = time.time()
+            # Wait until the next deadline (k + 1) * ts
+            self.scheduler.wait()
+            self.stats.mark('sleep')
+            self.stats.next()
 
-            # Wait for (ts - delta_time) seconds
-            try:
-                time.sleep(self.ts + (st - et))
-            except BaseException:
-                warnings.warn(
-                    "Time spent to append data and update interface was greater than ts. "
-                    "You CANNOT trust time.dat")
-
-        # Turning off the output at the end
-        task_ao.write(0)
-        # Closing task
-        task_ao.close()
-        task_ai.close()
-
-        # Check if data will or not be saved, and save accordingly
-        if self.save:
-            print('\nSaving data ...')
-            # Saving time_var and data
-            self._save_data(self.time_var, 'time.dat')
-            self._save_data(self.input, 'input.dat')
-            self._save_data(self.output, 'output.dat')
-            print('\nData saved ...')
-        return
+        self.stats.stop()
+
+        # Warning if any deadline was missed
+        self._check_deadlines()
+
+        # Exposing data as NumPy arrays
+        self.time_var = self.time_var.view()
+        self.input, self.output = self.input.view(), self.output.view()
+
+    async def step_response_async(self, board='nidaq'):
+        """
+            Asynchronous version of step_response_nidaq/step_response_arduino: the experiment runs in an executor,
+            so the event loop (e.g. a web dashboard or other devices) is not blocked. If the awaiting task is
+            cancelled, the experiment stops and devices and files are closed. Data are not plotted.
+
+        :params:
+            board: 'nidaq' or 'arduino'
+
+        :return:
+            time_var, input and output
+
+        :example:
+            time_var, input, output = await step_response_async('nidaq')
+        """
+
+        if board == 'nidaq':
+            await self._run_async(self.step_response_nidaq)
+        elif board == 'arduino':
+            await self._run_async(self.step_response_arduino)
+        else:
+            raise ValueError(f"Unknown board: {board}. Use 'nidaq' or 'arduino'")
+
+        return self.time_var, self.input, self.output
@@ -2,11 +2,31 @@ from pydaq.send_data import Send_data
 from pydaq.get_data import Get_data
 from pydaq.step_response import Step_response
 from pydaq.utils.base import Base
+from pydaq.orchestrator import Orchestrator
+from pydaq.utils.scheduler import Scheduler, jitter_summary
+from pydaq.utils.decimation import decimate, last_seconds
+from pydaq.utils.buffer import Data_buffer, Block_rebuffer
+from pydaq.utils.writer import new_writer
+from pydaq.utils.data_source import open_data_source, data_range
+from pydaq.utils.serial_protocol import encode_frames, decode_frames, Frame_decoder, encode_timed_frames, \
+    Timed_frame_decoder, encode_burst, decode_burst
+from pydaq.utils.serial_reader import Serial_reader
+from pydaq.utils.device_registry import Device_registry
+from pydaq.utils.simulation import Simulated_nidaq, Virtual_arduino, Signal
+from pydaq.utils.instrumentation import Loop_stats
+from pydaq.utils.progress import Progress
 import pytest
 from nidaqmx.constants import TerminalConfiguration
 import serial
 import matplotlib.pyplot as plt
 import os
+import sys
+import subprocess
+import json
+import time
+import threading
+import asyncio
+import numpy as np
 
 @pytest.fixture()
 def send():
@@ -137,6 +157,19 @@ def test_save_data_send(send):
 
     print('\n[Send_data - _save_data] - Test Passed!')
 
+def test_sent_samples_send(send):
+
+    send.data = np.array([0.0, 1.0, 2.0])
+
+    send.regenerate = False
+    assert send._sent_samples(1, 3).tolist() == [1.0, 2.0]
+
+    # Regenerated data are repeated
+    send.regenerate = True
+    assert send._sent_samples(2, 7).tolist() == [2.0, 0.0, 1.0, 2.0, 0.0]
+
+    print('\n[Send_data - _sent_samples] - Test Passed!')
+
 def test_save_data_step(step):
 
     step.path = os.getcwd()
@@ -144,4 +177,604 @@ def test_save_data_step(step):
     assert os.path.isfile(os.path.join(step.path, 'test.dat')) == True
     os.remove(os.path.join(step.path, 'test.dat'))
 
-    print('\n[Step_response - _save_data] - Test Passed!')
\ No newline at end of file
+    print('\n[Step_response - _save_data] - Test Passed!')
+
+def test_physical_channels_get(get):
+
+    get.channel = 'ai0'
+    assert get._physical_channels() == 'Dev1/ai0'
+    get.channel = 'ai0:7'
+    assert get._physical_channels() == 'Dev1/ai0:7'
+    get.channel = ['ai0', 'Dev2/ai3']
+    assert get._physical_channels() == 'Dev1/ai0,Dev2/ai3'
+
+    print('\n[Get_data - _physical_channels] - Test Passed!')
+
+def test_scheduler():
+
+    # Waits never return before their deadlines (k * ts), which do not drift
+    scheduler = Scheduler(0.01)
+    start = scheduler.start()
+    for k in range(1, 11):
+        scheduler.wait()
+        assert time.perf_counter_ns() >= start + k * scheduler.ts_ns
+    assert scheduler.k == 10 and scheduler.deadline(10) == start + 10 * scheduler.ts_ns
+
+    # Overrunning iteration: deadline is missed and schedule is kept
+    time.sleep(0.03)
+    assert scheduler.wait() is False
+    assert scheduler.missed == 1
+    assert scheduler.max_lateness > 0
+
+    print('\n[Scheduler] - Test Passed!')
+
+def test_jitter_summary():
+
+    jitter = jitter_summary([0, 1, 2, 3], [0.1, 1.1, 2.1, 3.5])
+
+    assert abs(jitter['mean'] - 0.2) < 1e-9
+    assert abs(jitter['max'] - 0.5) < 1e-9
+    assert 0.1 < jitter['p99'] <= 0.5
+
+    print('\n[jitter_summary] - Test Passed!')
+
+def test_decimation():
+
+    x = np.arange(36000) * 0.1
+    y = np.sin(x)
+    y[12345] = 10  # Spike
+
+    for method in ['minmax', 'lttb']:
+        x_dec, y_dec = decimate(x, y, 1000, method)
+        assert len(x_dec) <= 1000
+        assert max(y_dec) == 10
+        assert np.all(np.diff(x_dec) > 0)
+
+    x_win, y_win = last_seconds(x, y, 10)
+    assert x_win[-1] - x_win[0] <= 10
+
+    print('\n[decimation] - Test Passed!')
+
+def test_data_buffer():
+
+    buffer = Data_buffer(3)
+    buffer.append(1)
+    buffer.extend([2, 3])
+    assert list(buffer) == [1, 2, 3]
+    with pytest.raises(IndexError):
+        buffer.append(4)
+
+    # Ring mode keeps the last samples, as a zero-copy view
+    ring = Data_buffer(3, ring=True)
+    ring.extend(np.arange(10))
+    ring.append(10)
+    assert list(ring.view()) == [8, 9, 10]
+    assert np.shares_memory(ring.view(), ring._array)
+
+    # Multi-channel buffer (channels x samples)
+    channels = Data_buffer(5, channels=2)
+    channels.append([1, 2])
+    assert np.asarray(channels).shape == (2, 1)
+
+    print('\n[Data_buffer] - Test Passed!')
+
+def test_writers(tmp_path):
+
+    for save_format in ['dat', 'raw', 'npy']:
+        writer = new_writer(save_format, str(tmp_path), chunk_size=2).open()
+        for k in range(5):
+            writer.write('data', [k, 2 * k])
+        writer.write_block('time', np.arange(5))
+        writer.close()
+        assert writer.samples == {'data': 5, 'time': 5}
+
+    assert np.loadtxt(os.path.join(tmp_path, 'data.dat')).shape == (5, 2)
+    assert np.load(os.path.join(tmp_path, 'data.npy'))[-1].tolist() == [4, 8]
+    assert np.fromfile(os.path.join(tmp_path, 'time.bin'), '<f8').tolist() == [0, 1, 2, 3, 4]
+
+    print('\n[Data_writer] - Test Passed!')
+
+def test_hdf5_writer(tmp_path):
+
+    h5py = pytest.importorskip('h5py')
+
+    writer = new_writer('hdf5', str(tmp_path), chunk_size=2, metadata={'ts': 0.5}).open()
+    for k in range(5):
+        writer.write('time', k * 0.5)
+        writer.write('data', [k, 2 * k])
+    writer.close()
+
+    with h5py.File(writer.filename, 'r') as file:
+        assert file.attrs['ts'] == 0.5
+        assert file['time'][1:3].tolist() == [0.5, 1.0]
+        assert file['data/ch1'][:].tolist() == [0, 2, 4, 6, 8]
+
+    print('\n[Hdf5_writer] - Test Passed!')
+
+def test_data_source(tmp_path):
+
+    data = np.linspace(-1, 4, 1000)
+
+    # Text files, read in blocks
+    np.savetxt(tmp_path / 'data.dat', data)
+    source = open_data_source(str(tmp_path / 'data.dat'), block_size=64)
+    assert len(source) == 1000
+    assert np.isclose(source[999], 4) and np.allclose(source[60:70], data[60:70])
+    assert np.allclose(np.asarray(source), data)
+    assert np.allclose(data_range(source), (-1, 4))
+
+    # Blank lines are not counted as samples
+    (tmp_path / 'blank.dat').write_bytes(b'\n1\n2\r\n \n3\n\n')
+    source = open_data_source(str(tmp_path / 'blank.dat'), block_size=2)
+    assert len(source) == 3 and source[2] == 3 and np.asarray(source).tolist() == [1, 2, 3]
+
+    # NumPy and raw binary files, memory-mapped
+    np.save(tmp_path / 'data.npy', data)
+    data.astype('<f8').tofile(tmp_path / 'data.bin')
+    for name in ['data.npy', 'data.bin']:
+        source = open_data_source(str(tmp_path / name))
+        assert isinstance(source, np.memmap) and np.allclose(source, data)
+
+    print('\n[open_data_source] - Test Passed!')
+
+def test_serial_protocol():
+
+    frames = encode_frames([0, 1023, 0xA5A5, 300], first_seq=254)
+
+    # Partial frames (beginning of a read) are skipped and incomplete ones are kept
+    seq, samples, consumed = decode_frames(b'\x01\xa5' + frames[:-2])
+    assert seq.tolist() == [254, 255, 0] and samples.tolist() == [0, 1023, 0xA5A5]
+    assert consumed == len(frames) - 5 + 2
+
+    # Stream decoding (bytes split between reads) and lost frames
+    decoder = Frame_decoder()
+    data = encode_frames(np.arange(600) % 1024)
+    data = data[:100] + data[105:]
+    samples = np.concatenate([decoder.decode(data[k:k + 7]) for k in range(0, len(data), 7)])
+    assert len(samples) == 599 and decoder.lost == 1 and 20 not in samples
+
+    print('\n[serial_protocol] - Test Passed!')
+
+def test_serial_reader():
+
+    class Port:  # Serial port with received bytes (read in small parts)
+        def __init__(self, data):
+            self.data, self.timeout = data, None
+
+        @property
+        def in_waiting(self):
+            return min(len(self.data), 37)
+
+        def read(self, n):
+            if not self.data:
+                time.sleep(0.01)
+            data, self.data = self.data[:n], self.data[n:]
+            return data
+
+    blocks = []
+    reader = Serial_reader(Port(encode_frames(np.arange(1000) % 1024)), 'binary')
+    reader.register_callback(lambda timestamps, samples: blocks.append(samples))
+    reader.start()
+    time.sleep(0.5)
+    timestamps, samples = reader.read(timeout=1.0)
+    reader.stop()
+
+    # Every sample is delivered, in order, with its host timestamp
+    assert samples.tolist() == list(range(1000)) and len(timestamps) == 1000
+    assert np.all(np.diff(timestamps) >= 0) and len(np.concatenate(blocks)) == 1000
+    assert reader.overflows == 0 and reader.decoder.lost == 0
+
+    print('\n[Serial_reader] - Test Passed!')
+
+def test_timed_frames():
+
+    # Board timestamps every 20 ms, wrapping around (32-bit micros()) during the session
+    micros = np.arange(300) * 20000 + 2**32 - 1000000
+    data = encode_timed_frames(np.arange(300), micros, first_seq=5)
+
+    decoder = Timed_frame_decoder()
+    blocks = [decoder.decode_timed(data[k:k + 11]) for k in range(0, len(data), 11)]
+    timestamps = np.concatenate([block[0] for block in blocks])
+    samples = np.concatenate([block[1] for block in blocks])
+
+    assert samples.tolist() == list(range(300)) and decoder.lost == 0
+    assert timestamps[0] == 0 and np.allclose(np.diff(timestamps), 0.02)
+
+    # Sample periods limited by the serial link (one frame per sample) and by Timer1
+    g = Get_data(ts=0.0005, protocol='timed', plot=False, save=False)
+    for ts in [0.0005, 5.0]:
+        g.ts = ts
+        with pytest.raises(ValueError):
+            g.get_data_arduino()
+    g._check_arduino_period(0.001)
+    g._check_arduino_period(4.0)
+
+    print('\n[Timed_frame_decoder] - Test Passed!')
+
+def test_burst(base):
+
+    class Port:  # Serial port that answers a burst command
+        def __init__(self):
+            self.data, self.commands, self.timeout = b'', [], None
+
+        def reset_input_buffer(self):
+            self.data = b''
+
+        def write(self, command):
+            self.commands.append(command)
+            self.data = encode_burst(np.arange(500) * 2, 6500)
+
+        def read(self, n):
+            data, self.data = self.data[:n], self.data[n:]
+            return data
+
+    base.ser = Port()
+    samples, duration = base._burst_arduino(500, adc_prescaler=16)
+
+    assert base.ser.commands == [b'B500,16\n']
+    assert samples.dtype == np.uint16 and samples.tolist() == list(range(0, 1000, 2))
+    assert duration == 0.0065
+
+    # Corrupted blocks are detected
+    with pytest.raises(ValueError):
+        decode_burst(encode_burst([1, 2, 3], 100)[:-1] + b'\x00')
+
+    print('\n[_burst_arduino] - Test Passed!')
+
+def test_block_rebuffer():
+
+    rebuffer = Block_rebuffer(4)
+    blocks = []
+    for k in range(0, 21, 3):
+        blocks += rebuffer.push(np.arange(k, k + 3) * 0.5, np.vstack([np.arange(k, k + 3)] * 2))
+
+    # Blocks of 4 samples (2 channels), in order, and one incomplete block kept
+    assert [block[1][0].tolist() for block in blocks] == [list(range(k, k + 4)) for k in range(0, 20, 4)]
+    assert blocks[0][0].tolist() == [0, 0.5, 1, 1.5] and blocks[0][1].shape == (2, 4)
+    assert rebuffer._count == 1
+
+    print('\n[Block_rebuffer] - Test Passed!')
+
+def test_run_async(base):
+
+    iterations = []
+
+    def loop():  # Main loop that runs until it is stopped
+        while not base._stop_event.is_set():
+            iterations.append(1)
+            time.sleep(0.01)
+
+    async def session():
+        task = asyncio.create_task(base._run_async(lambda: base._run_loop(loop, None)))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    base.plot = True
+    asyncio.run(session())
+
+    # Loop was stopped by cancellation and plot setting was restored
+    count = len(iterations)
+    time.sleep(0.05)
+    assert 0 < count == len(iterations) and base.plot
+
+    print('\n[_run_async] - Test Passed!')
+
+def test_orchestrator():
+
+    class Source:  # Device that takes delay seconds to open and acquires a ramp (time) every 10 ms,
+                   # from first seconds after its start, until last seconds
+        def __init__(self, delay, channels=1, first=0.0, last=10.0):
+            self.delay, self.channels, self.first, self.last = delay, channels, first, last
+            self.start_trigger, self.start_sync, self.start_time = None, None, None
+
+        def stream_arduino(self, block_size=None):
+            time.sleep(self.delay)
+            self.start_sync.wait_start(self)
+            self.start_time = time.perf_counter()
+            self.start_sync.started(self)
+            for k in range(int(round(self.first / 0.01)), int(round(self.last / 0.01)), 10):
+                t = np.arange(k, k + 10) * 0.01
+                yield t, np.vstack([t] * self.channels) if self.channels > 1 else t
+
+    o = Orchestrator(ts=0.01, session_duration=0.5, plot=False)
+    o._add_source('a', 'arduino', Source(0.05), None)
+    o._add_source('b', 'arduino', Source(0.3, channels=2), None)
+    o.get_data()
+
+    # Devices started together and data are aligned on the common time base
+    assert len(o.time_var) == 51 and max(o.offsets.values()) < 0.05
+    assert np.allclose(o.data['a'], o.time_var, atol=0.05) and o.data['b'].shape == (2, 51)
+    assert o.legend == ['a', 'b/0', 'b/1']
+
+    # Common time base starts when every device has data (first sample of c at 0.1 s), and is never extrapolated
+    o = Orchestrator(ts=0.01, session_duration=0.5, plot=False)
+    o._add_source('a', 'arduino', Source(0.0), None)
+    o._add_source('c', 'arduino', Source(0.0, first=0.1), None)
+    o.get_data()
+    assert len(o.time_var) == 51 and np.allclose(np.diff(o.data['c']), 0.01, atol=0.005)
+
+    o._add_source('d', 'arduino', Source(0.0, last=0.3), None)
+    with pytest.warns(UserWarning, match='merged session'):
+        o.get_data()
+    assert len(o.time_var) < 25 and np.allclose(np.diff(o.data['d']), 0.01, atol=0.005)
+
+    class Endless(Source):  # Device that streams until it is stopped
+        def __init__(self):
+            super().__init__(0.0)
+            self._stream_stop = threading.Event()
+
+        def stream_arduino(self, block_size=None):
+            self.start_sync.wait_start(self)
+            self.start_time = time.perf_counter()
+            k = 0
+            while not self._stream_stop.is_set():
+                time.sleep(0.1)
+                yield np.arange(k, k + 10) * 0.01, np.zeros(10)
+                k += 10
+
+    class Failing(Source):  # Device that fails after the synchronized start, before its first block
+        def stream_arduino(self, block_size=None):
+            self.start_sync.wait_start(self)
+            time.sleep(0.2)
+            raise OSError('Device disconnected')
+            yield
+
+    # Session stopped (not waiting for the first block of the failed device)
+    o = Orchestrator(ts=0.01, session_duration=0.5, plot=False)
+    endless = Endless()
+    o._add_source('a', 'arduino', endless, None)
+    o._add_source('e', 'arduino', Failing(0.0), None)
+    with pytest.raises(RuntimeError, match='device e'):
+        o.get_data()
+    assert not endless._stream_stop.is_set()
+
+    print('\n[Orchestrator] - Test Passed!')
+
+def test_import_time():
+
+    # Importing pydaq (and creating an object) in a fresh interpreter must not import GUI, plotting
+    # or hardware back ends, and must be fast
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "from pydaq.get_data import Get_data\n"
+            "from pydaq.send_data import Send_data\n"
+            "from pydaq.step_response import Step_response\n"
+            "from pydaq.utils.base import Base\n"
+            "Base()\n"
+            "print(time.perf_counter() - start)\n"
+            "print(','.join(m for m in ['PySimpleGUI', 'matplotlib.pyplot', 'nidaqmx', 'serial'] if m in sys.modules))")
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    import_time, loaded = result.stdout.splitlines()
+
+    assert loaded == ''
+    assert float(import_time) < 1.0
+
+    print('\n[Import time] - Test Passed!')
+
+def test_device_registry():
+
+    scans = []
+
+    def scan_serial():  # Slow hardware scan
+        scans.append(time.perf_counter())
+        time.sleep(0.05)
+        return [('COM3', 'Arduino Uno (COM3)', 'COM3')] * len(scans)
+
+    registry = Device_registry(ttl=0.2, monitor=False, scanners={'serial': scan_serial})
+    changes = []
+    registry.register_callback(lambda kind, devices: changes.append(len(devices)))
+
+    # First query scans, next ones are served from the cache
+    assert registry.com_ports() == [('COM3', 'Arduino Uno (COM3)', 'COM3')]
+    for _ in range(100):
+        registry.com_ports()
+    assert len(scans) == 1
+
+    # Stale lists are returned at once and refreshed in the background
+    time.sleep(0.25)
+    assert len(registry.com_ports()) == 1
+    deadline = time.perf_counter() + 5.0
+    while registry.scans['serial'] < 2 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert len(registry.com_ports()) == 2 and len(scans) == 2 and changes == [1, 2]
+
+    # Forced scan and invalidation
+    assert len(registry.com_ports(max_age=0)) == 3
+    registry.invalidate()
+    assert len(registry.com_ports()) == 4 and registry.scans['serial'] == 4
+
+    # Objects share the registry: creating them does not scan the hardware
+    base = Base()
+    base.registry = registry
+    assert base.com_ports == ['Arduino Uno (COM3)'] * 4 and base._com_port_name('Arduino Uno (COM3)') == 'COM3'
+    assert len(scans) == 4
+
+    print('\n[Device_registry] - Test Passed!')
+
+def spy(writer, writes):
+    """ Writer that records the number of samples of each write """
+
+    write_many_sample = writer.write_many_sample
+    def write(data, **kwargs):
+        writes.append(len(data))
+        return write_many_sample(data, **kwargs)
+    writer.write_many_sample = write
+
+    return writer
+
+def test_simulated_nidaq():
+
+    nidaq = Simulated_nidaq(signal=Signal('sine', 2.0, 5.0), noise=0.01, seed=0)
+
+    # Hardware-timed acquisition follows the simulated sample clock
+    g = Get_data(channel='ai0:1', ts=0.001, session_duration=0.2, plot=False, save=False, hardware_timed=True)
+    g.nidaq_backend = nidaq
+    start = time.perf_counter()
+    g.get_data_nidaq()
+    assert g.data.shape == (2, 201) and time.perf_counter() - start >= 0.19
+    assert np.allclose(g.data[0], 2.0 * np.sin(2 * np.pi * 5.0 * g.time_var), atol=0.1)
+
+    # Hardware-timed output, without underflows
+    s = Send_data(data=np.linspace(0, 1, 200), ts=0.001, plot=False, save=False, hardware_timed=True, block_size=50)
+    s.nidaq_backend = nidaq
+    s.send_data_nidaq()
+    assert s.underflows == 0 and len(s.time_var) == 200 and np.allclose(s.sent, s.data)
+
+    # Regenerated periods are written only once
+    s = Send_data(data=np.linspace(0, 1, 100), ts=0.0005, plot=False, save=False, hardware_timed=True,
+                  regenerate=True, repetitions=5)
+    s.nidaq_backend, writes = nidaq, []
+    writer = s._ao_writer
+    s._ao_writer = lambda task: spy(writer(task), writes)
+    s.send_data_nidaq()
+    assert writes == [100] and len(s.sent) == 500 and np.allclose(s.sent[400:], s.data)
+
+    # Analog output wired to analog input (loopback)
+    st = Step_response(ts=0.01, session_duration=0.2, step_time=0.1, plot=False)
+    st.save = False
+    st.nidaq_backend = Simulated_nidaq()
+    st.step_response_nidaq()
+    assert np.allclose(st.output, st.input)
+
+    print('\n[Simulated_nidaq] - Test Passed!')
+
+@pytest.mark.filterwarnings('ignore')
+def test_run_loop_plot(monkeypatch):
+
+    # Plots rendered by the main thread (Agg backend, no display) while loops run in a worker thread
+    plt.switch_backend('Agg')
+    monkeypatch.setattr('matplotlib.use', lambda backend: None)
+
+    for hardware_timed in [False, True]:
+        g = Get_data(ts=0.001, session_duration=0.2, plot=True, save=False, hardware_timed=hardware_timed)
+        g.nidaq_backend = Simulated_nidaq()
+        g.get_data_nidaq()
+        assert g.data.shape == (201,) and len(g.lines) == 1 and g.stats.events['plot']
+        plt.close('all')
+
+    print('\n[_run_loop - plot] - Test Passed!')
+
+@pytest.mark.skipif(os.name == 'nt', reason='Virtual Arduino requires pseudo-terminals')
+def test_virtual_arduino():
+
+    for protocol in ['ascii', 'binary', 'timed']:
+        with Virtual_arduino(protocol, signal=Signal('constant', amplitude=512)) as arduino:
+            g = Get_data(com=arduino.port, ts=0.01, session_duration=0.1, plot=False, save=False, protocol=protocol)
+            g.get_data_arduino()
+            assert len(g.data) == 11 and np.allclose(g.data, 512 * 5 / 1024)
+            assert g.stats.summary()['io']['count'] == g.stats.k > 0
+            if protocol != 'timed':  # Host timestamps of the received samples
+                assert np.all(np.diff(g.time_measured) >= 0) and g.time_measured[-1] < 1.0
+
+    # Port closed if the session fails
+    with Virtual_arduino('ascii') as arduino:
+        g = Get_data(com=arduino.port, ts=0.01, session_duration=0.1, plot=False, save=False)
+        g._read_arduino = lambda: 1 / 0
+        with pytest.raises(ZeroDivisionError):
+            g.get_data_arduino()
+        assert not g.ser.is_open and g.serial_reader is None
+
+    with Virtual_arduino('timed', signal=Signal('ramp', 500, 1.0, 512)) as arduino:
+        g = Get_data(com=arduino.port, plot=False, save=False, protocol='timed')
+        g.get_data_arduino_burst(samples=100, adc_prescaler=16)
+        assert len(g.data) == 100 and np.all(np.diff(g.data) >= 0)
+
+    print('\n[Virtual_arduino] - Test Passed!')
+
+def test_loop_stats(tmp_path):
+
+    stats = Loop_stats(10)
+    phases = []
+    stats.register_hook(lambda phase, k, start, end: phases.append((phase, k)))
+    stats.start()
+    for k in range(5):
+        time.sleep(0.002)
+        stats.mark('io')
+        stats.mark('buffer')
+        stats.next()
+    stats.mark('io')  # Interrupted iteration
+    stats.stop()
+    stats.record('plot', 0.0, 0.01)
+
+    summary = stats.summary()
+    assert stats.k == 6 and summary['io']['count'] == 6 and summary['io']['max'] >= 0.002
+    assert summary['plot'] == {'count': 1, 'total': 0.01, 'mean': 0.01, 'p50': 0.01, 'p99': 0.01, 'max': 0.01}
+    assert stats.slowest()[0] == 'plot' and phases[:2] == [('io', 0), ('buffer', 0)]
+    assert stats.histogram('io')[0].sum() == 6
+
+    # Trace export
+    stats.to_csv(tmp_path / 'trace.csv')
+    stats.to_json(tmp_path / 'trace.json')
+    assert len(open(tmp_path / 'trace.csv').readlines()) == 7
+    assert len(json.load(open(tmp_path / 'trace.json'))['trace']['io']) == 6
+
+    # Loops record their phases
+    g = Get_data(ts=0.005, session_duration=0.05, plot=False, save=False)
+    g.nidaq_backend = Simulated_nidaq()
+    g.get_data_nidaq()
+    assert g.stats.k == 11 and g.stats.summary()['sleep']['total'] > 0.03
+
+    # Hardware-timed loops record one iteration per block
+    g = Get_data(ts=0.001, session_duration=0.2, plot=False, save=False, hardware_timed=True, block_size=50)
+    g.nidaq_backend = Simulated_nidaq()
+    g.get_data_nidaq()
+    assert g.stats.k == 5 and g.stats.summary()['io']['count'] == 5 and 'save' in g.stats.summary()
+    assert len(g.stats.durations) == 5  # Sized by number of blocks, not samples
+
+    s = Send_data(data=np.zeros(10), ts=0.001, plot=False, hardware_timed=True, block_size=1, regenerate=True,
+                  repetitions=30)
+    s.nidaq_backend = Simulated_nidaq()
+    s.send_data_nidaq()
+    assert s.stats.k > len(s.data) and s.stats.summary()['sleep']['count'] == s.stats.k
+
+    stats = Loop_stats(0)
+    stats.start()
+    stats.mark('io')
+    stats.next()
+    stats.mark('io')
+    stats.stop()
+    assert stats.k == 2
+
+    # Restarted recordings start from cleared rows
+    stats.start()
+    stats.mark('io')
+    stats.next()
+    stats.stop()
+    assert stats.k == 1 and not stats.durations[1:].any()
+
+    print('\n[Loop_stats] - Test Passed!')
+
+def test_progress(capsys):
+
+    # Updates are throttled, and the last one is always reported
+    updates = []
+    progress = Progress(lambda done, total: updates.append(done), max_rate=1e-3)
+    for k in range(1000):
+        progress.update(k + 1, 1000)
+    progress.close()
+    assert updates == [1, 1000]
+
+    progress = Progress(lambda done, total: updates.append(done), max_rate=1e-3)
+    progress.update(1, 1000)
+    progress.update(500, 1000)
+    progress.close()
+    assert updates[-2:] == [1, 500]
+
+    # Loops report progress (at most 10 updates per second) or nothing at all
+    g = Get_data(ts=0.001, session_duration=0.3, plot=False, save=False)
+    g.nidaq_backend = Simulated_nidaq()
+    g.progress, updates = lambda done, total: updates.append((done, total)), []
+    start = time.perf_counter()
+    g.get_data_nidaq()
+    elapsed = time.perf_counter() - start
+    assert len(updates) <= 10 * elapsed + 2 and updates[-1] == (301, 301)
+
+    capsys.readouterr()
+    g.progress = None
+    g.get_data_nidaq()
+    assert 'Samples' not in capsys.readouterr().out
+
+    print('\n[Progress] - Test Passed!')
@@ -0,0 +1,119 @@
+import time
+import asyncio
+import numpy as np
+from pydaq.utils.serial_protocol import new_decoder
+from pydaq.utils.serial_reader import Serial_reader
+
+
+class Async_serial:
+    """
+        asyncio reader of a serial port (e.g. an Arduino), so that several devices and other I/O can
+        share one event loop.
+
+        Where the port has a file descriptor (Linux, macOS), the event loop is notified when data arrive
+        (loop.add_reader) and no thread is used. Otherwise (e.g. Windows), a Serial_reader thread reads
+        the port and passes blocks to the event loop. Blocks (timestamps, samples) wait in a bounded
+        asyncio queue; if the consumer does not keep up, new samples are discarded and counted (overflows).
+
+        :params:
+            ser: open serial.Serial port
+            protocol: 'ascii', 'binary' or 'timed' (see pydaq/utils/serial_protocol.py)
+            max_blocks: maximum number of blocks waiting in the queue
+
+        :example:
+            reader = Async_serial(ser, 'binary')
+            reader.start()  # From a coroutine
+            timestamps, samples = await reader.read()
+            reader.close()
+    """
+
+    def __init__(self, ser, protocol='ascii', max_blocks=4096):
+
+        self.ser = ser
+        self.protocol = protocol
+        self.max_blocks = max_blocks
+        self.decoder = new_decoder(protocol)
+
+        self._loop = None
+        self._queue = None
+        self._fd = None
+        self._thread_reader = None
+
+        # Number of received samples, samples discarded because the queue was full and error raised
+        # while reading
+        self.samples = 0
+        self.overflows = 0
+        self.error = None
+
+    def start(self):
+        """ Method to start reading (must be called from the event loop thread) """
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_blocks)
+
+        try:
+            self._fd = self.ser.fileno()
+            self.ser.timeout = 0  # Non-blocking reads
+            self._loop.add_reader(self._fd, self._on_readable)
+        except (AttributeError, NotImplementedError, ValueError, OSError):
+            # No file descriptor (or no add_reader support): reading in a thread
+            self._fd = None
+            self._thread_reader = Serial_reader(self.ser, self.protocol, max_blocks=None)
+            self._thread_reader.decoder = self.decoder
+            self._thread_reader.register_callback(
+                lambda timestamps, samples: self._loop.call_soon_threadsafe(self._put, (timestamps, samples)))
+            self._thread_reader.start()
+
+        return self
+
+    def close(self):
+        """ Method to stop reading (the port is not closed) """
+
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._thread_reader is not None:
+            reader, self._thread_reader = self._thread_reader, None
+            reader.stop()
+
+    async def read(self):
+        """ Samples received since the last call and their timestamps (waits for at least one sample) """
+
+        blocks = [await self._queue.get()]
+        while not self._queue.empty():
+            blocks.append(self._queue.get_nowait())
+
+        if self.error is not None:
+            raise self.error
+
+        timestamps, samples = zip(*blocks)
+
+        return np.concatenate(timestamps), np.concatenate(samples)
+
+    def _on_readable(self):
+        """ Called by the event loop when there are bytes to be read """
+
+        try:
+            data = self.ser.read(max(1, self.ser.in_waiting))
+        except BaseException as e:
+            # Waking up read(), which raises the error
+            self.error = e
+            self.close()
+            self._put((np.zeros(0), np.zeros(0, dtype=np.uint16)), force=True)
+            return
+
+        timestamps, samples = self.decoder.decode_block(data, time.perf_counter())
+        if len(samples):
+            self._put((timestamps, samples))
+
+    def _put(self, block, force=False):
+        """ Method to queue a block, counting discarded samples if the queue is full """
+
+        if force and self._queue.full():
+            self._queue.get_nowait()
+
+        try:
+            self._queue.put_nowait(block)
+            self.samples += len(block[1])
+        except asyncio.QueueFull:
+            self.overflows += len(block[1])
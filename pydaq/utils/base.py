@@ -1,12 +1,29 @@
 import os
-import PySimpleGUI as sg
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import serial
-import serial.tools.list_ports
+import time
+import asyncio
+import threading
+import datetime
+import warnings
 import numpy as np
-import nidaqmx
-from nidaqmx.constants import TerminalConfiguration
+from pydaq.utils.lazy import lazy_import
+from pydaq.utils.device_registry import registry
+from pydaq.utils.scheduler import jitter_summary
+from pydaq.utils.decimation import decimate, last_seconds
+from pydaq.utils.writer import new_writer
+from pydaq.utils.serial_protocol import TIMED_FRAME_SIZE, BURST_HEADER_SIZE, baudrates, burst_size, decode_burst
+from pydaq.utils.serial_reader import Serial_reader
+from pydaq.utils.instrumentation import Loop_stats
+from pydaq.utils.progress import Progress
+
+# GUI, plotting and hardware back ends are imported on first use
+sg = lazy_import('PySimpleGUI')
+mpl = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+serial = lazy_import('serial')
+nidaqmx = lazy_import('nidaqmx')
+constants = lazy_import('nidaqmx.constants')
+stream_readers = lazy_import('nidaqmx.stream_readers')
+stream_writers = lazy_import('nidaqmx.stream_writers')
 
 
 class Base:
@@ -16,10 +33,147 @@ class Base:
 
     def __init__(self):
 
-        # Terminal configuration Map
-        self.term_map = {'Diff': TerminalConfiguration.DIFF,
-                         'RSE': TerminalConfiguration.RSE,
-                         'NRSE': TerminalConfiguration.NRSE}
+        # Terminal configuration ('Diff', 'RSE', 'NRSE' or NI-DAQmx TerminalConfiguration)
+        self._terminal = None
+
+        # Serial ports and NIDAQ devices (cached by the device registry shared by all objects)
+        self.registry = registry
+        self._device_names, self._device_categories, self._device_type = [], [], []
+
+        # NIDAQ back end: None (NI-DAQmx driver) or a simulated one (see pydaq/utils/simulation.py)
+        self.nidaq_backend = None
+
+        # Maximum plot refresh rate (frames per second)
+        self.plot_fps = 30
+
+        # Saving format ('dat', 'raw', 'npy' or 'hdf5'), samples per chunk written to disk and
+        # writer used during a session
+        self.save_format = 'dat'
+        self.chunk_size = 1024
+        self.writer = None
+
+        # Live plot decimation ('minmax', 'lttb' or None), number of plotted points per line
+        # (None: based on axes width, in pixels) and sliding window (in seconds, None: whole session)
+        self.plot_decimation = 'minmax'
+        self.plot_points = None
+        self.plot_window = None
+
+        # Arduino serial protocol ('ascii': pydaq/arduino_code sketch, 'binary': pydaq/arduino_binary sketch,
+        # 'timed': pydaq/arduino_timed sketch) and baud rate (None: default baud rate of the protocol)
+        self.protocol = 'ascii'
+        self.baudrate = None
+
+        # Thread that continuously reads the serial port (see _open_serial)
+        self.serial_reader = None
+
+        # Samples published to the plot by the main loop, and event used to stop it
+        self._plot_count = 0
+        self._stop_event = threading.Event()
+
+        # Event set when an asynchronous session (_run_async) is cancelled
+        self._cancel_event = threading.Event()
+
+        # Instrumentation of the last main loop (phase durations, see pydaq/utils/instrumentation.py) and
+        # functions called for every recorded phase (e.g. external profilers, see Loop_stats.register_hook)
+        self.stats = None
+        self.stats_hooks = []
+
+        # Progress reporting of main loops ('print', 'logging', 'tqdm', a function(done, total) or None to
+        # disable it) and maximum number of progress updates per second (see pydaq/utils/progress.py)
+        self.progress = 'print'
+        self.progress_rate = 10.0
+        self._progress = Progress(None)
+
+    @property
+    def term_map(self):
+        """ Terminal configuration Map """
+
+        return {'Diff': constants.TerminalConfiguration.DIFF,
+                'RSE': constants.TerminalConfiguration.RSE,
+                'NRSE': constants.TerminalConfiguration.NRSE}
+
+    @property
+    def terminal(self):
+        """ Terminal configuration (NI-DAQmx TerminalConfiguration). Can be defined as 'Diff', 'RSE' or 'NRSE' """
+
+        if isinstance(self._terminal, str):
+            return self.term_map[self._terminal]
+
+        return self._terminal
+
+    @terminal.setter
+    def terminal(self, terminal):
+
+        if isinstance(terminal, str) and terminal not in ['Diff', 'RSE', 'NRSE']:
+            raise KeyError(terminal)
+
+        self._terminal = terminal
+
+    @property
+    def com_ports(self):
+        """ Description of available serial (COM) ports (cached by the device registry) """
+
+        return [description for _, description, _ in self.registry.com_ports()]
+
+    def _com_port_name(self, description):
+        """ Name of the serial port described by description (e.g. selected in a GUI) """
+
+        for name, port_description, _ in self.registry.com_ports():
+            if port_description == description:
+                return name
+
+        raise ValueError(f'Serial port {description} is not available')
+
+    @property
+    def device_names(self):
+        """ Names of NIDAQ devices """
+
+        self._nidaq_info()
+        return self._device_names
+
+    @property
+    def device_categories(self):
+        """ Product categories of NIDAQ devices """
+
+        self._nidaq_info()
+        return self._device_categories
+
+    @property
+    def device_type(self):
+        """ Product types of NIDAQ devices """
+
+        self._nidaq_info()
+        return self._device_type
+
+    @property
+    def local_system(self):
+        """ NI-DAQmx local system """
+
+        return nidaqmx.system.System.local()
+
+    def _new_task(self):
+        """ New NI-DAQmx task (of the simulated back end, if defined) """
+
+        if self.nidaq_backend is not None:
+            return self.nidaq_backend.Task()
+
+        return nidaqmx.Task()
+
+    def _ai_reader(self, task):
+        """ Reader of blocks of samples from all analog input channels of task """
+
+        if self.nidaq_backend is not None:
+            return self.nidaq_backend.AnalogMultiChannelReader(task.in_stream)
+
+        return stream_readers.AnalogMultiChannelReader(task.in_stream)
+
+    def _ao_writer(self, task):
+        """ Writer of blocks of samples to the analog output channel of task """
+
+        if self.nidaq_backend is not None:
+            return self.nidaq_backend.AnalogSingleChannelWriter(task.out_stream, auto_start=False)
+
+        return stream_writers.AnalogSingleChannelWriter(task.out_stream, auto_start=False)
 
     def _range_error(self):
         """ Out of range window"""
@@ -84,17 +238,87 @@ class Base:
                 'Defined path does not exists! Please redefine path and run the code again')
             return
 
-    def _open_serial(self):
-        """ Opening ports for serial communication """
+    def _open_serial(self, reader=False):
+        """ Opening ports for serial communication. If reader, a Serial_reader thread
+            continuously reads the port, so that no sample is lost """
 
         self.ser = serial.Serial()
         self.ser.dtr = True
-        self.ser.baudrate = (9600)
+        self.ser.baudrate = self.baudrate or baudrates[self.protocol]
         self.ser.port = self.com_port  # Defining port
 
         if not self.ser.isOpen():  # Open port if not openned
             self.ser.open()  # Opening port
 
+        if reader:
+            self.serial_reader = Serial_reader(self.ser, self.protocol).start()
+
+    def _close_serial(self):
+        """ Closing serial port (and reader thread) """
+
+        reader, self.serial_reader = self.serial_reader, None
+        try:
+            if self.protocol == 'timed':
+                self.ser.write(b'S')  # Stopping timed sampling
+
+            if reader is not None:
+                reader.stop()
+                if reader.overflows or reader.decoder.lost:
+                    warnings.warn(f'{reader.overflows} samples were discarded (reader queue full) and '
+                                  f'{reader.decoder.lost} readings were lost (serial communication)')
+        finally:
+            self.ser.close()
+
+    def _read_arduino(self):
+        """ Method to read the last Arduino reading (ADC value) and its host timestamp (time.perf_counter, in
+            seconds, when it was received), from the serial reader thread (see _open_serial) """
+
+        # Newest of the samples received since the last call (waiting for one, if there is none)
+        timestamps, samples = self.serial_reader.read(timeout=5.0)
+        if len(samples) == 0:
+            self.serial_reader.stop()  # Raises reader errors, if any
+            raise TimeoutError(f'No data received from {self.com_port}')
+
+        return int(samples[-1]), float(timestamps[-1])
+
+    def _set_arduino_rate(self, ts):
+        """ Method to start timed sampling (protocol='timed') with sample period ts, in seconds.
+            The Arduino timer interrupt, not the host, defines the sample instants """
+
+        self._check_arduino_period(ts)
+        self.ser.write(f'R{int(round(ts * 1e6))}\n'.encode())
+
+    def _check_arduino_period(self, ts):
+        """ Method to check if ts fits timed sampling (protocol='timed'): shorter periods overflow the
+            serial link (one frame per sample) and longer ones do not fit Timer1 (16 bits, prescaler 1024) """
+
+        ts_min = TIMED_FRAME_SIZE * 10 / (self.baudrate or baudrates['timed'])
+        ts_max = 65536 * 1024 / 16e6
+
+        if not ts_min <= ts <= ts_max:
+            raise ValueError(f'Timed sampling requires {ts_min * 1e3:.3f} ms <= ts <= {ts_max:.3f} s '
+                             f'(ts = {ts} s)')
+
+    def _burst_arduino(self, samples, adc_prescaler=None):
+        """ Method to capture samples into the Arduino SRAM, at maximum ADC rate, and upload them at
+            once (protocol='timed' sketch). adc_prescaler (2 to 128, None: Arduino default) reduces
+            the ADC conversion time. Returns samples (ADC values) and capture duration, in seconds """
+
+        # Sending trigger command
+        self.ser.reset_input_buffer()
+        self.ser.write(f'B{int(samples)},{int(adc_prescaler or 0)}\n'.encode())
+
+        # Reading block header and then the whole block, in one transfer
+        self.ser.timeout = 5.0
+        header = self.ser.read(BURST_HEADER_SIZE)
+        if len(header) < BURST_HEADER_SIZE:
+            raise TimeoutError(f'No burst received from {self.com_port}')
+        data = header + self.ser.read(burst_size(header) - len(header))
+
+        samples, duration = decode_burst(data)
+
+        return samples, duration / 1e6
+
     def _start_updatable_plot(self):
         """ Method to start updatable plot """
 
@@ -114,45 +338,289 @@ class Base:
         plt.ylabel("Voltage")
         plt.grid()
         self.line = self.ax.plot([], [])
+
+        # Lines updated by _update_plot and background used for blitting
+        self.lines = []
+        self._background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
         plt.show()
 
+    def _run_loop(self, loop, plot_data):
+        """ Method to run loop (main loop of an acquisition/sending method).
+
+            If self.plot, loop runs in a background thread, publishing the number of samples
+            available in self._plot_count, while this (main) thread renders the plot at most
+            self.plot_fps times per second using plot_data(n) -> (x_value, y_value, number_of_inputs).
+            Hence, loop timing does not depend on the plot. If the figure is closed,
+            self._stop_event is set and loop must stop."""
+
+        self._plot_count = 0
+        self._stop_event = threading.Event()
+
+        # Instrumentation (started by the loop, plot rendering is recorded as events)
+        self.stats = Loop_stats(getattr(self, 'cycles', 0))
+        for function in self.stats_hooks:
+            self.stats.register_hook(function)
+
+        # Throttled progress reporting
+        self._progress = Progress(self.progress, self.progress_rate)
+
+        if self._cancel_event.is_set():  # Asynchronous session cancelled before the loop started
+            self._stop_event.set()
+
+        if not self.plot:
+            try:
+                loop()
+            finally:
+                self._progress.close()
+            return
+
+        # Exceptions raised in loop are re-raised in this thread
+        errors = []
+
+        def target():
+            try:
+                loop()
+            except BaseException as e:
+                errors.append(e)
+
+        worker = threading.Thread(target=target, daemon=True)
+        worker.start()
+
+        # Render loop, running while data are acquired/sent
+        rendered = 0
+        try:
+            while True:
+
+                # Checking if there is still an open figure. If not, stop the main loop
+                try:
+                    plt.get_figlabels().index('iter_plot')
+                except BaseException:
+                    break
+
+                # Rendering published samples (or only processing GUI events)
+                n = self._plot_count
+                if n > rendered:
+                    start = time.perf_counter()
+                    self._update_plot(*plot_data(n))
+                    self.stats.record('plot', start, time.perf_counter())
+                    rendered = n
+                else:
+                    self.fig.canvas.flush_events()
+
+                if not worker.is_alive():
+                    break
+
+                worker.join(1 / self.plot_fps)
+
+        finally:
+            # Stopping main loop if rendering stopped before it (e.g. figure closed or KeyboardInterrupt)
+            if worker.is_alive():
+                self._stop_event.set()
+            worker.join()
+            self._progress.close()
+
+        if errors:
+            raise errors[0]
+
+    async def _run_async(self, method):
+        """ Method to run a blocking method (e.g. get_data_nidaq) in an executor, so that the event loop
+            is not blocked. If the awaiting task is cancelled, the main loop is stopped (as if the plot
+            was closed), the method returns (closing devices and files) and cancellation is propagated.
+            Plot is disabled, as figures must be handled by the main thread"""
+
+        loop = asyncio.get_running_loop()
+        plot, self.plot = self.plot, False
+        self._cancel_event.clear()
+
+        future = loop.run_in_executor(None, method)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self._cancel_event.set()
+            self._stop_event.set()
+            await asyncio.wait([future])
+            raise
+        finally:
+            self.plot = plot
+
     def _update_plot(self, x_value, y_value, number_of_inputs=1):
         """ Method to update plot already started using _start_updatable_plot
-            using x_value and y_value as new data"""
+            using x_value and y_value as new data.
 
-        self.ax.clear()
-        plt.title(self.title)
-        plt.xlabel("Time (seconds)")
-        plt.ylabel("Voltage")
-        plt.grid()
-        if number_of_inputs > 1:
-            for k in range(number_of_inputs):
-                self.ax.plot(x_value[k], y_value[k])
-                plt.legend(self.legend)
+            Existing lines are updated in place (Line2D.set_data). The whole figure is only
+            redrawn when axes limits change; otherwise, only lines are redrawn over the saved
+            background (blitting), so the cost per call does not depend on previous frames"""
+
+        if number_of_inputs == 1:
+            x_value, y_value = [x_value], [y_value]
+
+        # Blitting only if supported by the backend
+        blit = self.fig.canvas.supports_blit
+
+        # Creating lines (and legend) on first call
+        if len(self.lines) != number_of_inputs:
+            for line in self.line + self.lines:
+                line.remove()
+            self.line = []
+            self.lines = [self.ax.plot([], [], animated=blit)[0]
+                          for _ in range(number_of_inputs)]
+            self.ax.legend(self.lines, self.legend)
+            self._background = None
+
+        # Reducing data to about one point per pixel (and to the sliding window, if any)
+        data = [self._decimate(x, y) for x, y in zip(x_value, y_value)]
+        x_value, y_value = [x for x, _ in data], [y for _, y in data]
+
+        # Updating data in place
+        for line, x, y in zip(self.lines, x_value, y_value):
+            line.set_data(x, y)
+
+        if self._rescale_plot(x_value, y_value) or self._background is None or not blit:
+            # Full redraw (background is saved by _on_draw)
+            self.fig.canvas.draw()
         else:
-            self.ax.plot(x_value, y_value)
-            plt.legend(self.legend)
-        self.fig.canvas.draw()
+            # Redrawing only lines over saved background
+            self.fig.canvas.restore_region(self._background)
+            for line in self.lines:
+                self.ax.draw_artist(line)
+            self.fig.canvas.blit(self.ax.bbox)
+
         self.fig.canvas.flush_events()
 
+    def _decimate(self, x, y):
+        """ Method to reduce data of one line to the last self.plot_window seconds and to
+            about one point per pixel (min-max keeps two points per pixel), using self.plot_decimation"""
+
+        x, y = last_seconds(np.asarray(x), np.asarray(y), self.plot_window)
+
+        n_out = self.plot_points
+        if n_out is None:
+            n_out = int(self.ax.bbox.width) * (2 if self.plot_decimation == 'minmax' else 1)
+
+        return decimate(x, y, n_out, self.plot_decimation)
+
+    def _rescale_plot(self, x_value, y_value):
+        """ Method to update axes limits if data are out of them. Returns True if
+            limits changed. Limits grow with a margin, so that they rarely change"""
+
+        x = [np.asarray(v, dtype=float) for v in x_value if len(v) > 0]
+        y = [np.asarray(v, dtype=float) for v in y_value if len(v) > 0]
+        if not x or not y:
+            return False
+
+        x_min, x_max = min(np.nanmin(v) for v in x), max(np.nanmax(v) for v in x)
+        y_min, y_max = min(np.nanmin(v) for v in y), max(np.nanmax(v) for v in y)
+
+        changed = False
+        (x_low, x_high), (y_low, y_high) = self.ax.get_xlim(), self.ax.get_ylim()
+
+        # Time axis: 25% headroom on the right (also rescaled if data left the first quarter,
+        # e.g. with a sliding window)
+        if x_min < x_low or x_max > x_high or x_min > x_low + 0.25 * (x_high - x_low):
+            width = max(x_max - x_min, 1e-9)
+            self.ax.set_xlim(x_min, x_max + 0.25 * width)
+            changed = True
+
+        # Voltage axis: 10% margin on both sides
+        if y_min < y_low or y_max > y_high:
+            margin = 0.1 * max(y_max - y_min, 1e-3)
+            self.ax.set_ylim(y_min - margin, y_max + margin)
+            changed = True
+
+        return changed
+
+    def _on_draw(self, event):
+        """ Method called after each full redraw of the figure. Saves the background
+            (everything but data lines) and draws the lines"""
+
+        self._background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
+    def _check_deadlines(self):
+        """ Method to summarize timing of the session (self.jitter) and warn the user
+            if self.scheduler missed any deadline"""
+
+        # Keeping only time instants of performed iterations
+        self.time_measured = self.time_measured[:len(self.time_var)]
+
+        # Lateness of measured time instants with respect to k * ts
+        self.jitter = jitter_summary(self.time_var, self.time_measured)
+        print(f"\nLateness (s): mean = {self.jitter['mean']:.6f}, "
+              f"p99 = {self.jitter['p99']:.6f}, max = {self.jitter['max']:.6f}")
+
+        if self.scheduler.missed > 0:
+            warnings.warn(
+                f"Time spent to append data and update interface was greater than ts "
+                f"in {self.scheduler.missed} of {self.scheduler.k} iterations "
+                f"(maximum delay: {self.scheduler.max_lateness:.4f} s). "
+                "You CANNOT trust time.dat" + self._slowest_phase())
+
+    def _slowest_phase(self):
+        """ Description of the slowest phase of the main loop (see self.stats), added to timing warnings """
+
+        phase, duration = self.stats.slowest() if self.stats is not None else (None, 0.0)
+        if phase is None:
+            return ''
+
+        return f". Slowest phase: {phase} ({duration:.4f} s, see self.stats)"
+
+    def _session_metadata(self):
+        """ Session information saved with data (device, channels, terminal, ts and start time)"""
+
+        metadata = {'start_time': datetime.datetime.now().isoformat(), 'ts': self.ts}
+        for name in ['device', 'channel', 'ai_channel', 'ao_channel', 'com_port', 'terminal']:
+            if getattr(self, name, None) is not None:
+                metadata[name] = str(getattr(self, name))
+
+        return metadata
+
+    def _start_writer(self):
+        """ Method to start the writer (self.save_format) that streams data to self.path
+            during the session, if self.save"""
+
+        self.writer = None
+        if self.save:
+            self.writer = new_writer(self.save_format, self._writer_path(), chunk_size=self.chunk_size,
+                                     metadata=self._session_metadata()).open()
+
+    def _writer_path(self):
+        """ Folder where the writer saves data"""
+
+        return self.path
+
+    def _stream(self, name, sample):
+        """ Method to stream one sample to disk (if a writer was started)"""
+
+        if self.writer is not None:
+            self.writer.write(name, sample)
+
+    def _stop_writer(self):
+        """ Method to write remaining data and close files"""
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
     def _save_data(self, data, name):
-        """ Method to save data in self.path with name"""
+        """ Method to save data in self.path with name. 2-D data (channels x samples)
+            are saved with one column per channel"""
+
+        if np.ndim(data) == 2:
+            data = [' '.join(str(v) for v in d) for d in np.transpose(data)]
 
-        file = open(self.path + '\\' + name, 'w')
+        file = open(os.path.join(self.path, name), 'w')
         for d in data:
             file.write(str(d) + "\n")
         file.close()
 
     def _nidaq_info(self):
-        """Gathering NIDAQ info"""
+        """Gathering NIDAQ info (from the device registry cache, scanned on first use)"""
 
         # Getting all available devices
-        self.device_names = []
-        self.device_categories = []
-        self.device_type = []
-        self.local_system = nidaqmx.system.System.local()
-
-        for device in self.local_system.devices:
-            self.device_names.append(device.name)
-            self.device_categories.append(device.product_category)
-            self.device_type.append(device.product_type)
+        devices = self.registry.nidaq_devices()
+        self._device_names = [device[0] for device in devices]
+        self._device_categories = [device[1] for device in devices]
+        self._device_type = [device[2] for device in devices]
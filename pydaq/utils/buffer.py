@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class Data_buffer:
+    """
+        Preallocated, array-backed buffer used to store acquired/sent data (8 bytes per float64
+        sample, instead of a Python list of floats).
+
+        Data are exposed as zero-copy NumPy views (view(), indexing, np.asarray). In ring mode the
+        buffer never gets full: only the last capacity samples are kept. Ring data are stored twice,
+        so that the last capacity samples are always contiguous and view() is still zero-copy.
+
+        :params:
+            capacity: number of samples (per channel)
+            channels: number of channels. If None, data are 1-D (samples). Else, data are 2-D
+                      (channels x samples)
+            ring: if True, oldest samples are overwritten when the buffer is full
+            dtype: data type
+
+        :example:
+            buffer = Data_buffer(100)
+            buffer.append(1.5)
+            buffer.view()  # array([1.5])
+    """
+
+    def __init__(self, capacity, channels=None, ring=False, dtype=np.float64):
+
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.ring = ring
+
+        size = 2 * self.capacity if ring else self.capacity
+        shape = (size,) if channels is None else (channels, size)
+        self._array = np.zeros(shape, dtype=dtype)
+
+        # Number of appended samples (including overwritten ones, in ring mode)
+        self.count = 0
+
+    def append(self, value):
+        """ Method to append one sample (one value per channel if 2-D) """
+
+        if self.ring:
+            k = self.count % self.capacity
+            self._array[..., k] = value
+            self._array[..., k + self.capacity] = value
+        else:
+            if self.count >= self.capacity:
+                raise IndexError(f'Data_buffer is full ({self.capacity} samples)')
+            self._array[..., self.count] = value
+
+        self.count += 1
+
+    def extend(self, values):
+        """ Method to append a block of samples (samples along the last axis) """
+
+        values = np.asarray(values)
+        n = values.shape[-1]
+
+        if self.ring:
+            # Only the last capacity samples will be kept
+            values = values[..., max(0, n - self.capacity):]
+            k = (self.count + max(0, n - self.capacity) + np.arange(values.shape[-1])) % self.capacity
+            self._array[..., k] = values
+            self._array[..., k + self.capacity] = values
+        else:
+            if self.count + n > self.capacity:
+                raise IndexError(f'Data_buffer is full ({self.capacity} samples)')
+            self._array[..., self.count:self.count + n] = values
+
+        self.count += n
+
+    def view(self):
+        """ Zero-copy view of stored samples, in time order """
+
+        if not self.ring or self.count <= self.capacity:
+            return self._array[..., :self.count]
+
+        start = self.count % self.capacity
+        return self._array[..., start:start + self.capacity]
+
+    def clear(self):
+        """ Method to discard all samples (memory is kept) """
+
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __getitem__(self, key):
+        return self.view()[key]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.view() if dtype is None else self.view().astype(dtype)
+
+    def __repr__(self):
+        return f'Data_buffer({self.view()!r})'
+
+
+class Block_rebuffer:
+    """
+        Regroups blocks of samples of any size (e.g. as they are read from a device) into blocks of
+        block_size samples, keeping at most one incomplete block in memory.
+
+        :params:
+            block_size: number of samples per output block. If None, blocks are passed as they are
+
+        :example:
+            rebuffer = Block_rebuffer(100)
+            for time_block, data_block in rebuffer.push(time, data):
+                ...  # Blocks of 100 samples
+    """
+
+    def __init__(self, block_size=None):
+
+        self.block_size = block_size
+        self._time, self._data = [], []
+        self._count = 0
+
+    def push(self, time, data):
+        """ Method to add a block (time, data; samples along the last axis). Returns the list of
+            complete blocks """
+
+        if self.block_size is None:
+            return [(time, data)]
+
+        self._time.append(np.asarray(time))
+        self._data.append(np.asarray(data))
+        self._count += len(time)
+
+        blocks = []
+        if self._count >= self.block_size:
+            time, data = np.concatenate(self._time), np.concatenate(self._data, axis=-1)
+            n = (self._count // self.block_size) * self.block_size
+            for k in range(0, n, self.block_size):
+                blocks.append((time[k:k + self.block_size], data[..., k:k + self.block_size]))
+
+            # Keeping the incomplete block (copies, so that complete blocks are not kept in memory)
+            self._time, self._data = [time[n:].copy()], [data[..., n:].copy()]
+            self._count -= n
+
+        return blocks
@@ -0,0 +1,168 @@
+import os
+import json
+import numpy as np
+
+# Whitespace characters (bytes.split separators), used to find blank lines
+_whitespace = np.zeros(256, dtype=bool)
+_whitespace[list(b' \t\n\r\x0b\x0c')] = True
+
+
+class Text_source:
+    """
+        Data from a text file (one value per line, e.g. .dat files) parsed in blocks, so that the
+        whole file is never loaded into memory. A first (fast, vectorized) pass counts lines and
+        saves the byte offset of each block. Samples are then accessed by index, as an array, and
+        only the block being sent is kept in memory.
+
+        :params:
+            path: text file path
+            block_size: number of lines per block
+
+        :example:
+            data = Text_source('data.dat')
+            len(data), data[0], data[10:20]
+    """
+
+    def __init__(self, path, block_size=65536):
+
+        self.path = path
+        self.block_size = block_size
+
+        # Byte offset of each block and number of lines (values). Blank lines are skipped, as in parsing
+        self._offsets = [0]
+        self.lines = 0
+
+        with open(path, 'rb') as file:
+            position = 0
+            filled = False  # Last (unfinished) line of the previous chunk has a value
+            while True:
+                chunk = file.read(1 << 22)
+                if not chunk:
+                    break
+
+                # Line breaks of this chunk and lines holding a value (any non-whitespace character)
+                chunk = np.frombuffer(chunk, dtype=np.uint8)
+                breaks = np.flatnonzero(chunk == ord('\n'))
+                characters = np.cumsum(~_whitespace[chunk])
+                values = np.diff(np.concatenate(([0], characters[breaks]))) > 0
+                if len(values):
+                    values[0] |= filled
+                    filled = characters[-1] > characters[breaks[-1]]
+                else:
+                    filled = filled or characters[-1] > 0
+
+                # Global line numbers of lines with values, and offsets of blocks ending at them
+                numbers = self.lines + np.cumsum(values)
+                ends = breaks[values & (numbers % block_size == 0)] + position + 1
+                self._offsets.extend(ends.tolist())
+
+                self.lines += int(np.count_nonzero(values))
+                position += len(chunk)
+
+        # Last line without line break
+        if filled:
+            self.lines += 1
+
+        # Offsets of (non-existing) blocks after the last value
+        del self._offsets[-(-self.lines // block_size):]
+
+        self._block_index, self._block = None, None
+
+    def block(self, index):
+        """ Block index (NumPy array) """
+
+        if index != self._block_index:
+            with open(self.path, 'rb') as file:
+                file.seek(self._offsets[index])
+                if index + 1 < len(self._offsets):
+                    text = file.read(self._offsets[index + 1] - self._offsets[index])
+                else:
+                    text = file.read()
+            self._block_index, self._block = index, np.array(text.split(), dtype=np.float64)
+
+        return self._block
+
+    def blocks(self):
+        """ Generator of all blocks, in order """
+
+        for index in range(len(self._offsets)):
+            yield self.block(index)
+
+    def __len__(self):
+        return self.lines
+
+    def __getitem__(self, key):
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.lines)
+            if start >= stop:
+                return np.zeros(0)
+            blocks = range(start // self.block_size, (stop - 1) // self.block_size + 1)
+            data = np.concatenate([self.block(b) for b in blocks])
+            offset = blocks[0] * self.block_size
+            return data[start - offset:stop - offset:step]
+
+        if key < 0:
+            key += self.lines
+        if not 0 <= key < self.lines:
+            raise IndexError(f'index {key} is out of bounds for Text_source with {self.lines} lines')
+
+        return self.block(key // self.block_size)[key % self.block_size]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.concatenate(list(self.blocks())) if self.lines else np.zeros(0)
+        return data if dtype is None else data.astype(dtype)
+
+
+def open_data_source(path, block_size=65536):
+    """
+        Data to be sent, read from path without loading the whole file into memory (when possible):
+            - .npy files are memory-mapped (np.load with mmap_mode='r')
+            - .bin/.raw files (little-endian float64, as saved by Raw_writer) are memory-mapped (np.memmap).
+              If there is a JSON header (same name, .json), only the first channel is used
+            - other files (.dat, .txt, ...) are text files parsed in blocks (Text_source)
+
+        :params:
+            path: data file path
+            block_size: lines per block (text files)
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.npy':
+        data = np.load(path, mmap_mode='r')
+        return data if data.ndim == 1 else data[:, 0]
+
+    if extension in ['.bin', '.raw']:
+        dtype, channels = '<f8', None
+        header = os.path.splitext(path)[0] + '.json'
+        if os.path.exists(header):
+            with open(header) as file:
+                info = json.load(file)
+            dtype, channels = info.get('dtype', dtype), info.get('channels')
+        data = np.memmap(path, dtype=dtype, mode='r')
+        return data if channels is None else data.reshape(-1, channels)[:, 0]
+
+    return Text_source(path, block_size)
+
+
+def iter_blocks(data, block_size=65536):
+    """ Generator of blocks (NumPy arrays) of data (array, memory-mapped array or Text_source) """
+
+    if isinstance(data, Text_source):
+        yield from data.blocks()
+        return
+
+    for k in range(0, len(data), block_size):
+        yield np.asarray(data[k:k + block_size])
+
+
+def data_range(data, block_size=65536):
+    """ Minimum and maximum of data, computed block by block """
+
+    minimum, maximum = np.inf, -np.inf
+    for block in iter_blocks(data, block_size):
+        if len(block):
+            minimum, maximum = min(minimum, block.min()), max(maximum, block.max())
+
+    return float(minimum), float(maximum)
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+def last_seconds(x, y, duration):
+    """
+        Data from the last duration seconds (sliding window). x must be sorted.
+
+        :params:
+            x: time array
+            y: data array
+            duration: window duration, in seconds. If None, x and y are returned as they are.
+    """
+
+    if duration is None or len(x) == 0:
+        return x, y
+
+    start = np.searchsorted(x, x[-1] - duration)
+
+    return x[start:], y[start:]
+
+
+def minmax_decimate(x, y, n_out):
+    """
+        Min-max decimation: data are divided into n_out // 2 buckets and the minimum and maximum
+        of each bucket are kept (in time order), so spikes are preserved.
+
+        :params:
+            x: time array
+            y: data array
+            n_out: (maximum) number of output points
+    """
+
+    x, y = np.asarray(x), np.asarray(y)
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+
+    if n <= n_out:
+        return x, y
+
+    # Buckets with the same size (last one padded with the last value)
+    size = int(np.ceil(n / n_buckets))
+    padded = np.pad(y, (0, size * n_buckets - n), mode='edge').reshape(n_buckets, size)
+
+    # Index of minimum and maximum of each bucket, in time order
+    offsets = np.arange(n_buckets) * size
+    idx = np.sort(np.stack([np.argmin(padded, axis=1) + offsets,
+                            np.argmax(padded, axis=1) + offsets], axis=1), axis=1).ravel()
+    idx = np.unique(np.minimum(idx, n - 1))
+
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    """
+        Largest-Triangle-Three-Buckets decimation. First and last points are kept and, for each
+        of the n_out - 2 buckets in between, the point forming the largest triangle with the
+        previously selected point and the average of the next bucket is selected.
+
+        Buckets are processed at once (padded into a 2-D array). As the previously selected points
+        are not known beforehand, a first pass uses the average of the previous bucket instead, and
+        a second pass uses the points selected by the first one.
+
+        :params:
+            x: time array
+            y: data array
+            n_out: number of output points
+    """
+
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(y)
+
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    # Bucket edges (first and last points are buckets by themselves). The last "bucket" is the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(np.append(edges, n))
+    x_avg, y_avg = np.add.reduceat(x, edges) / counts, np.add.reduceat(y, edges) / counts
+
+    # Points of each bucket (buckets x largest bucket size), padding marked by valid
+    points = edges[:-1, None] + np.arange(counts[:-1].max())
+    valid = points < edges[1:, None]
+    points = np.minimum(points, n - 1)
+    x_bucket, y_bucket = x[points], y[points]
+
+    def select(x_a, y_a):
+        # Triangle areas (times 2) with previous point a and average of next bucket, for all points
+        area = np.abs((x_a - x_avg[1:])[:, None] * (y_bucket - y_a[:, None]) -
+                      (x_a[:, None] - x_bucket) * (y_avg[1:] - y_a)[:, None])
+        area[~valid] = -1
+
+        return edges[:-1] + np.argmax(area, axis=1)
+
+    selected = select(np.append(x[0], x_avg[:-2]), np.append(y[0], y_avg[:-2]))
+    previous = np.append(0, selected[:-1])
+    selected = select(x[previous], y[previous])
+
+    idx = np.concatenate(([0], selected, [n - 1]))
+
+    return x[idx], y[idx]
+
+
+def decimate(x, y, n_out, method='minmax'):
+    """
+        Reduces data to about n_out points to be plotted, preserving visible shape.
+
+        :params:
+            x: time array
+            y: data array
+            n_out: number of output points
+            method: 'minmax', 'lttb' or None (no decimation)
+    """
+
+    if method is None:
+        return x, y
+    if method == 'minmax':
+        return minmax_decimate(x, y, n_out)
+    if method == 'lttb':
+        return lttb(x, y, n_out)
+
+    raise ValueError(f"Unknown decimation method: {method}. Use 'minmax', 'lttb' or None")
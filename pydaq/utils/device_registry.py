@@ -0,0 +1,184 @@
+import time
+import threading
+from pydaq.utils.lazy import lazy_import
+
+list_ports = lazy_import('serial.tools.list_ports')
+nidaqmx = lazy_import('nidaqmx')
+
+
+def scan_serial():
+    """ Available serial (COM) ports: list of (name, description, device path) """
+
+    return [(port.name, port.description, port.device) for port in list_ports.comports()]
+
+
+def scan_nidaq():
+    """ Available NIDAQ devices: list of (name, product category, product type) """
+
+    return [(device.name, device.product_category, device.product_type)
+            for device in nidaqmx.system.System.local().devices]
+
+
+class Device_registry:
+    """
+        Cache of available devices (serial ports and NIDAQ boards), shared by all PYDAQ objects, so that
+        creating objects and refreshing GUIs do not scan the hardware every time.
+
+        The first query of each kind of device scans the hardware (and waits for it). After that, queries
+        return the cached list at once: if it is older than ttl seconds, it is refreshed in a background
+        thread (the next queries see the new list). On Linux, if pyudev is installed, a monitor thread
+        listens to udev hot-plug events and refreshes the lists as soon as a device is plugged or unplugged.
+
+        :params:
+            ttl: maximum age of cached lists, in seconds
+            monitor: if True, starts the hot-plug monitor (udev) on the first query, where available
+            scanners: functions returning the devices of each kind ('serial', 'nidaq')
+
+        :example:
+            registry = Device_registry(ttl=5.0)
+            registry.com_ports()  # [('COM3', 'Arduino Uno (COM3)', 'COM3'), ...]
+            registry.nidaq_devices()  # [('Dev1', ProductCategory.M_SERIES_DAQ, 'USB-6009'), ...]
+    """
+
+    def __init__(self, ttl=5.0, monitor=True, scanners=None):
+
+        self.ttl = ttl
+        self.monitor = monitor
+        self.scanners = scanners or {'serial': scan_serial, 'nidaq': scan_nidaq}
+
+        # Cached lists, time of their last scan (time.monotonic) and background refreshes running
+        self._devices = {}
+        self._updated = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        # Hot-plug monitor thread and functions called when a list changes
+        self._monitor_thread = None
+        self._callbacks = []
+
+        # Number of hardware scans (of each kind) and last error raised by a background refresh
+        self.scans = {kind: 0 for kind in self.scanners}
+        self.error = None
+
+    def com_ports(self, max_age=None):
+        """ Available serial ports: list of (name, description, device path). See devices() """
+
+        return self.devices('serial', max_age)
+
+    def nidaq_devices(self, max_age=None):
+        """ Available NIDAQ devices: list of (name, product category, product type). See devices() """
+
+        return self.devices('nidaq', max_age)
+
+    def devices(self, kind, max_age=None):
+        """
+            Cached devices of kind ('serial' or 'nidaq'). The first call scans the hardware; later calls
+            return at once, refreshing lists older than ttl seconds in the background.
+
+        :params:
+            kind: 'serial' or 'nidaq'
+            max_age: if given, lists older than max_age seconds are scanned again before returning
+                     (e.g. max_age=0 forces a scan)
+        """
+
+        self._start_monitor()
+
+        with self._lock:
+            devices = self._devices.get(kind)
+            age = time.monotonic() - self._updated[kind] if kind in self._updated else None
+
+        if devices is None or (max_age is not None and age > max_age):
+            return self.refresh(kind)
+
+        if age > self.ttl:
+            self._refresh_background(kind)
+
+        return devices
+
+    def refresh(self, kind):
+        """ Method to scan devices of kind now, updating the cache """
+
+        devices = list(self.scanners[kind]())
+
+        with self._lock:
+            changed = self._devices.get(kind) != devices
+            self._devices[kind] = devices
+            self._updated[kind] = time.monotonic()
+            self.scans[kind] += 1
+
+        if changed:
+            for function in self._callbacks:
+                function(kind, devices)
+
+        return devices
+
+    def invalidate(self, kind=None):
+        """ Method to discard cached lists (all kinds if kind is None), so that they are scanned again """
+
+        with self._lock:
+            for k in ([kind] if kind is not None else list(self._devices)):
+                self._devices.pop(k, None)
+                self._updated.pop(k, None)
+
+    def register_callback(self, function):
+        """ Method to call function(kind, devices) whenever a list of devices changes """
+
+        self._callbacks.append(function)
+
+    def _refresh_background(self, kind):
+        """ Method to refresh devices of kind in a background thread (one at a time) """
+
+        with self._lock:
+            if kind in self._refreshing:
+                return
+            self._refreshing.add(kind)
+
+        threading.Thread(target=self._run_refresh, args=(kind,), daemon=True).start()
+
+    def _run_refresh(self, kind):
+        """ Background refresh: errors are stored (the cached list is kept) """
+
+        try:
+            self.refresh(kind)
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self._lock:
+                self._refreshing.discard(kind)
+
+    def _start_monitor(self):
+        """ Method to start the udev hot-plug monitor (Linux, if pyudev is installed), once """
+
+        if not self.monitor or self._monitor_thread is not None:
+            return
+
+        with self._lock:
+            if self._monitor_thread is not None:
+                return
+            try:
+                import pyudev
+            except ImportError:
+                # No hot-plug notification: lists are refreshed when older than ttl
+                self._monitor_thread = False
+                return
+
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            monitor.filter_by('usb')
+            self._monitor_thread = threading.Thread(target=self._run_monitor, args=(monitor,), daemon=True)
+            self._monitor_thread.start()
+
+    def _run_monitor(self, monitor):
+        """ Monitor thread: refreshes lists when a serial port or USB device is added or removed """
+
+        for device in iter(monitor.poll, None):
+            if device.action not in ('add', 'remove'):
+                continue
+            kinds = ['serial'] if device.subsystem == 'tty' else ['serial', 'nidaq']
+            for kind in kinds:
+                if kind in self._devices:
+                    self._run_refresh(kind)
+
+
+# Registry shared by all PYDAQ objects
+registry = Device_registry()
@@ -0,0 +1,180 @@
+import csv
+import json
+import time
+import numpy as np
+
+# Phases of an acquisition/sending loop iteration: device I/O, buffering (and publishing to the plot),
+# saving (streaming to disk), console output and sleep (waiting for the next deadline)
+LOOP_PHASES = ['io', 'buffer', 'save', 'print', 'sleep']
+
+
+class Loop_stats:
+    """
+        Per-iteration instrumentation of a loop. The duration of each phase of each iteration is
+        recorded (time between consecutive marks) into a preallocated array, so instrumentation costs
+        about a microsecond per phase. Phases that do not belong to loop iterations (e.g. plot rendering,
+        done by another thread) are recorded as events.
+
+        Functions registered with register_hook are called for every recorded phase, e.g. to forward
+        phases to an external profiler or tracer.
+
+        :params:
+            cycles: expected number of iterations (capacity grows if it is exceeded)
+            phases: names of loop phases
+
+        :example:
+            stats = Loop_stats(cycles)
+            stats.start()
+            for k in range(cycles):
+                temp = task.read()
+                stats.mark('io')
+                ...
+                stats.next()
+            stats.stop()
+            print(stats)
+            stats.to_csv('trace.csv')
+    """
+
+    def __init__(self, cycles, phases=LOOP_PHASES):
+
+        self.phases = list(phases)
+        self._index = {phase: i for i, phase in enumerate(self.phases)}
+
+        # Duration of each phase (seconds) of each iteration, and durations of events (phase -> list)
+        self.durations = np.zeros((max(0, int(cycles)), len(self.phases)))
+        self.events = {}
+
+        # Number of recorded iterations and time of the last mark
+        self.k = 0
+        self._last = None
+
+        self._hooks = []
+
+    def register_hook(self, function):
+        """ Method to call function(phase, iteration, start, end) for every recorded phase (iteration is
+            None for events). start and end are time.perf_counter() instants """
+
+        self._hooks.append(function)
+
+    def start(self, cycles=None):
+        """ Method to start recording (beginning of the first iteration). If cycles is given, it replaces
+            the expected number of iterations (e.g. number of blocks, for loops reading blocks of samples) """
+
+        if cycles is not None:
+            self.durations = np.zeros((max(0, int(cycles)), len(self.phases)))
+        else:
+            # Only rows of a previous recording are cleared (the others were never written)
+            self.durations[:self.k + 1] = 0
+        self.k = 0
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        """ Method to record the end of phase (it started at the previous mark) """
+
+        now = time.perf_counter()
+        if self.k >= len(self.durations):  # More iterations than expected: doubling capacity
+            self.durations = np.concatenate([self.durations, np.zeros((max(1, self.k), len(self.phases)))])
+        self.durations[self.k, self._index[phase]] += now - self._last
+
+        if self._hooks:
+            for function in self._hooks:
+                function(phase, self.k, self._last, now)
+
+        self._last = now
+
+    def next(self):
+        """ Method to record the end of an iteration """
+
+        self.k += 1
+
+    def stop(self):
+        """ Method to stop recording (an interrupted iteration is kept) """
+
+        if self.k < len(self.durations) and self.durations[self.k].any():
+            self.k += 1
+
+    def record(self, phase, start, end):
+        """ Method to record an event of phase, from start to end (time.perf_counter() instants) """
+
+        self.events.setdefault(phase, []).append(end - start)
+
+        for function in self._hooks:
+            function(phase, None, start, end)
+
+    @property
+    def trace(self):
+        """ Phase durations of recorded iterations (iterations x phases), in seconds """
+
+        return self.durations[:self.k]
+
+    def phase_durations(self, phase):
+        """ Durations (seconds) of phase, in every iteration (or event) """
+
+        if phase in self._index:
+            return self.trace[:, self._index[phase]]
+
+        return np.asarray(self.events.get(phase, []), dtype=np.float64)
+
+    def summary(self):
+        """ Statistics of each phase (count, total, mean, p50, p99 and max durations, in seconds) """
+
+        summary = {}
+        for phase in self.phases + list(self.events):
+            durations = self.phase_durations(phase)
+            if len(durations) == 0:
+                continue
+            summary[phase] = {'count': len(durations),
+                              'total': float(np.sum(durations)),
+                              'mean': float(np.mean(durations)),
+                              'p50': float(np.percentile(durations, 50)),
+                              'p99': float(np.percentile(durations, 99)),
+                              'max': float(np.max(durations))}
+
+        return summary
+
+    def histogram(self, phase, bins=None):
+        """ Histogram (counts, bin edges) of phase durations. Default bins: 4 per decade, from 1 us to 10 s """
+
+        if bins is None:
+            bins = np.logspace(-6, 1, 29)
+
+        return np.histogram(self.phase_durations(phase), bins=bins)
+
+    def slowest(self, exclude=('sleep',)):
+        """ Phase with the longest single duration (sleep excluded) and that duration, or (None, 0) """
+
+        summary = self.summary()
+        phases = [phase for phase in summary if phase not in exclude]
+        if not phases:
+            return None, 0.0
+        phase = max(phases, key=lambda p: summary[p]['max'])
+
+        return phase, summary[phase]['max']
+
+    def to_csv(self, path):
+        """ Method to export the trace (one row per iteration, one column per phase, in seconds) """
+
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['iteration'] + self.phases)
+            for k, row in enumerate(self.trace):
+                writer.writerow([k] + [repr(float(v)) for v in row])
+
+    def to_json(self, path):
+        """ Method to export summary, trace and events """
+
+        with open(path, 'w') as file:
+            json.dump({'phases': self.phases,
+                       'iterations': self.k,
+                       'summary': self.summary(),
+                       'trace': {phase: self.trace[:, i].tolist() for i, phase in enumerate(self.phases)},
+                       'events': self.events}, file)
+
+    def __str__(self):
+
+        lines = [f"{'phase':<8} {'count':>8} {'total (s)':>10} {'mean (s)':>10} {'p99 (s)':>10} {'max (s)':>10}"]
+        for phase, s in self.summary().items():
+            lines.append(f"{phase:<8} {s['count']:>8} {s['total']:>10.4f} {s['mean']:>10.6f} "
+                         f"{s['p99']:>10.6f} {s['max']:>10.6f}")
+
+        return '\n'.join(lines)
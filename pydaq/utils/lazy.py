@@ -0,0 +1,48 @@
+import importlib
+
+
+class Lazy_module:
+    """
+        Module that is only imported when one of its attributes is first used, so that GUI, plotting
+        and hardware back ends (PySimpleGUI, matplotlib, nidaqmx, pyserial) do not slow down
+        `import pydaq...` and are not required until a method that needs them is called.
+
+        :params:
+            name: module name. Example: 'matplotlib.pyplot'
+
+        :example:
+            plt = Lazy_module('matplotlib.pyplot')
+            plt.plot(x, y)  # matplotlib.pyplot is imported here
+    """
+
+    def __init__(self, name):
+
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        """ Imported module """
+
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """ Module name, imported on first use (see Lazy_module) """
+
+    return Lazy_module(name)
@@ -0,0 +1,80 @@
+import time
+import logging
+
+
+class Progress:
+    """
+        Throttled progress reporting of acquisition/sending loops. Updates are reported at most max_rate
+        times per second (the last one is always reported), so console output does not compete with
+        sampling, nor floods Jupyter output cells.
+
+        :params:
+            mode: 'print' (one line, overwritten), 'logging' (logger 'pydaq', INFO level), 'tqdm' (progress
+                  bar, requires tqdm), a function called as function(done, total), or None (disabled)
+            max_rate: maximum number of updates per second
+
+        :example:
+            progress = Progress('tqdm', max_rate=10)
+            for k in range(cycles):
+                ...
+                progress.update(k + 1, cycles)
+            progress.close()
+    """
+
+    def __init__(self, mode='print', max_rate=10.0):
+
+        if not (mode in [None, False, 'print', 'logging', 'tqdm'] or callable(mode)):
+            raise ValueError(f"Unknown progress mode: {mode}. Use 'print', 'logging', 'tqdm', a function or None")
+
+        self.mode = mode
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+
+        # Last reported update (time.monotonic), progress waiting to be reported and tqdm bar
+        self._last = None
+        self._pending = None
+        self._bar = None
+
+    def update(self, done, total):
+        """ Method to report that done of total samples were processed (skipped if the last report was
+            less than 1 / max_rate seconds ago, unless done == total) """
+
+        if not self.mode:
+            return
+
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval and done < total:
+            self._pending = (done, total)
+            return
+
+        self._last = now
+        self._pending = None
+        self._report(done, total)
+
+    def close(self):
+        """ Method to report the last update (if it was skipped) and finish reporting """
+
+        if self._pending is not None:
+            self._report(*self._pending)
+            self._pending = None
+
+        if self.mode == 'print' and self._last is not None:
+            print()
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+        self._last = None
+
+    def _report(self, done, total):
+
+        if self.mode == 'print':
+            print(f'\rSamples: {done} of {total}', end='', flush=True)
+        elif self.mode == 'logging':
+            logging.getLogger('pydaq').info('Samples: %d of %d', done, total)
+        elif self.mode == 'tqdm':
+            if self._bar is None:
+                from tqdm.auto import tqdm
+                self._bar = tqdm(total=total, unit='samples')
+            self._bar.total = total
+            self._bar.update(done - self._bar.n)
+        else:
+            self.mode(done, total)
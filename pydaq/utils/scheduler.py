@@ -0,0 +1,111 @@
+import time
+import numpy as np
+
+
+class Scheduler:
+    """
+        Drift-free scheduler used to pace acquisition/sending loops.
+
+        Iteration k is scheduled at the absolute deadline start + k * ts (measured with
+        time.perf_counter_ns), so a late iteration does not shift the following ones and
+        errors do not pile up over long sessions. Each wait sleeps until shortly before the
+        deadline and busy-waits the remaining time, for sub-millisecond accuracy.
+
+        :params:
+            ts: sample period, in seconds.
+            spin: time before each deadline (in seconds) spent busy-waiting instead of sleeping.
+                  Use 0 to only sleep.
+
+        :example:
+            scheduler = Scheduler(0.5)
+            scheduler.start()
+            for k in range(cycles):
+                ...  # Acquire/send data
+                scheduler.wait()
+    """
+
+    def __init__(self, ts, spin=0.002):
+
+        self.ts = ts
+        self.ts_ns = int(round(ts * 1e9))
+        self.spin_ns = int(round(spin * 1e9))
+
+        # Start time (ns) and index of the next deadline
+        self.start_ns = None
+        self.k = 0
+
+        # Missed deadlines and maximum lateness (in seconds)
+        self.missed = 0
+        self.max_lateness = 0.0
+
+    def start(self):
+        """ Method to define the time base (deadline of iteration 0) as now """
+
+        self.k = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+        self.start_ns = time.perf_counter_ns()
+
+        return self.start_ns
+
+    def deadline(self, k):
+        """ Absolute deadline (perf_counter_ns) of iteration k """
+
+        return self.start_ns + k * self.ts_ns
+
+    def timestamp(self, t=None):
+        """ Time elapsed since the first deadline, in seconds (monotonic, high resolution), until now or
+            until instant t (time.perf_counter seconds, e.g., a serial reader host timestamp) """
+
+        now_ns = time.perf_counter_ns() if t is None else int(t * 1e9)
+
+        return (now_ns - self.start_ns) / 1e9
+
+    def wait(self):
+        """ Method to wait until the deadline of the next iteration. Returns False (and
+            counts a missed deadline) if it had already passed, i.e., if the current iteration
+            took longer than its time budget"""
+
+        if self.start_ns is None:
+            self.start()
+
+        self.k += 1
+        deadline = self.deadline(self.k)
+        now = time.perf_counter_ns()
+
+        # Deadline missed: no wait at all, so that the schedule is recovered
+        if now >= deadline:
+            self.missed += 1
+            self.max_lateness = max(self.max_lateness, (now - deadline) / 1e9)
+            return False
+
+        # Sleeping most of the time and busy-waiting close to the deadline
+        sleep_ns = deadline - now - self.spin_ns
+        if sleep_ns > 0:
+            time.sleep(sleep_ns / 1e9)
+        while time.perf_counter_ns() < deadline:
+            pass
+
+        return True
+
+
+def jitter_summary(time_nominal, time_measured):
+    """
+        Summary of the lateness (time_measured - time_nominal, in seconds) of a session.
+
+        :params:
+            time_nominal: intended time instants (k * ts)
+            time_measured: time instants when samples were actually acquired/sent
+
+        :return:
+            dict with mean, p99 (99th percentile) and max lateness
+    """
+
+    lateness = np.asarray(time_measured) - np.asarray(time_nominal)
+
+    if lateness.size == 0:
+        return {'mean': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    return {'mean': float(np.mean(lateness)),
+            'p99': float(np.percentile(lateness, 99)),
+            'max': float(np.max(lateness))}
@@ -0,0 +1,349 @@
+import numpy as np
+
+# Binary frame: sync byte, sequence counter (0-255), 16-bit sample (little-endian) and checksum
+SYNC = 0xA5
+FRAME_SIZE = 5
+
+# Timed frame (sampled on a timer interrupt): sync byte, sequence counter, 16-bit sample, 32-bit board
+# timestamp (micros(), little-endian) and checksum
+TIMED_SYNC = 0xA6
+TIMED_FRAME_SIZE = 9
+
+# Burst block (samples captured into the Arduino SRAM, uploaded at once): sync byte, number of samples
+# (16 bits), capture duration in microseconds (32 bits), 16-bit samples and checksum
+BURST_SYNC = 0xA7
+BURST_HEADER_SIZE = 7
+
+# Default baud rate of each protocol (must match the sketch loaded in the Arduino)
+baudrates = {'ascii': 9600,
+             'binary': 115200,
+             'timed': 115200}
+
+
+def checksum(seq, low, high):
+    """ Checksum of a frame: sum of sequence counter and sample bytes, modulo 256 """
+
+    return (np.asarray(seq, dtype=np.uint16) + low + high) & 0xFF
+
+
+def encode_frames(samples, first_seq=0):
+    """
+        Binary frames (bytes) of samples, as sent by pydaq/arduino_binary/arduino_binary.ino
+
+        :params:
+            samples: 16-bit samples (e.g. ADC readings)
+            first_seq: sequence counter of the first frame
+    """
+
+    samples = np.asarray(samples, dtype=np.uint16)
+    frames = np.zeros((len(samples), FRAME_SIZE), dtype=np.uint8)
+
+    frames[:, 0] = SYNC
+    frames[:, 1] = (first_seq + np.arange(len(samples))) & 0xFF
+    frames[:, 2] = samples & 0xFF
+    frames[:, 3] = samples >> 8
+    frames[:, 4] = checksum(frames[:, 1], frames[:, 2], frames[:, 3])
+
+    return frames.tobytes()
+
+
+def _find_frames(buffer, sync, size):
+    """ Start index of valid frames (sync byte and checksum) in buffer and number of decoded bytes """
+
+    n = len(buffer)
+
+    # Candidate frames: sync bytes followed by a complete frame
+    starts = np.flatnonzero(buffer[:max(0, n - size + 1)] == sync)
+    fields = np.stack([buffer[starts + i] for i in range(1, size - 1)]).astype(np.uint16)
+    starts = starts[(fields.sum(axis=0) & 0xFF) == buffer[starts + size - 1]]
+
+    # Discarding (rare) valid-looking frames that overlap the previous one
+    keep = np.ones(len(starts), dtype=bool)
+    while True:
+        overlap = np.flatnonzero(np.diff(starts[keep]) < size)
+        if len(overlap) == 0:
+            break
+        keep[np.flatnonzero(keep)[overlap[0] + 1]] = False
+    starts = starts[keep]
+
+    # Bytes after the last frame may be the start of a frame that is not complete yet
+    incomplete = np.flatnonzero(buffer[max(0, n - size + 1):] == sync)
+    if len(incomplete):
+        consumed = max(0, n - size + 1) + incomplete[0]
+    else:
+        consumed = n
+    if len(starts):
+        consumed = max(consumed, starts[-1] + size)
+
+    return starts, int(consumed)
+
+
+def decode_frames(data):
+    """
+        Vectorized decoder of binary frames. Frames are found by their sync byte and validated by their
+        checksum, so corrupted or partial frames (e.g. at the beginning of a read) are skipped.
+
+        :params:
+            data: received bytes
+
+        :return:
+            seq: sequence counter of each valid frame
+            samples: 16-bit sample of each valid frame
+            consumed: number of bytes that were decoded. Bytes after it may hold an incomplete frame
+                      and must be kept for the next call
+    """
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    starts, consumed = _find_frames(buffer, SYNC, FRAME_SIZE)
+
+    seq = buffer[starts + 1]
+    samples = buffer[starts + 2].astype(np.uint16) | (buffer[starts + 3].astype(np.uint16) << 8)
+
+    return seq, samples, consumed
+
+
+def encode_timed_frames(samples, timestamps, first_seq=0):
+    """
+        Timed frames (bytes) of samples, as sent by pydaq/arduino_timed/arduino_timed.ino
+
+        :params:
+            samples: 16-bit samples (e.g. ADC readings)
+            timestamps: board timestamps, in microseconds (wrapped to 32 bits, as micros())
+            first_seq: sequence counter of the first frame
+    """
+
+    samples = np.asarray(samples, dtype=np.uint16)
+    timestamps = (np.asarray(timestamps, dtype=np.int64) & 0xFFFFFFFF).astype('<u4')
+    frames = np.zeros((len(samples), TIMED_FRAME_SIZE), dtype=np.uint8)
+
+    frames[:, 0] = TIMED_SYNC
+    frames[:, 1] = (first_seq + np.arange(len(samples))) & 0xFF
+    frames[:, 2:4] = samples.astype('<u2').view(np.uint8).reshape(-1, 2)
+    frames[:, 4:8] = timestamps.view(np.uint8).reshape(-1, 4)
+    frames[:, 8] = frames[:, 1:8].astype(np.uint16).sum(axis=1) & 0xFF
+
+    return frames.tobytes()
+
+
+def decode_timed_frames(data):
+    """
+        Vectorized decoder of timed frames (see decode_frames)
+
+        :return:
+            seq: sequence counter of each valid frame
+            samples: 16-bit sample of each valid frame
+            timestamps: board timestamp (micros(), 32-bit) of each valid frame
+            consumed: number of bytes that were decoded
+    """
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    starts, consumed = _find_frames(buffer, TIMED_SYNC, TIMED_FRAME_SIZE)
+
+    fields = buffer[starts[:, None] + np.arange(1, TIMED_FRAME_SIZE - 1)]
+    seq = fields[:, 0]
+    samples = np.ascontiguousarray(fields[:, 1:3]).view('<u2').ravel()
+    timestamps = np.ascontiguousarray(fields[:, 3:7]).view('<u4').ravel()
+
+    return seq, samples, timestamps, consumed
+
+
+def encode_burst(samples, duration):
+    """
+        Burst block (bytes) of samples, as sent by pydaq/arduino_timed/arduino_timed.ino
+
+        :params:
+            samples: 16-bit samples (e.g. ADC readings)
+            duration: capture duration (from first to last sample), in microseconds
+    """
+
+    header = np.array([len(samples)], dtype='<u2').tobytes() + np.array([duration], dtype='<u4').tobytes()
+    payload = header + np.asarray(samples, dtype='<u2').tobytes()
+    check = int(np.frombuffer(payload, dtype=np.uint8).sum()) & 0xFF
+
+    return bytes([BURST_SYNC]) + payload + bytes([check])
+
+
+def burst_size(header):
+    """ Total size (bytes) of a burst block, from its header (first BURST_HEADER_SIZE bytes) """
+
+    if len(header) < BURST_HEADER_SIZE or header[0] != BURST_SYNC:
+        raise ValueError('Invalid burst header')
+
+    return BURST_HEADER_SIZE + 2 * int.from_bytes(header[1:3], 'little') + 1
+
+
+def decode_burst(data):
+    """
+        Decoder of a burst block (straight into a NumPy array)
+
+        :params:
+            data: burst block (bytes), as encoded by encode_burst
+
+        :return:
+            samples: 16-bit samples
+            duration: capture duration (from first to last sample), in microseconds
+    """
+
+    if len(data) != burst_size(data):
+        raise ValueError(f'Incomplete burst block ({len(data)} of {burst_size(data)} bytes)')
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if int(buffer[1:-1].sum()) & 0xFF != buffer[-1]:
+        raise ValueError('Burst block checksum does not match (corrupted data)')
+
+    duration = int(buffer[3:7].view('<u4')[0])
+    samples = buffer[BURST_HEADER_SIZE:-1].view('<u2').astype(np.uint16)
+
+    return samples, duration
+
+
+class Frame_decoder:
+    """
+        Stream decoder of binary frames. Bytes of incomplete frames are kept between calls and lost
+        frames (gaps in the sequence counter) are counted.
+
+        :example:
+            decoder = Frame_decoder()
+            samples = decoder.decode(ser.read(ser.in_waiting))
+    """
+
+    def __init__(self):
+
+        self._pending = b''
+        self._last_seq = None
+
+        # Number of decoded and lost frames
+        self.frames = 0
+        self.lost = 0
+
+    def decode(self, data):
+        """ Samples (NumPy array) of the complete frames in data (and in previously received bytes) """
+
+        data = self._pending + bytes(data)
+        seq, samples, consumed = decode_frames(data)
+        self._pending = data[consumed:]
+        self._count(seq)
+
+        return samples
+
+    def decode_block(self, data, timestamp):
+        """ Timestamps (all equal to timestamp, the host time when data were received) and samples
+            of the complete readings in data """
+
+        samples = self.decode(data)
+
+        return np.full(len(samples), timestamp), samples
+
+    def _count(self, seq):
+        """ Counting decoded and lost frames (sequence counter gaps, modulo 256) """
+
+        if len(seq):
+            seq = seq.astype(int)
+            previous = np.concatenate([[seq[0] - 1 if self._last_seq is None else self._last_seq], seq[:-1]])
+            self.lost += int(np.sum((seq - previous - 1) % 256))
+            self._last_seq = int(seq[-1])
+            self.frames += len(seq)
+
+
+class Timed_frame_decoder(Frame_decoder):
+    """
+        Stream decoder of timed frames. Board timestamps (micros(), which wraps around every ~71 minutes)
+        are unwrapped and converted to seconds since the first decoded frame.
+
+        :example:
+            decoder = Timed_frame_decoder()
+            timestamps, samples = decoder.decode_timed(ser.read(ser.in_waiting))
+    """
+
+    def __init__(self):
+
+        super().__init__()
+        self._first_time = None
+        self._last_time = None
+
+    def decode(self, data):
+        """ Samples (NumPy array) of the complete frames in data (and in previously received bytes) """
+
+        return self.decode_timed(data)[1]
+
+    def decode_block(self, data, timestamp):
+        """ Board timestamps (seconds) and samples of the complete frames in data (host timestamp is
+            not used) """
+
+        return self.decode_timed(data)
+
+    def decode_timed(self, data):
+        """ Board timestamps (seconds) and samples of the complete frames in data """
+
+        data = self._pending + bytes(data)
+        seq, samples, timestamps, consumed = decode_timed_frames(data)
+        self._pending = data[consumed:]
+        self._count(seq)
+
+        if len(timestamps) == 0:
+            return np.zeros(0), samples
+
+        # Unwrapping 32-bit timestamps (a timestamp smaller than the previous one means micros() wrapped)
+        timestamps = timestamps.astype(np.int64)
+        previous = timestamps[0] if self._last_time is None else self._last_time
+        steps = np.diff(np.concatenate([[previous], timestamps]))
+        timestamps = previous + np.cumsum(steps % (1 << 32))
+        if self._first_time is None:
+            self._first_time = timestamps[0]
+        self._last_time = int(timestamps[-1])
+
+        return (timestamps - self._first_time) / 1e6, samples
+
+
+class Line_decoder:
+    """
+        Stream decoder of the ASCII protocol (one reading per line, as printed by pydaq/arduino_code).
+        Bytes of incomplete lines are kept between calls.
+    """
+
+    def __init__(self):
+
+        self._pending = b''
+
+        # Number of decoded and lost (unreadable) readings
+        self.frames = 0
+        self.lost = 0
+
+    def decode(self, data):
+        """ Samples (NumPy array) of the complete lines in data (and in previously received bytes) """
+
+        lines = (self._pending + bytes(data)).split(b'\n')
+        self._pending = lines.pop()
+
+        samples = []
+        for line in lines:
+            try:
+                samples.append(int(line))
+            except ValueError:
+                if line.strip():
+                    self.lost += 1
+
+        self.frames += len(samples)
+
+        return np.array(samples, dtype=np.uint16)
+
+    def decode_block(self, data, timestamp):
+        """ Timestamps (all equal to timestamp, the host time when data were received) and samples
+            of the complete lines in data """
+
+        samples = self.decode(data)
+
+        return np.full(len(samples), timestamp), samples
+
+
+def new_decoder(protocol):
+    """ Stream decoder of protocol ('ascii', 'binary' or 'timed') """
+
+    decoders = {'ascii': Line_decoder,
+                'binary': Frame_decoder,
+                'timed': Timed_frame_decoder}
+
+    try:
+        return decoders[protocol]()
+    except KeyError:
+        raise ValueError(f"Unknown protocol: {protocol}. Use 'ascii', 'binary' or 'timed'")
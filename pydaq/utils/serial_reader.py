@@ -0,0 +1,131 @@
+import time
+import queue
+import threading
+import numpy as np
+from pydaq.utils.serial_protocol import new_decoder
+
+
+class Serial_reader:
+    """
+        Thread that continuously reads a serial port (e.g. an Arduino), so that no sample sent by the
+        board is lost between loop iterations.
+
+        Received bytes are drained (ser.read(ser.in_waiting)) and decoded (bytes of incomplete readings
+        are kept by the decoder until the next read). Complete readings are delivered, with host
+        timestamps (time.perf_counter, in seconds, taken when bytes were read) or, for the 'timed'
+        protocol, board timestamps (seconds since the first frame), to a bounded queue and to registered
+        callbacks. If the consumer does not keep up,
+        new samples are discarded and counted (overflows) instead of blocking the port.
+
+        :params:
+            ser: open serial.Serial port
+            protocol: 'ascii', 'binary' or 'timed' (see pydaq/utils/serial_protocol.py)
+            max_blocks: maximum number of blocks (one per read) waiting in the queue. If None, there is no
+                        queue and blocks are only passed to callbacks
+
+        :example:
+            reader = Serial_reader(ser, 'binary').start()
+            timestamps, samples = reader.read()
+            reader.stop()
+    """
+
+    def __init__(self, ser, protocol='ascii', max_blocks=4096):
+
+        self.ser = ser
+        self.protocol = protocol
+        self.decoder = new_decoder(protocol)
+
+        # Blocks (timestamps, samples) waiting to be read and callbacks called with every block
+        self._queue = None if max_blocks is None else queue.Queue(maxsize=max_blocks)
+        self._callbacks = []
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # Number of received samples, samples discarded because the queue was full and error raised by
+        # the reader thread
+        self.samples = 0
+        self.overflows = 0
+        self.error = None
+
+    def register_callback(self, function):
+        """ Method to call function(timestamps, samples) (from the reader thread) for every new block """
+
+        self._callbacks.append(function)
+
+    def start(self):
+        """ Method to start the reader thread """
+
+        # Short timeout, so that the thread can be stopped while waiting for data
+        self.ser.timeout = 0.05
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """ Method to stop the reader thread """
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self.error is not None:
+            raise self.error
+
+    def read(self, timeout=None):
+        """
+            Samples received since the last call and their host timestamps. Waits up to timeout seconds
+            (None: forever) for at least one sample, and returns empty arrays if there is none.
+        """
+
+        blocks = []
+        try:
+            blocks.append(self._queue.get(timeout=timeout))
+            while True:
+                blocks.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if not blocks:
+            return np.zeros(0), np.zeros(0, dtype=np.uint16)
+
+        timestamps, samples = zip(*blocks)
+
+        return np.concatenate(timestamps), np.concatenate(samples)
+
+    def _run(self):
+        """ Reader thread: drains the serial port until stop() is called """
+
+        try:
+            while not self._stop_event.is_set():
+
+                # Draining all available bytes (or waiting, up to ser.timeout, for the next one)
+                data = self.ser.read(max(1, self.ser.in_waiting))
+                timestamp = time.perf_counter()
+                if not data:
+                    continue
+
+                timestamps, samples = self.decoder.decode_block(data, timestamp)
+                if len(samples) == 0:
+                    continue
+
+                self.samples += len(samples)
+                block = (timestamps, samples)
+
+                for function in self._callbacks:
+                    function(*block)
+
+                if self._queue is None:
+                    continue
+                try:
+                    self._queue.put_nowait(block)
+                except queue.Full:
+                    self.overflows += len(samples)
+
+        except BaseException as e:
+            self.error = e
+            self._stop_event.set()
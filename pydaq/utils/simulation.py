@@ -0,0 +1,625 @@
+import os
+import re
+import time
+import select
+import threading
+import collections
+import numpy as np
+from pydaq.utils.lazy import lazy_import
+from pydaq.utils.serial_protocol import encode_frames, encode_timed_frames, encode_burst, baudrates
+
+errors = lazy_import('nidaqmx.errors')
+
+
+class Signal:
+    """
+        Simulated signal, used by simulated devices
+
+        :params:
+            kind: 'sine', 'square', 'ramp' (sawtooth) or 'constant'
+            amplitude: signal amplitude
+            frequency: signal frequency, in Hz
+            offset: constant added to the signal
+
+        :example:
+            signal = Signal('sine', amplitude=2.0, frequency=5.0)
+            signal(np.arange(100) * 0.001)
+    """
+
+    def __init__(self, kind='sine', amplitude=1.0, frequency=1.0, offset=0.0):
+
+        if kind not in ['sine', 'square', 'ramp', 'constant']:
+            raise ValueError(f"Unknown signal: {kind}. Use 'sine', 'square', 'ramp' or 'constant'")
+
+        self.kind = kind
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.offset = offset
+
+    def __call__(self, t):
+        """ Signal values at time instants t (seconds) """
+
+        phase = self.frequency * np.asarray(t, dtype=np.float64)
+
+        if self.kind == 'sine':
+            values = np.sin(2 * np.pi * phase)
+        elif self.kind == 'square':
+            values = np.where(phase % 1.0 < 0.5, 1.0, -1.0)
+        elif self.kind == 'ramp':
+            values = 2 * (phase % 1.0) - 1
+        else:
+            values = np.ones_like(phase)
+
+        return self.offset + self.amplitude * values
+
+
+def _expand_channels(physical_channel):
+    """ Physical channels of a nidaqmx channel string (e.g. "Dev1/ai0:2,Dev1/ai5") """
+
+    channels = []
+    for channel in physical_channel.split(','):
+        channel = channel.strip()
+        match = re.fullmatch(r'(.*?)(\d+):(\d+)', channel)
+        if match is None:
+            channels.append(channel)
+            continue
+        prefix, first, last = match.group(1), int(match.group(2)), int(match.group(3))
+        step = 1 if last >= first else -1
+        channels += [f'{prefix}{k}' for k in range(first, last + step, step)]
+
+    return channels
+
+
+class Simulated_nidaq:
+    """
+        Simulated NI-DAQmx back end, used instead of the NIDAQ driver (Get_data, Send_data and Step_response
+        use it when defined as their nidaq_backend). Tasks follow the board sample clock in real time:
+        hardware-timed reads wait until samples are "acquired" and hardware-timed outputs are generated
+        at the sample rate (output buffer underflows raise the same error as a board).
+
+        Analog inputs read signal (plus noise). With loopback=True, an analog input reads the last value
+        written (on demand) to the analog output with the same number on the same device (e.g. Dev1/ao0 ->
+        Dev1/ai0), as if they were wired together.
+
+        :params:
+            signal: Signal (or function of time, in seconds) read by analog inputs, or dict
+                    {physical channel: signal}
+            noise: standard deviation of Gaussian noise added to every reading, in volts
+            latency: delay of every task call (driver and USB latency), in seconds
+            loopback: if True, analog inputs read analog outputs
+            seed: random seed (noise)
+
+        :example:
+            g = Get_data(device='Dev1', channel='ai0:1', ts=0.001, session_duration=1.0, plot=False)
+            g.nidaq_backend = Simulated_nidaq(signal=Signal('sine', 2.0, 5.0), noise=0.01)
+            g.get_data_nidaq()
+    """
+
+    def __init__(self, signal=None, noise=0.0, latency=0.0, loopback=True, seed=None):
+
+        self.signal = signal if signal is not None else Signal()
+        self.noise = noise
+        self.latency = latency
+        self.loopback = loopback
+        self.rng = np.random.default_rng(seed)
+
+        # Last value written to each analog output (loopback)
+        self.outputs = {}
+
+    def Task(self):
+        """ New simulated task """
+
+        return Simulated_task(self)
+
+    def AnalogMultiChannelReader(self, in_stream):
+        """ Reader of blocks of samples (see nidaqmx.stream_readers) """
+
+        return Simulated_reader(in_stream)
+
+    def AnalogSingleChannelWriter(self, out_stream, auto_start=False):
+        """ Writer of blocks of samples (see nidaqmx.stream_writers) """
+
+        return Simulated_writer(out_stream, auto_start)
+
+    def values(self, channels, t):
+        """ Readings (channels x len(t)) of analog input channels at time instants t (seconds) """
+
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        values = np.zeros((len(channels), len(t)))
+
+        for i, channel in enumerate(channels):
+            output = channel.replace('/ai', '/ao')
+            if self.loopback and output in self.outputs:
+                values[i] = self.outputs[output]
+            else:
+                signal = self.signal.get(channel, 0.0) if isinstance(self.signal, dict) else self.signal
+                values[i] = signal(t) if callable(signal) else signal
+
+        if self.noise:
+            values += self.rng.normal(0.0, self.noise, values.shape)
+
+        return values
+
+    def _wait(self, seconds=0.0):
+        """ Method to wait for seconds plus the call latency """
+
+        seconds += self.latency
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class _Channels:
+    """ Channel collection of a simulated task (ai_channels, ao_channels) """
+
+    def __init__(self):
+
+        self.channel_names = []
+        self.limits = []
+
+    def add_ai_voltage_chan(self, physical_channel, terminal_config=None, min_val=-10.0, max_val=10.0, **kwargs):
+        """ Method to add analog input channels """
+
+        self._add(physical_channel, min_val, max_val)
+
+    def add_ao_voltage_chan(self, physical_channel, min_val=-10.0, max_val=10.0, **kwargs):
+        """ Method to add analog output channels """
+
+        self._add(physical_channel, min_val, max_val)
+
+    def _add(self, physical_channel, min_val, max_val):
+
+        for channel in _expand_channels(physical_channel):
+            self.channel_names.append(channel)
+            self.limits.append((float(min_val), float(max_val)))
+
+
+class _Timing:
+    """ Sample clock of a simulated task """
+
+    def __init__(self, task):
+        self._task = task
+
+    def cfg_samp_clk_timing(self, rate, sample_mode=None, samps_per_chan=1000, **kwargs):
+        """ Method to configure the sample clock (rate in Hz, 'FINITE' or 'CONTINUOUS' sample mode) """
+
+        self._task.rate = float(rate)
+        self._task.samps_per_chan = int(samps_per_chan)
+        self._task.continuous = getattr(sample_mode, 'name', sample_mode) == 'CONTINUOUS'
+
+
+class _Start_trigger:
+    """ Start trigger of a simulated task (simulated tasks start immediately) """
+
+    def __init__(self):
+        self.source = None
+
+    def cfg_dig_edge_start_trig(self, trigger_source, **kwargs):
+        self.source = trigger_source
+
+
+class _Triggers:
+
+    def __init__(self):
+        self.start_trigger = _Start_trigger()
+
+
+class _Stream:
+    """ Input/output stream of a simulated task (in_stream, out_stream) """
+
+    def __init__(self, task):
+
+        self.task = task
+        self.regen_mode = None
+        self.output_buf_size = None
+
+        # Samples (per channel) read from and written to the device buffer
+        self.read = 0
+        self.written = 0
+        self.data = np.zeros(0)
+
+    @property
+    def regenerate(self):
+        return getattr(self.regen_mode, 'name', self.regen_mode) == 'ALLOW_REGENERATION'
+
+    @property
+    def total_samp_per_chan_generated(self):
+        """ Samples generated since the task was started """
+
+        task = self.task
+        if task.start_time is None:
+            return 0
+
+        generated = int((time.perf_counter() - task.start_time) * task.rate)
+        if not self.regenerate:
+            generated = min(generated, self.written)
+        if not task.continuous:
+            generated = min(generated, task.samps_per_chan)
+
+        return generated
+
+
+class Simulated_task:
+    """ Simulated NI-DAQmx task (see Simulated_nidaq) """
+
+    def __init__(self, backend):
+
+        self.backend = backend
+        self.ai_channels = _Channels()
+        self.ao_channels = _Channels()
+        self.timing = _Timing(self)
+        self.triggers = _Triggers()
+        self.in_stream = _Stream(self)
+        self.out_stream = _Stream(self)
+
+        # Sample clock (None: on demand reads and writes) and start time of hardware-timed tasks
+        self.rate = None
+        self.samps_per_chan = None
+        self.continuous = False
+        self.start_time = None
+
+        # Time origin of on demand readings
+        self._created = time.perf_counter()
+
+    @property
+    def number_of_channels(self):
+        return len(self.ai_channels.channel_names) + len(self.ao_channels.channel_names)
+
+    def start(self):
+        """ Method to start the sample clock """
+
+        self.backend._wait()
+        self.start_time = time.perf_counter()
+        self.in_stream.read = 0
+
+    def stop(self):
+        """ Method to stop the sample clock """
+
+        self.start_time = None
+
+    def close(self):
+        self.stop()
+
+    def read(self):
+        """ On demand reading: one sample per analog input channel """
+
+        self.backend._wait()
+        values = self.backend.values(self.ai_channels.channel_names, time.perf_counter() - self._created)
+        values = [float(v) for v in self._clip(values, self.ai_channels)[:, 0]]
+
+        return values[0] if len(values) == 1 else values
+
+    def write(self, data):
+        """ On demand writing: one value per analog output channel """
+
+        self.backend._wait()
+        channels = self.ao_channels.channel_names
+        values = np.atleast_1d(np.asarray(data, dtype=np.float64))
+        for channel, value, (min_val, max_val) in zip(channels, values, self.ao_channels.limits):
+            if not min_val <= value <= max_val:
+                raise ValueError(f'{value} V is out of the range of {channel} ({min_val} to {max_val} V)')
+            self.backend.outputs[channel] = value
+
+        return len(values)
+
+    def _clip(self, values, channels):
+        """ Readings limited to the range of each channel """
+
+        limits = np.array(channels.limits).reshape(-1, 2)
+
+        return np.clip(values, limits[:, :1], limits[:, 1:])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Simulated_reader:
+    """ Simulated AnalogMultiChannelReader: blocks of samples, delivered at the sample rate """
+
+    def __init__(self, in_stream):
+        self._stream = in_stream
+
+    def read_many_sample(self, data, number_of_samples_per_channel, timeout=10.0):
+        """ Method to read samples into data (channels x samples), waiting until they are acquired """
+
+        stream, task = self._stream, self._stream.task
+        n = int(number_of_samples_per_channel)
+
+        # Waiting until the sample clock has acquired the requested samples
+        wait = task.start_time + (stream.read + n) / task.rate - time.perf_counter()
+        if wait > timeout:
+            task.backend._wait(timeout)
+            raise errors.DaqError('Some or all of the samples requested have not yet been acquired '
+                                  '(simulated device).', -200284)
+        task.backend._wait(max(0.0, wait))
+
+        t = (stream.read + np.arange(n)) / task.rate
+        values = task._clip(task.backend.values(task.ai_channels.channel_names, t), task.ai_channels)
+        data[:, :n] = values.reshape(len(data), n) if np.ndim(data) == 2 else values
+        stream.read += n
+
+        return n
+
+
+class Simulated_writer:
+    """ Simulated AnalogSingleChannelWriter: the output buffer is emptied at the sample rate """
+
+    def __init__(self, out_stream, auto_start=False):
+
+        self._stream = out_stream
+        self.auto_start = auto_start
+
+    def write_many_sample(self, data, timeout=10.0):
+        """ Method to write samples to the output buffer, waiting until there is space for them """
+
+        stream, task = self._stream, self._stream.task
+        data = np.asarray(data, dtype=np.float64)
+
+        if task.start_time is not None and not stream.regenerate:
+
+            # Board ran out of samples before this block was written
+            generated = int((time.perf_counter() - task.start_time) * task.rate)
+            if generated > stream.written and stream.written < task.samps_per_chan:
+                raise errors.DaqError('The generation has stopped to prevent the regeneration of old samples '
+                                      '(simulated device).', -200290)
+
+            # Waiting for space in the output buffer
+            size = stream.output_buf_size or task.samps_per_chan
+            space = size - (stream.written - stream.total_samp_per_chan_generated)
+            wait = (len(data) - space) / task.rate
+            if wait > timeout:
+                raise errors.DaqError('Write cannot be performed, because the number of samples requested is '
+                                      'larger than the space available in the buffer (simulated device).', -200292)
+            task.backend._wait(max(0.0, wait))
+        elif task.start_time is not None and len(data) > (stream.output_buf_size or len(stream.data)):
+            # Regeneration buffer holds the samples written before the start
+            raise errors.DaqError('Write cannot be performed, because the number of samples requested is '
+                                  'larger than the space available in the buffer (simulated device).', -200292)
+        else:
+            task.backend._wait()
+
+        stream.data = data
+        stream.written += len(data)
+
+        if self.auto_start and task.start_time is None:
+            task.start()
+
+        return len(data)
+
+
+class Virtual_arduino:
+    """
+        Virtual Arduino on a pseudo-terminal pair (Linux, macOS), that emulates the sketches loaded in the
+        board: pydaq/arduino_code ('ascii'), pydaq/arduino_binary ('binary') or pydaq/arduino_timed ('timed').
+        PYDAQ opens it as any serial port (port is the terminal device, e.g. /dev/pts/3), so the whole serial
+        path (pyserial, decoders, reader threads) is used.
+
+        Free-running sketches ('ascii' and 'binary') send readings at rate (limited by the baud rate, as the
+        board is). The 'timed' sketch samples at the period set by 'R<us>', stops on 'S' and uploads bursts on
+        'B<samples>,<prescaler>'. Commands '1'/'0' set the digital output.
+
+        :params:
+            protocol: 'ascii', 'binary' or 'timed'
+            signal: Signal (or function of time, in seconds) read by the ADC, in ADC counts (0 to 1023)
+            noise: standard deviation of Gaussian noise added to every reading, in ADC counts
+            latency: delay between sampling and sending each reading, in seconds
+            rate: readings per second of free-running sketches
+            loopback: if True, the digital output is wired to the analog input (adds 1023 counts when HIGH)
+            baudrate: emulated baud rate (default: baud rate of the protocol)
+            seed: random seed (noise)
+
+        :example:
+            with Virtual_arduino('binary', signal=Signal('sine', 500, 1.0, 512)) as arduino:
+                g = Get_data(com=arduino.port, protocol='binary', plot=False)
+                g.get_data_arduino()
+    """
+
+    def __init__(self, protocol='ascii', signal=None, noise=0.0, latency=0.0, rate=1000.0, loopback=False,
+                 baudrate=None, seed=None):
+
+        if protocol not in baudrates:
+            raise ValueError(f"Unknown protocol: {protocol}. Use 'ascii', 'binary' or 'timed'")
+
+        self.protocol = protocol
+        self.signal = signal if signal is not None else Signal('sine', 500.0, 1.0, 512.0)
+        self.noise = noise
+        self.latency = latency
+        self.rate = rate
+        self.loopback = loopback
+        self.baudrate = baudrate or baudrates[protocol]
+        self.rng = np.random.default_rng(seed)
+
+        self.port = None
+        self._master, self._slave = None, None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # Digital output, sample period of the 'timed' sketch (None: stopped) and bytes waiting to be sent
+        self.output = False
+        self.period = None
+        self._pending = collections.deque()
+
+        # Number of readings sent, bytes discarded because the host did not read them and error raised by
+        # the emulator thread
+        self.samples = 0
+        self.dropped = 0
+        self.error = None
+
+    def start(self):
+        """ Method to create the terminal pair and start the emulator thread """
+
+        import tty
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """ Method to stop the emulator and close the terminal pair """
+
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master, self._slave = None, None
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def adc(self, t):
+        """ ADC readings (counts) at time instants t (seconds) """
+
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        values = self.signal(t) if callable(self.signal) else np.full(len(t), float(self.signal))
+        if self.loopback and self.output:
+            values = values + 1023
+        if self.noise:
+            values = values + self.rng.normal(0.0, self.noise, len(t))
+
+        return np.clip(np.round(values), 0, 1023).astype(np.uint16)
+
+    def _run(self):
+        """ Emulator thread: answers commands and sends readings until stop() is called """
+
+        self._start_time = time.perf_counter()
+        self._sampled = 0  # Readings taken since sampling started
+        self._sampling_start = self._start_time
+        command = b''
+
+        try:
+            while not self._stop_event.is_set():
+
+                # Waiting for commands (or for the next reading)
+                readable, _, _ = select.select([self._master], [], [], self._next_event())
+                if readable:
+                    try:
+                        received = os.read(self._master, 4096)
+                    except (BlockingIOError, OSError):
+                        received = b''
+                    for byte in received:
+                        command = self._command(command, bytes([byte]))
+
+                self._sample()
+                self._send()
+
+        except BaseException as e:
+            self.error = e
+
+    def _command(self, command, byte):
+        """ Method to process one received byte (as the sketches do). Returns the command being received """
+
+        if command:
+            if byte != b'\n':
+                return command + byte
+            if command[:1] == b'R' and self.protocol == 'timed':
+                self.period = int(command[1:]) / 1e6
+                self._sampling_start, self._sampled = time.perf_counter(), 0
+            elif command[:1] == b'B' and self.protocol == 'timed':
+                count, prescaler = (int(v) for v in command[1:].split(b','))
+                self._burst(count, prescaler)
+            return b''
+
+        if byte == b'1':
+            self.output = True
+        elif byte == b'0':
+            self.output = False
+        elif byte == b'S' and self.protocol == 'timed':
+            self.period = None
+        elif byte in (b'R', b'B') and self.protocol == 'timed':
+            return byte
+
+        return b''
+
+    def _reading_period(self):
+        """ Period between readings (None if not sampling) """
+
+        if self.protocol == 'timed':
+            return self.period
+
+        # Free-running sketches are limited by the serial link (10 bits per byte)
+        size = {'ascii': 6, 'binary': 5}[self.protocol]
+
+        return max(1.0 / self.rate, 10.0 * size / self.baudrate)
+
+    def _next_event(self):
+        """ Time until the next reading or pending transmission, in seconds """
+
+        now = time.perf_counter()
+        events = [0.05]
+        period = self._reading_period()
+        if period is not None:
+            events.append(self._sampling_start + (self._sampled + 1) * period - now)
+        if self._pending:
+            events.append(self._pending[0][0] - now)
+
+        return max(0.0, min(events))
+
+    def _sample(self):
+        """ Method to take the readings that are due and queue them (sent after latency) """
+
+        period = self._reading_period()
+        if period is None:
+            return
+
+        now = time.perf_counter()
+        due = int((now - self._sampling_start) / period)
+        if due <= self._sampled:
+            return
+
+        k = np.arange(self._sampled, due)
+        t = self._sampling_start + k * period
+        samples = self.adc(t - self._start_time)
+
+        if self.protocol == 'ascii':
+            data = b''.join(b'%d\r\n' % sample for sample in samples)
+        elif self.protocol == 'binary':
+            data = encode_frames(samples, first_seq=self._sampled)
+        else:
+            data = encode_timed_frames(samples, np.round((t - self._start_time) * 1e6), first_seq=self._sampled)
+
+        self._sampled = due
+        self.samples += len(samples)
+        self._pending.append((now + self.latency, data))
+
+    def _burst(self, count, prescaler):
+        """ Method to capture a burst (ADC conversion: 13 ADC clocks of 16 MHz / prescaler) """
+
+        self.period = None
+        count = min(count, 500)
+        conversion = 13 * (prescaler if prescaler >= 2 else 128) / 16e6
+        t = time.perf_counter() - self._start_time + np.arange(count) * conversion
+        duration = int(round((count - 1) * conversion * 1e6)) if count > 1 else 0
+
+        self.samples += count
+        self._pending.append((time.perf_counter() + count * conversion + self.latency,
+                              encode_burst(self.adc(t), duration)))
+
+    def _send(self):
+        """ Method to send queued bytes whose latency has elapsed """
+
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= now:
+            _, data = self._pending.popleft()
+            try:
+                written = os.write(self._master, data)
+            except BlockingIOError:
+                written = 0
+            # Host is not reading: the rest is discarded (as a full serial buffer does)
+            self.dropped += len(data) - written
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import queue
+import threading
+import datetime
+import numpy as np
+
+
+class Data_writer:
+    """
+        Base class of writers that stream session data to disk during acquisition.
+
+        Samples of each named stream (e.g. 'time', 'data') are grouped into chunks, which are written
+        by a background thread, so that disk I/O does not compete with sampling and a crash only loses
+        the last (not yet written) chunk. Subclasses define the file format implementing _write_chunk
+        and _close_streams.
+
+        :params:
+            path: folder where files will be saved
+            chunk_size: number of samples per chunk
+            flush_interval: maximum time (in seconds) a sample waits before being queued to disk
+            metadata: dict with session information (device, channel, ts, ...)
+
+        :example:
+            writer = Raw_writer(path)
+            writer.open()
+            writer.write('data', 1.5)
+            writer.close()
+    """
+
+    def __init__(self, path, chunk_size=1024, flush_interval=1.0, metadata=None):
+
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.metadata = dict(metadata or {})
+
+        # Samples not yet queued, per stream, and chunks waiting to be written
+        self._pending = {}
+        self._last_flush = {}
+        self._queue = queue.Queue()
+        self._thread = None
+
+        # Number of samples written per stream and error raised by the writer thread
+        self.samples = {}
+        self.error = None
+
+    def open(self):
+        """ Method to start the writer thread """
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def write(self, name, sample):
+        """ Method to append one sample (a value, or one value per channel) to stream name """
+
+        pending = self._pending.setdefault(name, [])
+        pending.append(sample)
+
+        now = time.monotonic()
+        if len(pending) >= self.chunk_size or now - self._last_flush.get(name, now) >= self.flush_interval:
+            self._flush(name)
+        self._last_flush.setdefault(name, now)
+
+    def write_block(self, name, block):
+        """ Method to append a block of samples to stream name (channels x samples, or samples) """
+
+        self._flush(name)
+        self._queue.put((name, np.ascontiguousarray(np.transpose(block), dtype=np.float64)))
+
+    def close(self):
+        """ Method to write pending samples, stop the writer thread and close files """
+
+        for name in list(self._pending):
+            self._flush(name)
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        if self.error is not None:
+            raise self.error
+
+    def _flush(self, name):
+        """ Queue pending samples of stream name as a chunk (samples x channels) """
+
+        pending = self._pending.get(name)
+        if pending:
+            self._queue.put((name, np.asarray(pending, dtype=np.float64)))
+            self._pending[name] = []
+        self._last_flush[name] = time.monotonic()
+
+    def _run(self):
+        """ Writer thread: writes queued chunks until close() is called """
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                name, chunk = item
+                self._write_chunk(name, chunk)
+                self.samples[name] = self.samples.get(name, 0) + len(chunk)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._close_streams()
+
+    def _write_chunk(self, name, chunk):
+        raise NotImplementedError
+
+    def _close_streams(self):
+        raise NotImplementedError
+
+
+class Dat_writer(Data_writer):
+    """
+        Legacy text format: one file per stream (name.dat), one sample per line and, for multi-channel
+        streams, one column per channel.
+    """
+
+    def __init__(self, path, chunk_size=1024, flush_interval=1.0, metadata=None):
+
+        super().__init__(path, chunk_size, flush_interval, metadata)
+        self._files = {}
+
+    def _write_chunk(self, name, chunk):
+
+        if name not in self._files:
+            self._files[name] = open(os.path.join(self.path, name + '.dat'), 'w')
+
+        if chunk.ndim == 1:
+            lines = map(str, chunk.tolist())
+        else:
+            lines = (' '.join(map(str, row)) for row in chunk.tolist())
+
+        self._files[name].write('\n'.join(lines) + '\n')
+        self._files[name].flush()
+
+    def _close_streams(self):
+
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+
+
+class Raw_writer(Data_writer):
+    """
+        Raw binary format: one file per stream (name.bin) with little-endian float64 samples
+        (samples x channels, C order) and a JSON sidecar header (name.json) with dtype, shape and
+        session metadata. Raw files can be read with np.fromfile or np.memmap.
+    """
+
+    def __init__(self, path, chunk_size=1024, flush_interval=1.0, metadata=None):
+
+        super().__init__(path, chunk_size, flush_interval, metadata)
+        self._files = {}
+
+    def _header(self, name, chunk, samples):
+        """ Sidecar header of stream name """
+
+        return {'dtype': '<f8',
+                'channels': None if chunk.ndim == 1 else chunk.shape[1],
+                'samples': samples,
+                'layout': 'samples x channels',
+                'metadata': self.metadata}
+
+    def _write_header(self, name):
+
+        file, chunk = self._files[name]
+        with open(os.path.join(self.path, name + '.json'), 'w') as header:
+            json.dump(self._header(name, chunk, self.samples.get(name)), header, indent=4, default=str)
+
+    def _write_chunk(self, name, chunk):
+
+        if name not in self._files:
+            self._files[name] = (open(os.path.join(self.path, name + '.bin'), 'wb'), chunk[:0])
+            self._write_header(name)  # Number of samples is unknown until the end
+
+        self._files[name][0].write(chunk.astype('<f8').tobytes())
+        self._files[name][0].flush()
+
+    def _close_streams(self):
+
+        for name, (file, _) in self._files.items():
+            file.close()
+            self._write_header(name)
+        self._files = {}
+
+
+class Npy_writer(Data_writer):
+    """
+        NumPy format: one file per stream (name.npy, samples x channels). Chunks are appended to
+        the file and the header (shape) is rewritten at the end. The header has a fixed size,
+        so the file is always a valid .npy file with the shape of the last update.
+    """
+
+    # Size of .npy header (magic string, version, header length and header)
+    header_size = 128
+
+    def __init__(self, path, chunk_size=1024, flush_interval=1.0, metadata=None):
+
+        super().__init__(path, chunk_size, flush_interval, metadata)
+        self._files = {}
+
+    def _header(self, shape):
+        """ .npy (version 1.0) header with fixed size """
+
+        header = repr({'descr': '<f8', 'fortran_order': False, 'shape': tuple(shape)})
+        header = header.ljust(self.header_size - 10 - 1) + '\n'
+
+        return b'\x93NUMPY\x01\x00' + np.uint16(len(header)).astype('<u2').tobytes() + header.encode('latin1')
+
+    def _update_header(self, name):
+
+        file, shape = self._files[name]
+        position = file.tell()
+        file.seek(0)
+        file.write(self._header(shape))
+        file.seek(position)
+
+    def _write_chunk(self, name, chunk):
+
+        if name not in self._files:
+            file = open(os.path.join(self.path, name + '.npy'), 'wb')
+            self._files[name] = (file, [0] + list(chunk.shape[1:]))
+            file.write(self._header(self._files[name][1]))
+
+        file, shape = self._files[name]
+        file.write(chunk.astype('<f8').tobytes())
+        shape[0] += len(chunk)
+        self._update_header(name)
+        file.flush()
+
+    def _close_streams(self):
+
+        for file, _ in self._files.values():
+            file.close()
+        self._files = {}
+
+
+class Hdf5_writer(Data_writer):
+    """
+        HDF5 format (requires h5py): one file per session (session_<start time>.h5), so runs saved in
+        the same folder are not overwritten. Each stream is an extendable, chunked and compressed
+        dataset (multi-channel streams are groups with one dataset per channel: ch0, ch1, ...), and
+        session metadata are saved as file attributes. Data are appended while the session runs and
+        can be read partially by slicing, e.g. h5py.File(filename)['data'][1000:2000].
+
+        :params:
+            compression: h5py compression filter ('gzip', 'lzf' or None)
+    """
+
+    def __init__(self, path, chunk_size=1024, flush_interval=1.0, metadata=None, compression='gzip'):
+
+        super().__init__(path, chunk_size, flush_interval, metadata)
+
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("h5py is required to save data in HDF5 format. Install it using: pip install h5py")
+
+        self._h5py = h5py
+        self.compression = compression
+        self._file = None
+
+        # One file per session
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.filename = os.path.join(path, f'session_{stamp}.h5')
+        k = 1
+        while os.path.exists(self.filename):
+            self.filename = os.path.join(path, f'session_{stamp}_{k}.h5')
+            k += 1
+
+    def _write_chunk(self, name, chunk):
+
+        if self._file is None:
+            self._file = self._h5py.File(self.filename, 'w')
+            for key, value in self.metadata.items():
+                self._file.attrs[key] = value if isinstance(value, (int, float)) else str(value)
+
+        if chunk.ndim == 1:
+            columns = {name: chunk}
+        else:
+            columns = {f'{name}/ch{c}': column for c, column in enumerate(chunk.T)}
+
+        for dataset_name, column in columns.items():
+            if dataset_name not in self._file:
+                self._file.create_dataset(dataset_name, shape=(0,), maxshape=(None,), dtype='<f8',
+                                          chunks=(self.chunk_size,), compression=self.compression)
+            dataset = self._file[dataset_name]
+            dataset.resize((dataset.shape[0] + len(column),))
+            dataset[-len(column):] = column
+
+        self._file.flush()
+
+    def _close_streams(self):
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Available writers
+writers = {'dat': Dat_writer,
+           'raw': Raw_writer,
+           'npy': Npy_writer,
+           'hdf5': Hdf5_writer}
+
+
+def new_writer(save_format, path, **kwargs):
+    """
+        Writer for save_format ('dat', 'raw', 'npy' or 'hdf5'), saving data in path
+
+        :example:
+            writer = new_writer('npy', path, chunk_size=4096)
+    """
+
+    try:
+        writer = writers[save_format]
+    except KeyError:
+        raise ValueError(f"Unknown save format: {save_format}. Use one of {list(writers)}")
+
+    return writer(path, **kwargs)
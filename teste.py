@@ -1,9 +1,9 @@
 import sys
-import serial.tools.list_ports
 import matplotlib.pyplot as plt
 import matplotlib.animation as aplt
 import numpy as np
 import serial
+from pydaq.utils.device_registry import registry
 from scipy import signal, fftpack
 from PySide6 import QtWidgets
 from ui.ui_main import Ui_DigitalFilters
@@ -45,10 +45,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_DigitalFilters):
     def locate_arduino(self):  # function that locate arduino 
         current_selection = self.comboBox.currentText()
         self.comboBox.clear()
-        ports = serial.tools.list_ports.comports()
+        ports = registry.com_ports()  # Cached (no hardware scan on every timer tick)
 
-        for port in ports:
-            self.comboBox.addItem(f"{port.device} - {port.description}")
+        for _, description, device in ports:
+            self.comboBox.addItem(f"{device} - {description}")
         
         if current_selection:
             index = self.comboBox.findText(current_selection)